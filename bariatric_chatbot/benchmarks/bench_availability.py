@@ -0,0 +1,96 @@
+"""
+Availability of every doctor over a booking horizon: per-day queries vs. one grid.
+
+The per-day path is what generate_appointment_slots used to do, called for
+each doctor and day: one query per doctor-day, then every slot checked
+against every appointment for an exact start-time match. The grid path is
+AvailabilityEngine.load() for all doctors and days at once, which also
+blocks every slot a longer appointment overlaps. Doctors and appointments
+(8 per doctor-day, mixed durations) are inserted for the run and rolled
+back afterwards.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_availability
+    DOCTORS=50 DAYS=60 python -m benchmarks.bench_availability
+"""
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event, insert
+
+import server
+from models import db, User, Appointment
+from utils.availability import AvailabilityEngine
+
+DOCTORS = int(os.getenv('DOCTORS', 50))
+DAYS = int(os.getenv('DAYS', 60))
+PER_DAY = 8
+START = date(2030, 1, 7)
+
+def per_day(doctor_id, day):
+    start_time = datetime.combine(day, datetime.min.time()).replace(hour=9)
+    end_time = start_time.replace(hour=17)
+    existing = Appointment.query.filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.scheduled_time >= start_time,
+        Appointment.scheduled_time <= end_time
+    ).all()
+    slots = []
+    current = start_time
+    while current <= end_time:
+        slots.append({'time': current, 'available': all(a.scheduled_time != current for a in existing)})
+        current += timedelta(minutes=30)
+    return slots
+
+def seed():
+    users = [{'username': f'bench_doctor_{i}', 'email': f'bench_doctor_{i}@example.com'} for i in range(DOCTORS)]
+    db.session.execute(insert(User), users)
+    ids = [user.id for user in User.query.filter(User.username.like('bench_doctor_%')).order_by(User.id)]
+    rng = random.Random(42)
+    rows = []
+    for doctor_id in ids:
+        for offset in range(DAYS):
+            opens = datetime.combine(START + timedelta(days=offset), datetime.min.time()).replace(hour=9)
+            for slot in rng.sample(range(17), PER_DAY):
+                rows.append({'user_id': doctor_id, 'doctor_id': doctor_id, 'appointment_type': 'followup',
+                             'status': rng.choice(('scheduled', 'scheduled', 'confirmed', 'cancelled')),
+                             'scheduled_time': opens + timedelta(minutes=30 * slot),
+                             'duration_minutes': rng.choice((30, 30, 45, 60))})
+    db.session.execute(insert(Appointment), rows)
+    return ids, len(rows)
+
+def timed(label, run, queries):
+    del queries[:]
+    started = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - started
+    print(f'{label:9s} {elapsed * 1000:9.1f} ms  {len(queries):6d} queries')
+    return result
+
+def main():
+    with server.app.app_context():
+        engine = AvailabilityEngine.from_config(server.app.config)
+        queries = []
+        listener = lambda *args: queries.append(1)
+        try:
+            ids, count = seed()
+            db.session.expire_all()
+            print(f'{len(ids)} doctors x {DAYS} days, {count} appointments')
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            days = [START + timedelta(days=offset) for offset in range(DAYS)]
+            legacy = timed('per day', lambda: {(d, day): per_day(d, day) for d in ids for day in days}, queries)
+            grid = timed('grid', lambda: engine.load(db.session, ids, START, DAYS), queries)
+            timed('grid json', lambda: engine.load(db.session, ids, START, DAYS).to_json(), queries)
+
+            # The grid frees cancelled slots and blocks overlapped ones, so it may only differ there
+            free_legacy = sum(slot['available'] for slots in legacy.values() for slot in slots)
+            free_grid = sum(len(grid.free_slots(d, day)) for d in ids for day in days)
+            print(f'free slots: per day {free_legacy}, grid {free_grid} (durations and cancellations counted)')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            db.session.rollback()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Throughput of /chat (one request per message) vs. /chat/batch.
+
+Logs in as the default admin so chat history is persisted. Note that this
+writes ChatHistory rows to the application's configured database.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_chat_batch
+"""
+import time
+
+from benchmarks.bench_intent_matcher import CORPUS
+from server import app
+
+def main(total=600, batch_size=100):
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    messages = (CORPUS * (total // len(CORPUS) + 1))[:total]
+
+    start = time.perf_counter()
+    for message in messages:
+        client.post('/chat', json={'message': message})
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for offset in range(0, total, batch_size):
+        client.post('/chat/batch', json={'messages': messages[offset:offset + batch_size]})
+    batched = time.perf_counter() - start
+
+    print(f'{total} messages')
+    print(f'/chat:                     {total / single:10.0f} messages/s')
+    print(f'/chat/batch ({batch_size} per call): {total / batched:10.0f} messages/s')
+
+if __name__ == '__main__':
+    main()
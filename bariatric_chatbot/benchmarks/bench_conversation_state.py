@@ -0,0 +1,66 @@
+"""
+Memory per 10k active conversations and get/put cost for each state backend.
+
+States carry realistic entities (procedure and phase keys shared with the
+knowledge snapshot, as the chatbot stores them). The SQLite backend writes
+to a temporary file.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_conversation_state
+"""
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from utils.conversation_state import ConversationState, MemoryStateBackend, SqliteStateBackend
+
+INTENTS = ('surgery_info', 'cost_info', 'requirements_info', 'diet_info', 'risks_info')
+SURGERIES = (('gastric_bypass',), ('sleeve_gastrectomy',), ('gastric_bypass', 'sleeve_gastrectomy'), ())
+PHASES = (('pre_op',), ('post_op_phase1',), ())
+TOPICS = ('allowed_foods', 'restricted_foods', None)
+
+def make_state(rng):
+    return ConversationState(rng.choice(INTENTS), rng.choice(SURGERIES), rng.choice(PHASES),
+                             rng.choice(TOPICS), turns=rng.randint(1, 20))
+
+def fill(backend, count, rng):
+    keys = [f'session:{os.urandom(16).hex()}' for _ in range(count)]
+    start = time.perf_counter()
+    for key in keys:
+        backend.put(key, make_state(rng))
+    put_us = (time.perf_counter() - start) / count * 1e6
+
+    start = time.perf_counter()
+    for key in keys:
+        backend.get(key)
+    get_us = (time.perf_counter() - start) / count * 1e6
+    return put_us, get_us
+
+def main(count=10000):
+    rng = random.Random(42)
+
+    tracemalloc.start()
+    backend = MemoryStateBackend(max_size=count, ttl=1800)
+    before = tracemalloc.get_traced_memory()[0]
+    put_us, get_us = fill(backend, count, rng)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f'memory backend, {count} conversations')
+    print(f'  memory:  {used / 1024:.0f} KiB ({used / count:.0f} bytes per conversation, incl. key)')
+    print(f'  put:     {put_us:.2f} us')
+    print(f'  get:     {get_us:.2f} us')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'conversation_state.db')
+        backend = SqliteStateBackend(path, max_size=count, ttl=1800)
+        put_us, get_us = fill(backend, count, rng)
+        size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+        print(f'sqlite backend, {count} conversations')
+        print(f'  on disk: {size / 1024:.0f} KiB ({size / count:.0f} bytes per conversation, incl. WAL)')
+        print(f'  put:     {put_us:.2f} us')
+        print(f'  get:     {get_us:.2f} us')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Rendering APPOINTMENTS appointment reminder emails: per call vs. batched.
+
+Runs on a scratch SQLite database with APPOINTMENTS appointments of
+PATIENTS patients and DOCTORS doctors, inside a request context as the
+sending code used to run.
+
+  per call  what send_appointment_reminder() used to do per appointment:
+            load it, lazy-load its patient and doctor, render_template()
+            the HTML body and build the text body with an f-string
+  batch     EmailRenderer.appointment_emails() over BATCH appointments at
+            a time, loaded with their patients and doctors in one query,
+            from templates compiled once
+
+Reports the time per message, split into loading and rendering, and the
+queries per message.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_email_render
+    APPOINTMENTS=20000 BATCH=1000 python -m benchmarks.bench_email_render
+"""
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import render_template
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.orm import Session, joinedload
+
+import server
+from models import db, User, Appointment
+from utils.email_templates import email_renderer
+
+APPOINTMENTS = int(os.getenv('APPOINTMENTS', 5000))
+PATIENTS = int(os.getenv('PATIENTS', 4000))
+DOCTORS = int(os.getenv('DOCTORS', 20))
+BATCH = int(os.getenv('BATCH', 500))
+START = datetime(2030, 1, 7, 8, 0)
+
+def seed(session):
+    rng = random.Random(5)
+    session.execute(insert(User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'first_name': f'First{i}',
+         'last_name': f'Last{i}', 'created_at': START}
+        for i in range(PATIENTS + DOCTORS)])
+    session.execute(insert(Appointment), [
+        {'user_id': DOCTORS + 1 + rng.randrange(PATIENTS), 'doctor_id': 1 + rng.randrange(DOCTORS),
+         'appointment_type': rng.choice(('consultation', 'preop', 'followup')), 'status': 'scheduled',
+         'scheduled_time': START + timedelta(minutes=30 * i), 'duration_minutes': 30,
+         'created_at': START, 'updated_at': START}
+        for i in range(APPOINTMENTS)])
+    session.commit()
+
+def per_call(session, appointment_ids):
+    loading = rendering = 0.0
+    for appointment_id in appointment_ids:
+        # Each reminder was sent from its own request, with a fresh identity map
+        session.expunge_all()
+        started = time.perf_counter()
+        appointment = session.get(Appointment, appointment_id)
+        user, doctor = appointment.user, appointment.doctor
+        loaded = time.perf_counter()
+        text_body = f'''Reminder: You have an appointment tomorrow at {appointment.scheduled_time.strftime('%I:%M %p')}
+
+Details:
+Doctor: Dr. {doctor.first_name} {doctor.last_name}
+Type: {appointment.appointment_type}
+
+Please arrive 15 minutes before your scheduled time.
+'''
+        html_body = render_template('email/appointment_reminder.html', appointment=appointment)
+        rendering += time.perf_counter() - loaded
+        loading += loaded - started
+    return loading, rendering
+
+def batched(session, appointment_ids):
+    loading = rendering = 0.0
+    for offset in range(0, len(appointment_ids), BATCH):
+        started = time.perf_counter()
+        appointments = session.scalars(select(Appointment).options(
+            joinedload(Appointment.user), joinedload(Appointment.doctor)
+        ).where(Appointment.id.in_(appointment_ids[offset:offset + BATCH]))).unique().all()
+        loaded = time.perf_counter()
+        emails = email_renderer.appointment_emails('appointment_reminder', appointments)
+        assert len(emails) == len(appointments)
+        rendering += time.perf_counter() - loaded
+        loading += loaded - started
+    return loading, rendering
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f'sqlite:///{directory}/emails.db')
+        db.metadata.create_all(engine)
+        queries = [0]
+        event.listen(engine, 'before_cursor_execute', lambda *args: queries.__setitem__(0, queries[0] + 1))
+        with Session(engine) as session:
+            seed(session)
+        appointment_ids = list(range(1, APPOINTMENTS + 1))
+        print(f'{APPOINTMENTS} reminders, {PATIENTS} patients, {DOCTORS} doctors, '
+              f'templates auto-reload: {server.app.jinja_env.auto_reload}')
+
+        with server.app.test_request_context():
+            # Both start with compiled templates; neither pays the first compile
+            server.app.jinja_env.get_template('email/appointment_reminder.html')
+            email_renderer.templates('appointment_reminder')
+            for name, run in (('per call', per_call), ('batch', batched)):
+                with Session(engine) as session:
+                    queries[0] = 0
+                    loading, rendering = run(session, appointment_ids)
+                total = loading + rendering
+                print(f'{name:9s} {total / APPOINTMENTS * 1e6:7.0f} us/message  (load {loading / APPOINTMENTS * 1e6:5.0f}, '
+                      f'render {rendering / APPOINTMENTS * 1e6:5.0f})  {queries[0] / APPOINTMENTS:6.3f} queries/message  '
+                      f'{total:6.2f} s total')
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Latency and accuracy of the TF-IDF intent classifier vs. the keyword rules.
+
+Every fourth example of each intent in config/intent_corpus.json is held out
+for evaluation; the classifier is trained on the rest.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_intent_classifier
+"""
+import json
+import timeit
+
+from utils.chatbot_logic import INTENT_KEYWORDS, IntentMatcher
+from utils.intent_classifier import IntentClassifier
+
+CORPUS_PATH = 'config/intent_corpus.json'
+THRESHOLD = 0.6
+
+def split_corpus(path):
+    with open(path, 'r') as f:
+        corpus = json.load(f)
+
+    train, test = [], []
+    for intent, messages in corpus.items():
+        for index, message in enumerate(messages):
+            (test if index % 4 == 0 else train).append((message, intent))
+    return train, test
+
+def accuracy(predict, examples):
+    correct = sum(1 for message, intent in examples if predict(message.lower().strip()) == intent)
+    return correct / len(examples)
+
+def per_message(func, count, repeat=5, number=200):
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / (number * count)
+
+def main():
+    train, test = split_corpus(CORPUS_PATH)
+    matcher = IntentMatcher(INTENT_KEYWORDS)
+    classifier = IntentClassifier.train(train)
+
+    def rules(message):
+        return matcher.match(message) or 'unknown'
+
+    def model(message):
+        return classifier.classify(message)[0]
+
+    def model_with_fallback(message):
+        intent, probability = classifier.classify(message)
+        if intent != 'unknown' and probability >= THRESHOLD:
+            return intent
+        return rules(message)
+
+    print(f'{len(train)} training / {len(test)} held-out examples\n')
+    print('Accuracy on held-out examples')
+    print(f'  keyword rules:              {accuracy(rules, test):6.1%}')
+    print(f'  classifier:                 {accuracy(model, test):6.1%}')
+    print(f'  classifier + rule fallback: {accuracy(model_with_fallback, test):6.1%}')
+
+    messages = [message.lower() for message, _ in test]
+    print('\nLatency')
+    rules_time = per_message(lambda: [matcher.match(m) for m in messages], len(messages))
+    print(f'  keyword rules:              {rules_time * 1e6:8.1f} us/message')
+    single_time = per_message(lambda: [classifier.classify(m) for m in messages], len(messages), number=20)
+    print(f'  classifier, one at a time:  {single_time * 1e6:8.1f} us/message')
+    for size in (32, 256):
+        batch = (messages * (size // len(messages) + 1))[:size]
+        batch_time = per_message(lambda: classifier.classify_batch(batch), size, number=20)
+        print(f'  classifier, batch of {size:<4}  {batch_time * 1e6:8.1f} us/message')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Micro-benchmark: compiled intent matcher vs. the original keyword cascade.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_intent_matcher
+"""
+import timeit
+
+from utils.chatbot_logic import INTENT_KEYWORDS, IntentMatcher
+
+# Realistic patient messages, already lowercased as process_message does
+CORPUS = [
+    'hello',
+    'hi, is this the right place to ask questions?',
+    'good morning, i had my sleeve done last month',
+    'what kinds of weight loss surgery do you offer?',
+    'tell me about gastric bypass',
+    'is the sleeve better than the bypass for someone with reflux',
+    'how much does the operation cost with my insurance plan',
+    'can i afford this if i pay in installments',
+    'do i qualify with a bmi of 37 and type 2 diabetes',
+    'what are the eligibility requirements for the procedure',
+    'what can i eat in the first week after the operation',
+    'is there a special diet before the operation',
+    'how many meals per day should i have after recovery',
+    'i would like to book a consultation with dr. patel next week',
+    'can we schedule a follow-up visit',
+    'what are the risks and complications',
+    'is it safe to have this done at 60',
+    'what side effects should i watch out for',
+    'thanks, that answers my question',
+    'my wife wants to know what to expect',
+    'where is the clinic located and is there parking',
+    'this is my third time asking, nobody called me back',
+    'i have been struggling with my weight for years and nothing works',
+    'can i still drink coffee after my operation or is that a problem',
+    'what is the recovery time for the sleeve gastrectomy compared to the bypass',
+    'how long will i be in the hospital',
+    'please call me back at the number on file',
+    'which vitamins do i need to take for the rest of my life',
+    'is it normal to feel tired two weeks after surgery',
+    'i am worried about loose skin after losing so much weight',
+]
+
+LEGACY_KEYWORDS = [
+    ('greeting', ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening', 'start']),
+    ('surgery_info', ['surgery', 'surgeries', 'procedure', 'bypass', 'sleeve', 'types', 'options']),
+    ('cost_info', ['cost', 'price', 'expensive', 'payment', 'insurance', 'afford']),
+    ('requirements_info', ['requirement', 'qualify', 'eligible', 'eligibility', 'qualify', 'bmi']),
+    ('diet_info', ['diet', 'eat', 'food', 'nutrition', 'meal', 'eating']),
+    ('appointment_info', ['appointment', 'schedule', 'book', 'visit', 'consult', 'meet']),
+    ('risks_info', ['risk', 'complication', 'danger', 'safe', 'side effect']),
+]
+
+def legacy_match(message):
+    """The original cascade: one substring scan per keyword, intent by intent"""
+    for intent, keywords in LEGACY_KEYWORDS:
+        # The original _is_* methods rebuilt their keyword list on every call
+        keywords = list(keywords)
+        if any(keyword in message for keyword in keywords):
+            return intent
+    return None
+
+def main(repeat=5, number=2000):
+    matcher = IntentMatcher(INTENT_KEYWORDS)
+
+    def run_legacy():
+        for message in CORPUS:
+            legacy_match(message)
+
+    def run_compiled():
+        for message in CORPUS:
+            matcher.match(message)
+
+    unknown = [message for message in CORPUS if matcher.match(message) is None]
+
+    def run_legacy_unknown():
+        for message in unknown:
+            legacy_match(message)
+
+    def run_compiled_unknown():
+        for message in unknown:
+            matcher.match(message)
+
+    def per_message(func, corpus):
+        return min(timeit.repeat(func, repeat=repeat, number=number)) / (number * len(corpus))
+
+    print(f'{len(CORPUS)} messages, best of {repeat} x {number} passes')
+    for label, legacy_func, compiled_func, corpus in (
+        ('all messages', run_legacy, run_compiled, CORPUS),
+        ('unknown intent', run_legacy_unknown, run_compiled_unknown, unknown),
+    ):
+        legacy = per_message(legacy_func, corpus)
+        compiled = per_message(compiled_func, corpus)
+        print(f'\n{label} ({len(corpus)} messages)')
+        print(f'  legacy cascade:   {legacy * 1e6:8.2f} us/message')
+        print(f'  compiled matcher: {compiled * 1e6:8.2f} us/message')
+        print(f'  speedup:          {legacy / compiled:8.2f}x')
+
+    changed = [(m, legacy_match(m), matcher.match(m)) for m in CORPUS
+               if legacy_match(m) != matcher.match(m)]
+    if changed:
+        print('\nIntent changes (legacy -> compiled):')
+        for message, old, new in changed:
+            print(f'  {old} -> {new}: {message!r}')
+
+if __name__ == '__main__':
+    main()
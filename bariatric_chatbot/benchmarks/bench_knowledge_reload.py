@@ -0,0 +1,69 @@
+"""
+Knowledge reload cost and per-worker snapshot memory vs. catalogue size.
+
+Uses a throwaway in-memory SQLite database populated with synthetic
+surgery types, each with four diet phases.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_knowledge_reload
+"""
+import time
+import tracemalloc
+
+from flask import Flask
+
+from models import db, SurgeryType, DietPlan
+from utils.chatbot_logic import ChatbotLogic
+from utils.knowledge_base import KnowledgeBase
+
+PHASES = ('pre_op', 'post_op_phase1', 'post_op_phase2', 'post_op_phase3')
+
+def populate(count):
+    for i in range(count):
+        surgery = SurgeryType(
+            name=f'Procedure {i}',
+            description='A surgical weight-loss procedure. ' * 5,
+            requirements=[f'Requirement {n}' for n in range(8)],
+            preop_instructions={'day_before': [f'Instruction {n}' for n in range(4)]},
+            postop_instructions={'first_week': [f'Instruction {n}' for n in range(4)]},
+            risks=[f'Risk {n}' for n in range(8)],
+            cost_range={'min': 15000 + i, 'max': 25000 + i},
+            recovery_time='2-4 weeks'
+        )
+        db.session.add(surgery)
+        db.session.flush()
+        for phase in PHASES:
+            db.session.add(DietPlan(
+                surgery_type_id=surgery.id,
+                phase=phase,
+                duration='2 weeks',
+                allowed_foods=[f'Food {n} for procedure {i}' for n in range(5)],
+                restricted_foods=[f'Food {n}' for n in range(5)],
+                guidelines=[f'Guideline {n}' for n in range(5)],
+                supplements={'protein': '60-80g daily'}
+            ))
+    db.session.commit()
+
+def main(sizes=(2, 20, 200)):
+    print(f"{'surgery types':>14} {'reload ms':>10} {'snapshot KiB':>13}")
+    for size in sizes:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            populate(size)
+
+            knowledge = KnowledgeBase(ChatbotLogic())
+            tracemalloc.start()
+            start = time.perf_counter()
+            knowledge.reload()
+            elapsed = time.perf_counter() - start
+            db.session.expunge_all()
+            retained, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        print(f'{size:>14} {elapsed * 1000:>10.1f} {retained / 1024:>13.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Email delivery of MESSAGES messages to a local SMTP server (aiosmtpd).
+
+  threads  the old send_email(): a new thread per message, each mail.send()
+           opening its own SMTP connection; nothing is kept if it fails
+  outbox   send_email() queueing into email_outbox, delivered by the
+           OUTBOX_WORKERS sender threads in batches over one connection
+
+The server refuses REFUSE_PERCENT of the recipients once with a 451, so
+the outbox's retries show up (OUTBOX_RETRY_BASE is shortened to 0.2 s).
+Reports throughput, SMTP connections, the most threads alive at once and,
+for the outbox, how long messages waited in the queue. Connections time
+out after 10 s. The outbox rows
+the run created are deleted afterwards.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_outbox
+    MESSAGES=5000 OUTBOX_WORKERS=4 python -m benchmarks.bench_outbox
+"""
+import os
+import random
+import socket
+import threading
+import time
+
+PORT = int(os.getenv('SMTP_PORT', 8025))
+os.environ.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=str(PORT), MAIL_USE_TLS='false',
+                  MAIL_DEFAULT_SENDER='clinic@example.com', OUTBOX_RETRY_BASE='0.2')
+
+from aiosmtpd.controller import Controller
+from flask_mail import Message
+
+import server
+from models import db, EmailOutbox
+from utils.helpers import mail
+from utils.outbox import email_outbox
+
+MESSAGES = int(os.getenv('MESSAGES', 2000))
+REFUSE_PERCENT = float(os.getenv('REFUSE_PERCENT', 2))
+SUBJECT = 'bench-outbox'
+
+class CountingHandler:
+    """Counts connections and messages; refuses some recipients the first time"""
+
+    def __init__(self, refuse):
+        self.refuse = refuse
+        self.refused = set()
+        self.connections = 0
+        self.messages = 0
+
+    def reset(self):
+        self.refused.clear()
+        self.connections = 0
+        self.messages = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse and address not in self.refused:
+            self.refused.add(address)
+            return '451 Try again later'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return '250 OK'
+
+def recipients():
+    return [f'patient{i}@example.com' for i in range(MESSAGES)]
+
+def run_threads(handler):
+    app = server.app
+    errors = [0]
+    peak = [0]
+
+    def send(message):
+        with app.app_context():
+            try:
+                mail.send(message)
+            except Exception:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    threads = []
+    with app.app_context():
+        for address in recipients():
+            thread = threading.Thread(target=send, args=(Message('bench', recipients=[address], body='Hello'),))
+            thread.start()
+            threads.append(thread)
+            peak[0] = max(peak[0], threading.active_count())
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    print(f'threads  {handler.messages / elapsed:7.0f} msg/s  {handler.messages:5d} delivered  '
+          f'{errors[0]:4d} lost  {handler.connections:5d} connections  {peak[0]:5d} threads at peak')
+
+def run_outbox(handler):
+    app = server.app
+    started = time.perf_counter()
+    with app.app_context():
+        for address in recipients():
+            email_outbox.enqueue(db.session, SUBJECT, [address], 'Hello', sender=app.config['MAIL_DEFAULT_SENDER'])
+        db.session.commit()
+    enqueued = time.perf_counter() - started
+    email_outbox.wake()
+
+    with app.app_context():
+        while db.session.query(EmailOutbox.id).filter(EmailOutbox.subject == SUBJECT,
+                                                      EmailOutbox.status.in_(('pending', 'sending'))).count():
+            db.session.rollback()
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        waits = sorted((sent - created).total_seconds() for created, sent in db.session.query(
+            EmailOutbox.created_at, EmailOutbox.sent_at).filter(EmailOutbox.subject == SUBJECT,
+                                                               EmailOutbox.status == 'sent'))
+        stats = email_outbox.stats()
+    print(f'outbox   {handler.messages / elapsed:7.0f} msg/s  {handler.messages:5d} delivered  '
+          f'{stats["failed"]:4d} lost  {handler.connections:5d} connections  '
+          f'{threading.active_count():5d} threads at peak')
+    print(f'         queued in {enqueued * 1000:.0f} ms; waited p50 {waits[len(waits) // 2]:.2f} s, '
+          f'p99 {waits[int(len(waits) * 0.99)]:.2f} s, max {waits[-1]:.2f} s; '
+          f'{stats["batches"]} batches, {stats["retried"]} retried')
+
+def main():
+    # Connections the server cannot take in time count as lost rather than hanging the run
+    socket.setdefaulttimeout(10)
+    server.app.config['MAIL_DEBUG'] = False
+    mail.init_app(server.app)
+    refuse = set(random.Random(3).sample(recipients(), int(MESSAGES * REFUSE_PERCENT / 100)))
+    handler = CountingHandler(refuse)
+    controller = Controller(handler, hostname='127.0.0.1', port=PORT)
+    controller.start()
+    print(f'{MESSAGES} messages, {len(refuse)} refused once, {email_outbox.workers} outbox senders '
+          f'x {email_outbox.batch_size} per batch')
+    try:
+        run_threads(handler)
+        handler.reset()
+        run_outbox(handler)
+    finally:
+        email_outbox.shutdown()
+        controller.stop()
+        with server.app.app_context():
+            db.session.query(EmailOutbox).filter(EmailOutbox.subject == SUBJECT).delete()
+            db.session.commit()
+
+if __name__ == '__main__':
+    main()
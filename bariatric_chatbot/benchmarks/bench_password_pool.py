@@ -0,0 +1,78 @@
+"""
+Login and chat latency during a login flood, with and without the pool.
+
+Runs FLOOD threads posting to /login in a loop (standing in for the
+request threads of one gunicorn worker) alongside one thread that keeps
+asking /chat a question, first with password checks inline in the request
+thread and then through the bounded password pool. Reports p50/p99 for
+both endpoints and how many logins were turned away with a 503.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_password_pool
+"""
+import threading
+import time
+
+import server
+from utils.passwords import password_hasher
+
+FLOOD = 6
+DURATION = 5.0
+# Turned-away clients wait before trying again instead of spinning
+RETRY_AFTER = 0.1
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+def run(pooled):
+    app = server.app
+    slots = password_hasher._slots
+    if not pooled:
+        password_hasher._slots = None
+    logins, chats, rejected = [], [], [0]
+    deadline = time.monotonic() + DURATION
+
+    def flood():
+        client = app.test_client()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+            if response.status_code == 503:
+                rejected[0] += 1
+                time.sleep(RETRY_AFTER)
+            else:
+                logins.append(time.perf_counter() - start)
+            client.get('/logout')
+
+    def chat():
+        client = app.test_client()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            client.post('/chat', json={'message': 'what should i eat after surgery'})
+            chats.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=flood) for _ in range(FLOOD)] + [threading.Thread(target=chat)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        password_hasher._slots = slots
+
+    mode = 'pool' if pooled else 'inline'
+    print(f'{mode}: {len(logins)} logins, {rejected[0]} rejected (503), {len(chats)} chat requests')
+    print(f'  login p50 {percentile(logins, 0.5) * 1000:8.1f} ms   p99 {percentile(logins, 0.99) * 1000:8.1f} ms')
+    print(f'  chat  p50 {percentile(chats, 0.5) * 1000:8.1f} ms   p99 {percentile(chats, 0.99) * 1000:8.1f} ms')
+
+def main():
+    password_hasher.start()
+    run(pooled=False)
+    run(pooled=True)
+
+if __name__ == '__main__':
+    main()
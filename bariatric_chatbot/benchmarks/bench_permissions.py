@@ -0,0 +1,56 @@
+"""
+Cost of one permission_required check: role scan vs. compiled bitmask.
+
+The scan is what the decorators used to do: has_role('super_admin'), then
+has_permission() per required permission, each iterating the user's
+roles and their JSON permission lists (with the roles relationship
+already loaded, so no query is counted). The bitmask path is
+AccessCache with the user's masks cached. Users with typical role sets
+are flushed for the run and rolled back afterwards.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_permissions
+"""
+import timeit
+
+import server
+from models import db, User, Role
+from utils.permissions import access_cache
+
+REQUIRED = ('manage_appointments', 'view_audit_logs')
+
+ROLE_SETS = [('super_admin',), ('admin',), ('doctor',), ('staff', 'content_manager'), ('doctor', 'staff')]
+
+def scan(user):
+    if any(role.name == 'super_admin' for role in user.roles):
+        return True
+    return all(any(permission in role.permissions for role in user.roles if role.permissions)
+               for permission in REQUIRED)
+
+def compiled(user):
+    if access_cache.has_any_role(user, ('super_admin',)):
+        return True
+    return access_cache.has_all_permissions(user, REQUIRED)
+
+def main(number=20000):
+    with server.app.app_context():
+        roles = {role.name: role for role in Role.query.all()}
+        users = []
+        for i, names in enumerate(ROLE_SETS):
+            user = User(username=f'bench_user_{i}', email=f'bench_user_{i}@example.com')
+            user.roles = [roles[name] for name in names]
+            db.session.add(user)
+            users.append(user)
+        db.session.flush()
+        try:
+            for user in users:
+                assert scan(user) == compiled(user)
+
+            for name, check in (('role scan', scan), ('bitmask', compiled)):
+                elapsed = min(timeit.repeat(lambda: [check(user) for user in users], number=number, repeat=5))
+                print(f'{name:10s} {elapsed / number / len(users) * 1e9:8.0f} ns per check')
+        finally:
+            db.session.rollback()
+
+if __name__ == '__main__':
+    main()
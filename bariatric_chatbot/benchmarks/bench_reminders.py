@@ -0,0 +1,141 @@
+"""
+Reminder scheduling at APPOINTMENTS future appointments: polling vs. timing wheel.
+
+Runs on a scratch SQLite database (claiming a reminder commits), filled
+with APPOINTMENTS appointments over the next 60 days.
+
+  polling  what a reminder job built on get_upcoming_appointments() would
+           do every poll: load the next day's appointments as ORM objects
+           with .all() and pick the ones due
+  wheel    ReminderScheduler: one streamed load into the timing wheel,
+           then per poll only the appointments changed since the last one
+
+Reports the load, the cost of one poll, a simulated day of polls every
+POLL_SECONDS with CHANGES reschedules and cancellations in between
+(sending is stubbed out), and the memory each keeps.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_reminders
+    APPOINTMENTS=100000 python -m benchmarks.bench_reminders
+"""
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, update
+from sqlalchemy.orm import Session
+
+from models import db, Appointment
+from utils.reminders import ReminderScheduler
+
+APPOINTMENTS = int(os.getenv('APPOINTMENTS', 100000))
+POLL_SECONDS = int(os.getenv('POLL_SECONDS', 30))
+CHANGES = int(os.getenv('CHANGES', 1000))
+START = datetime(2030, 1, 7, 6, 0)
+LEAD = timedelta(hours=24)
+
+def seed(session):
+    rng = random.Random(7)
+    rows = [{'user_id': 1, 'doctor_id': 2 + i % 50, 'appointment_type': 'followup', 'status': 'scheduled',
+             'scheduled_time': START + timedelta(minutes=rng.randrange(60 * 24 * 60)),
+             'duration_minutes': 30, 'created_at': START - timedelta(days=1), 'updated_at': START - timedelta(days=1)}
+            for i in range(APPOINTMENTS)]
+    session.execute(insert(Appointment), rows)
+    session.commit()
+
+def polling_due(session, now):
+    upcoming = session.query(Appointment).filter(
+        Appointment.scheduled_time > now,
+        Appointment.scheduled_time <= now + LEAD,
+        Appointment.status != 'cancelled'
+    ).order_by(Appointment.scheduled_time).all()
+    return [appointment for appointment in upcoming if appointment.reminder_sent_at is None]
+
+def queue_nothing(session, appointments):
+    """Stands in for queue_appointment_reminders(): every reminder counts as queued"""
+    return appointments
+
+def measure_memory(run):
+    tracemalloc.start()
+    result = run()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f'sqlite:///{directory}/reminders.db')
+        db.metadata.create_all(engine)
+        session = Session(engine)
+        seed(session)
+        print(f'{APPOINTMENTS} appointments over 60 days')
+
+        polls = 24 * 3600 // POLL_SECONDS
+        started = time.perf_counter()
+        due = polling_due(session, START)
+        elapsed = time.perf_counter() - started
+        print(f'polling  one poll      {elapsed * 1000:8.1f} ms  ({len(due)} rows loaded, '
+              f'{elapsed * polls:.0f} s for a day of polls)')
+        session.expunge_all()
+        _, _, peak = measure_memory(lambda: polling_due(session, START))
+        print(f'polling  memory peak   {peak / 2 ** 20:8.1f} MiB per poll')
+        session.expunge_all()
+
+        scheduler = ReminderScheduler()
+        scheduler.lead = LEAD
+        started = time.perf_counter()
+        scheduler.start(session, START)
+        print(f'wheel    load          {(time.perf_counter() - started) * 1000:8.1f} ms  '
+              f'({len(scheduler.wheel)} scheduled, horizon {scheduler.wheel.horizon:%Y-%m-%d})')
+        def load():
+            other = ReminderScheduler()
+            other.lead = LEAD
+            other.start(session, START)
+            return other
+
+        _, current, peak = measure_memory(load)
+        print(f'wheel    memory        {current / 2 ** 20:8.1f} MiB kept, {peak / 2 ** 20:.1f} MiB peak while loading')
+
+        # The first poll sends the reminders already due at START
+        sent = [scheduler.poll(session, START, send=queue_nothing)]
+        started = time.perf_counter()
+        scheduler.poll(session, START + timedelta(seconds=1), send=queue_nothing)
+        print(f'wheel    one poll      {(time.perf_counter() - started) * 1000:8.1f} ms  '
+              f'(nothing changed or due; {sent[0]} sent by the first)')
+
+        # A day of polls, with bookings moved and cancelled in between
+        rng = random.Random(11)
+        change_every = max(1, polls // CHANGES)
+        sent = [0]
+
+        def send(session, appointments):
+            sent[0] += len(appointments)
+            return appointments
+
+        cpu = time.process_time()
+        started = time.perf_counter()
+        for step in range(1, polls + 1):
+            now = START + timedelta(seconds=step * POLL_SECONDS)
+            if step % change_every == 0:
+                appointment_id = rng.randrange(1, APPOINTMENTS + 1)
+                values = {'status': 'cancelled'} if rng.random() < 0.3 else \
+                    {'scheduled_time': now + timedelta(minutes=rng.randrange(60, 60 * 24 * 30))}
+                # Stamped with the simulated time the scheduler polls at
+                session.execute(update(Appointment).where(Appointment.id == appointment_id).values(
+                    updated_at=now, **values))
+                session.commit()
+            scheduler.poll(session, now, send=send)
+            session.expunge_all()
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu
+        print(f'wheel    a day         {elapsed:8.1f} s wall, {cpu:.1f} s CPU for {polls} polls '
+              f'({elapsed / polls * 1000:.2f} ms each), {sent[0]} reminders sent')
+        print(f'         stats         {scheduler.stats()}')
+        session.close()
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
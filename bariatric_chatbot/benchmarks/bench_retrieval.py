@@ -0,0 +1,77 @@
+"""
+BM25 retrieval: lookup latency, full build vs. incremental rebuild.
+
+Builds the index over a synthetic catalogue shaped like the knowledge the
+chatbot loads (each procedure with instructions and four diet plans), then
+changes one procedure and rebuilds from the previous index.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_retrieval
+"""
+import copy
+import time
+import timeit
+
+from utils.retrieval import RetrievalIndex, knowledge_sources
+
+PHASES = ('pre_op', 'post_op_phase1', 'post_op_phase2', 'post_op_phase3')
+
+QUERIES = [
+    'can i drink coffee after bypass',
+    'is beer ok after procedure 3',
+    'should i stop smoking',
+    'can i use a straw',
+    'is yogurt allowed',
+    'what is dumping syndrome',
+    'where is the clinic located',
+]
+
+def catalogue(count):
+    surgery_types = {}
+    for i in range(count):
+        surgery_types[f'procedure_{i}'] = {
+            'name': f'Procedure {i}',
+            'description': f'Procedure {i} is a surgical weight-loss procedure that reduces the stomach.',
+            'requirements': ['BMI over 40', 'Age 18-65', 'Psychological evaluation', 'Medical clearance'],
+            'risks': ['Bleeding', 'Infection', 'Blood clots', 'Dumping syndrome', f'Risk specific to {i}'],
+            'preop_instructions': {'two_weeks_before': ['Stop smoking', 'Begin liquid diet as directed'],
+                                   'day_before': ['No food after midnight', 'Clear liquids only']},
+            'postop_instructions': {'first_week': ['Walk frequently', 'Record fluid intake']},
+            'recovery_time': 'hospital stay: 2-3 days',
+            'diet_plans': {
+                phase: {
+                    'duration': '2 weeks',
+                    'allowed_foods': ['Clear broths', 'Sugar-free gelatin', 'Protein shakes', f'Food {i}'],
+                    'restricted_foods': ['Caffeine', 'Alcoholic beverages', 'Carbonated drinks', 'Dairy products'],
+                    'guidelines': ['Sip slowly', 'No straws', 'Stop when full'],
+                    'supplements': {'multivitamin': 'As directed', 'protein': '60-80g daily'}
+                }
+                for phase in PHASES
+            }
+        }
+    return surgery_types
+
+def main():
+    for count in (10, 100, 500):
+        surgery_types = catalogue(count)
+
+        start = time.perf_counter()
+        index = RetrievalIndex(knowledge_sources(surgery_types, {}))
+        full_ms = (time.perf_counter() - start) * 1000
+
+        changed = copy.deepcopy(surgery_types)
+        changed['procedure_0']['diet_plans']['pre_op']['restricted_foods'].append('Spicy foods')
+        start = time.perf_counter()
+        rebuilt = RetrievalIndex(knowledge_sources(changed, {}), index)
+        incremental_ms = (time.perf_counter() - start) * 1000
+
+        lookup = min(timeit.repeat(lambda: [index.search(query) for query in QUERIES], number=50, repeat=5))
+        lookup_us = lookup / 50 / len(QUERIES) * 1e6
+
+        print(f'{count} procedures, {index.count} passages, {len(index.segments)} segments')
+        print(f'  full build:          {full_ms:8.2f} ms')
+        print(f'  one plan changed:    {incremental_ms:8.2f} ms ({rebuilt.rebuilt} segment rebuilt)')
+        print(f'  lookup:              {lookup_us:8.1f} us')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Per-message overhead of typo correction, and what it recovers.
+
+Times SpellingCorrector.correct() on realistic messages with its token
+cache warm (the steady state) and cold (every token looked up in the
+deletion index), and counts misspelled messages that get the right
+intent as typed and after correction.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_spelling
+"""
+import time
+import timeit
+
+from benchmarks.bench_intent_matcher import CORPUS
+from utils.chatbot_logic import INTENT_KEYWORDS, IntentMatcher, chatbot
+from utils.spelling import SpellingCorrector
+
+# Misspelled messages with the intent they should get
+TYPOS = [
+    ('what are the surgury options', 'surgery_info'),
+    ('am i eligable for the sleeve', 'requirements_info'),
+    ('i want to make an apointment', 'appointment_info'),
+    ('what are the reqirements', 'requirements_info'),
+    ('tell me about the bypas', 'surgery_info'),
+    ('is the operation dangerus', 'risks_info'),
+    ('what are the posible complicatons', 'risks_info'),
+    ('does my insurence cover it', 'cost_info'),
+    ('what is the dite before surgery', 'diet_info'),
+    ('can i shedule a consultaton', 'appointment_info'),
+]
+
+def main(number=2000):
+    spelling = chatbot.knowledge.spelling
+    messages = CORPUS + [message for message, _ in TYPOS]
+
+    start = time.perf_counter()
+    words = spelling.words
+    SpellingCorrector(words)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    def run():
+        for message in messages:
+            spelling.correct(message)
+
+    run()
+    warm = min(timeit.repeat(run, number=number // 10, repeat=5)) / (number // 10) / len(messages)
+
+    def cold():
+        spelling._cache.clear()
+        run()
+
+    cold_time = min(timeit.repeat(cold, number=20, repeat=5)) / 20 / len(messages)
+
+    matcher = IntentMatcher(INTENT_KEYWORDS)
+    raw = sum(matcher.match(message) == intent for message, intent in TYPOS)
+    corrected = sum(matcher.match(spelling.correct(message)) == intent for message, intent in TYPOS)
+
+    print(f'vocabulary: {len(words)} words, index built in {build_ms:.1f} ms')
+    print(f'overhead per message, warm cache: {warm * 1e6:.2f} us')
+    print(f'overhead per message, cold cache: {cold_time * 1e6:.2f} us')
+    print(f'misspelled messages matched correctly: {raw}/{len(TYPOS)} as typed, '
+          f'{corrected}/{len(TYPOS)} corrected')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Response size and render time of targeted vs. full-catalogue answers
+as the number of procedures grows.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.bench_targeted_answers
+"""
+import timeit
+
+from utils.chatbot_logic import ChatbotLogic
+
+def catalogue(size):
+    def plan(i, n):
+        return {
+            'duration': f'{n} weeks after surgery',
+            'allowed_foods': [f'Food {k} for technique{i}' for k in range(5)],
+            'restricted_foods': [f'Food {k}' for k in range(5)],
+        }
+
+    surgery_types = {
+        f'technique{i}': {
+            'name': f'Technique{i} Surgery',
+            'description': 'A surgical weight-loss procedure. ' * 3,
+            'cost_range': {'min': 15000 + i, 'max': 25000 + i},
+            'requirements': [f'Requirement {n}' for n in range(6)],
+            'risks': [f'Risk {n}' for n in range(6)],
+            'diet_plans': {f'post_op_phase{n}': plan(i, n) for n in range(1, 4)},
+        }
+        for i in range(size)
+    }
+    # The overview merges every procedure's foods per phase, as KnowledgeBase does
+    diet_phases = {
+        f'post_op_phase{n}': {
+            'duration': f'{n} weeks after surgery',
+            'allowed_foods': [food for i in range(size) for food in plan(i, n)['allowed_foods']],
+            'restricted_foods': plan(0, n)['restricted_foods'],
+        }
+        for n in range(1, 4)
+    }
+    return surgery_types, diet_phases
+
+def main():
+    print(f"{'procedures':>10}  {'question':<32} {'full bytes':>10} {'targeted bytes':>14} "
+          f"{'first render us':>15} {'cached us':>9}")
+    for size in (2, 20, 200):
+        chatbot = ChatbotLogic()
+        chatbot.load_knowledge(*catalogue(size))
+        knowledge = chatbot.knowledge
+
+        for question, intent in (('what does technique1 cost', 'cost_info'),
+                                 ('technique1 diet in phase 2', 'diet_info')):
+            entities = knowledge.entities.extract(question)
+            full = len(knowledge.responses[intent].encode('utf-8'))
+            targeted = len(chatbot.process_message(question)['message'].encode('utf-8'))
+
+            def first_render():
+                knowledge._targeted.clear()
+                knowledge.response(intent, entities)
+
+            number = 200
+            first = min(timeit.repeat(first_render, repeat=5, number=number)) / number
+            cached = min(timeit.repeat(lambda: chatbot.process_message(question), repeat=5, number=number)) / number
+            print(f'{size:>10}  {question:<32} {full:>10} {targeted:>14} {first * 1e6:>15.1f} {cached * 1e6:>9.1f}')
+
+if __name__ == '__main__':
+    main()
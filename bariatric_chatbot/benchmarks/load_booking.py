@@ -0,0 +1,152 @@
+"""
+Load test: contending bookings for a few doctors from several processes.
+
+PROCESSES forked processes (standing in for gunicorn workers) run THREADS
+threads each. Every thread books random 30-60 minute appointments on a
+15 minute grid of one day for one of DOCTORS doctors, so most attempts
+collide. Two modes run against the configured database:
+
+  naive    what creating an appointment with a conflict check would do
+           without the service: scan the doctor's appointments, then insert
+  service  BookingService.book(), locked per doctor with an interval index
+
+Afterwards the doctors' appointments are checked for overlaps, and
+everything the run created is deleted.
+
+Run from the bariatric_chatbot directory:
+    python -m benchmarks.load_booking
+    PROCESSES=4 THREADS=8 ATTEMPTS=50 python -m benchmarks.load_booking
+"""
+import os
+import random
+import threading
+import time
+import multiprocessing
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+from sqlalchemy.exc import OperationalError
+
+import server
+from models import db, User, Appointment, Generation
+from utils.booking import booking_service, schedule_generation, BookingConflict
+from utils.row_counts import adjust_count
+
+PROCESSES = int(os.getenv('PROCESSES', 4))
+THREADS = int(os.getenv('THREADS', 4))
+ATTEMPTS = int(os.getenv('ATTEMPTS', 40))
+DOCTORS = int(os.getenv('DOCTORS', 3))
+DAY = datetime(2031, 3, 3, 9, 0)
+
+def naive_book(session, doctor_id, patient_id, start, minutes):
+    end = start + timedelta(minutes=minutes)
+    for other in session.query(Appointment).filter(Appointment.doctor_id == doctor_id,
+                                                   Appointment.status != 'cancelled'):
+        if other.scheduled_time < end and other.scheduled_time + timedelta(minutes=other.duration_minutes) > start:
+            session.rollback()
+            raise BookingConflict(doctor_id, other.id)
+    session.add(Appointment(user_id=patient_id, doctor_id=doctor_id, scheduled_time=start,
+                            duration_minutes=minutes, appointment_type='followup', status='scheduled'))
+    session.commit()
+
+def worker(mode, doctor_ids, patient_id, seed, results):
+    with server.app.app_context():
+        # Connections inherited from the parent must not be shared
+        db.engine.dispose(close=False)
+    counts = {'booked': 0, 'conflicts': 0, 'errors': 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        with server.app.app_context():
+            for _ in range(ATTEMPTS):
+                doctor_id = rng.choice(doctor_ids)
+                start = DAY + timedelta(minutes=15 * rng.randrange(32))
+                minutes = rng.choice((30, 45, 60))
+                started = time.perf_counter()
+                try:
+                    if mode == 'naive':
+                        naive_book(db.session, doctor_id, patient_id, start, minutes)
+                    else:
+                        booking_service.book(db.session, doctor_id, patient_id, start, minutes, 'followup',
+                                             now=DAY - timedelta(days=1))
+                    outcome = 'booked'
+                except BookingConflict:
+                    outcome = 'conflicts'
+                except OperationalError:
+                    db.session.rollback()
+                    outcome = 'errors'
+                with lock:
+                    counts[outcome] += 1
+                    latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((counts, latencies))
+
+def overlaps(doctor_ids):
+    rows = db.session.query(Appointment.doctor_id, Appointment.scheduled_time, Appointment.duration_minutes).filter(
+        Appointment.doctor_id.in_(doctor_ids), Appointment.status != 'cancelled'
+    ).order_by(Appointment.doctor_id, Appointment.scheduled_time).all()
+    found = 0
+    for (doctor, start, minutes), (next_doctor, next_start, _) in zip(rows, rows[1:]):
+        if doctor == next_doctor and start + timedelta(minutes=minutes) > next_start:
+            found += 1
+    return found
+
+def cleanup(doctor_ids):
+    removed = db.session.execute(delete(Appointment).where(Appointment.doctor_id.in_(doctor_ids))).rowcount
+    adjust_count(db.session, Appointment, -removed)
+    db.session.execute(delete(Generation).where(
+        Generation.name.in_([schedule_generation(doctor_id) for doctor_id in doctor_ids])))
+    db.session.commit()
+
+def run(mode, doctor_ids, patient_id):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(mode, doctor_ids, patient_id, seed, results))
+                 for seed in range(PROCESSES)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    totals = {key: sum(counts[key] for counts, _ in collected) for key in ('booked', 'conflicts', 'errors')}
+    latencies = sorted(latency for _, batch in collected for latency in batch)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    with server.app.app_context():
+        found = overlaps(doctor_ids)
+        cleanup(doctor_ids)
+    print(f'{mode:8s} {len(latencies) / elapsed:7.1f} attempts/s  booked {totals["booked"]:4d}  '
+          f'conflicts {totals["conflicts"]:4d}  errors {totals["errors"]:3d}  '
+          f'p50 {p50 * 1000:6.1f} ms  p99 {p99 * 1000:6.1f} ms  overlapping pairs {found}')
+
+def main():
+    with server.app.app_context():
+        users = [User(username=f'bench_booking_{i}', email=f'bench_booking_{i}@example.com')
+                 for i in range(DOCTORS + 1)]
+        db.session.add_all(users)
+        db.session.commit()
+        ids = [user.id for user in users]
+        db.engine.dispose()
+    doctor_ids, patient_id = ids[:-1], ids[-1]
+    print(f'{PROCESSES} processes x {THREADS} threads x {ATTEMPTS} attempts, {len(doctor_ids)} doctors')
+    try:
+        for mode in ('naive', 'service'):
+            run(mode, doctor_ids, patient_id)
+    finally:
+        with server.app.app_context():
+            for user in User.query.filter(User.id.in_(ids)):
+                db.session.delete(user)
+            db.session.commit()
+
+if __name__ == '__main__':
+    multiprocessing.set_start_method('fork')
+    main()
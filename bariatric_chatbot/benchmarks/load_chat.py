@@ -0,0 +1,146 @@
+"""
+Load test: fast requests next to concurrent slow chat clients, per worker class.
+
+Starts gunicorn with gunicorn.conf.py once with the gthread worker and
+once with gevent (same GUNICORN_WORKERS), then runs CLIENTS concurrent
+clients that each send /chat requests slowly: the headers, a pause of
+CLIENT_DELAY seconds (a slow mobile upload), then the body. Alongside,
+one client keeps requesting the surgery catalogue and times it.
+
+A gthread worker blocks one of its GUNICORN_THREADS threads on every
+upload it has started reading, so quick requests queue behind slow
+ones; a gevent worker parks the upload and serves them meanwhile.
+Uploads themselves finish about as fast either way, since bodies that
+arrive while no thread is free wait in the socket buffer.
+
+Run from the bariatric_chatbot directory (needs gunicorn and gevent):
+    python -m benchmarks.load_chat
+    GUNICORN_WORKERS=4 CLIENTS=500 python -m benchmarks.load_chat
+"""
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+CLIENTS = int(os.getenv('CLIENTS', 200))
+CLIENT_DELAY = float(os.getenv('CLIENT_DELAY', 0.5))
+DURATION = float(os.getenv('DURATION', 10))
+PORT = int(os.getenv('PORT', 5077))
+
+BODY = json.dumps({'message': 'what should i eat after gastric bypass'}).encode('utf-8')
+HEADERS = (f'POST /chat HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+           f'Content-Length: {len(BODY)}\r\nConnection: close\r\n\r\n').encode('ascii')
+
+FAST_REQUEST = b'GET /api/catalog/surgery-types HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'
+
+def read_status(sock):
+    response = b''
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        response += chunk
+    return int(response.split(b' ', 2)[1])
+
+def fast_request():
+    """One catalogue request; returns the status code"""
+    with socket.create_connection(('127.0.0.1', PORT), timeout=60) as sock:
+        sock.sendall(FAST_REQUEST)
+        return read_status(sock)
+
+def slow_request():
+    """One /chat request with a pause between headers and body; returns the status code"""
+    with socket.create_connection(('127.0.0.1', PORT), timeout=60) as sock:
+        sock.sendall(HEADERS)
+        time.sleep(CLIENT_DELAY)
+        sock.sendall(BODY)
+        return read_status(sock)
+
+def wait_until_up(process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            socket.create_connection(('127.0.0.1', PORT), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start')
+
+def run(worker_class):
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, GUNICORN_BIND=f'127.0.0.1:{PORT}',
+               GUNICORN_WORKERS=os.getenv('GUNICORN_WORKERS', '1'))
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+                                '--log-level', 'warning', 'server:app'],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    try:
+        wait_until_up(process)
+        uploads, latencies, errors = [0], [], [0]
+        deadline = time.monotonic() + DURATION
+
+        def client():
+            # Staggered, as real clients are
+            time.sleep(random.uniform(0, CLIENT_DELAY))
+            while time.monotonic() < deadline:
+                try:
+                    status = slow_request()
+                except OSError:
+                    status = None
+                if status == 200:
+                    uploads[0] += 1
+                else:
+                    errors[0] += 1
+
+        def probe():
+            time.sleep(CLIENT_DELAY)
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    status = fast_request()
+                except OSError:
+                    status = None
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors[0] += 1
+
+        threads = [threading.Thread(target=client) for _ in range(CLIENTS)] + [threading.Thread(target=probe)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        # The whole group: a worker outliving its master would keep the port
+        # and answer the next run
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+    print(f"{worker_class} ({env['GUNICORN_WORKERS']} workers, {CLIENTS} clients, {CLIENT_DELAY}s upload):")
+    print(f'  chat: {uploads[0]} requests, {uploads[0] / elapsed:.1f} req/s, {errors[0]} failed requests in all')
+    print(f'  catalogue alongside: {len(latencies)} requests, p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms')
+
+def main():
+    run('gthread')
+    run('gevent')
+
+if __name__ == '__main__':
+    main()
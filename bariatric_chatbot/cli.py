@@ -3,10 +3,17 @@ from flask.cli import with_appcontext
 from werkzeug.security import generate_password_hash
 import json
 import logging
+import os
+import sys
 from datetime import datetime
 
-from models import db, User, Role, SurgeryType, DietPlan
+from config import Config
+from models import db, User, Role, SurgeryType, DietPlan, ChatHistory, Appointment
 from database import init_db, create_default_roles
+from utils.generations import bump_generation
+from utils.knowledge_base import KNOWLEDGE_GENERATION
+from utils.identity import USERS_GENERATION
+from utils import row_counts
 
 logger = logging.getLogger(__name__)
 
@@ -69,8 +76,14 @@ def import_surgery_types(config_file):
     try:
         with open(config_file, 'r') as f:
             config = json.load(f)
+        if isinstance(config, dict):
+            config = config['surgery_types']
         
         for surgery_data in config:
+            recovery_time = surgery_data['recovery_time']
+            if isinstance(recovery_time, dict):
+                recovery_time = ', '.join(f"{k.replace('_', ' ')}: {v}" for k, v in recovery_time.items())
+            
             surgery = SurgeryType(
                 name=surgery_data['name'],
                 description=surgery_data['description'],
@@ -79,10 +92,12 @@ def import_surgery_types(config_file):
                 postop_instructions=surgery_data.get('postop_instructions', {}),
                 risks=surgery_data['risks'],
                 cost_range=surgery_data['cost_range'],
-                recovery_time=surgery_data['recovery_time']
+                recovery_time=recovery_time
             )
             db.session.add(surgery)
         
+        # Running workers pick up the new content on their next generation poll
+        bump_generation(db.session, KNOWLEDGE_GENERATION)
         db.session.commit()
         click.echo('Surgery types imported successfully.')
     except Exception as e:
@@ -97,6 +112,8 @@ def import_diet_plans(config_file):
     try:
         with open(config_file, 'r') as f:
             config = json.load(f)
+        if isinstance(config, dict):
+            config = config['diet_plans']
         
         for plan_data in config:
             surgery_type = SurgeryType.query.filter_by(name=plan_data['surgery_type']).first()
@@ -115,12 +132,31 @@ def import_diet_plans(config_file):
             )
             db.session.add(plan)
         
+        bump_generation(db.session, KNOWLEDGE_GENERATION)
         db.session.commit()
         click.echo('Diet plans imported successfully.')
     except Exception as e:
         db.session.rollback()
         click.echo(f'Error importing diet plans: {str(e)}', err=True)
 
+@cli.command()
+@click.option('--corpus', default='config/intent_corpus.json', type=click.Path(exists=True),
+              help='Labelled corpus of example messages per intent')
+@click.option('--output', default=Config.INTENT_CLASSIFIER_PATH, help='Where to write the trained classifier')
+def train_intent_classifier(corpus, output):
+    """Train the chatbot intent classifier from a labelled corpus."""
+    try:
+        from utils.intent_classifier import IntentClassifier, load_corpus
+
+        examples = load_corpus(corpus)
+        classifier = IntentClassifier.train(examples)
+
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        classifier.save(output)
+        click.echo(f'Intent classifier trained on {len(examples)} examples and saved to {output}.')
+    except Exception as e:
+        click.echo(f'Error training intent classifier: {str(e)}', err=True)
+
 @cli.command()
 @with_appcontext
 def list_users():
@@ -155,6 +191,8 @@ def deactivate_user(username):
             return
         
         user.is_active = False
+        # Workers drop their cached copy of the user on their next generation poll
+        bump_generation(db.session, USERS_GENERATION)
         db.session.commit()
         click.echo(f'User {username} has been deactivated.')
     except Exception as e:
@@ -173,12 +211,75 @@ def activate_user(username):
             return
         
         user.is_active = True
+        # Workers drop their cached copy of the user on their next generation poll
+        bump_generation(db.session, USERS_GENERATION)
         db.session.commit()
         click.echo(f'User {username} has been activated.')
     except Exception as e:
         db.session.rollback()
         click.echo(f'Error activating user: {str(e)}', err=True)
 
+@cli.command()
+@with_appcontext
+def reconcile_counts():
+    """Recompute the admin dashboard's row counts exactly."""
+    try:
+        for name, (stored, actual) in row_counts.reconcile_counts(db.session, (User, ChatHistory, Appointment)).items():
+            drift = '' if stored is None else f' (was {stored}, drift {actual - stored:+d})'
+            click.echo(f'{name}: {actual}{drift}')
+    except Exception as e:
+        db.session.rollback()
+        click.echo(f'Error reconciling counts: {str(e)}', err=True)
+
+@cli.command()
+@with_appcontext
+@click.option('--verbose', is_flag=True, help='Print the full plan of every query')
+def check_query_plans(verbose):
+    """Fail if a hot query's plan falls back to a full table scan."""
+    from utils.query_plans import check_query_plans as explain_hot_queries
+
+    failed = []
+    for name, (plan, scans) in explain_hot_queries(db.session).items():
+        click.echo(f"{'FULL SCAN' if scans else 'ok':<10} {name}")
+        if scans:
+            failed.append(name)
+        for line in plan if verbose or scans else []:
+            click.echo(f'           {line}')
+    if failed:
+        click.echo(f'{len(failed)} hot queries are not served by an index: {", ".join(failed)}', err=True)
+        sys.exit(1)
+
+@cli.command()
+@with_appcontext
+@click.option('--interval', type=float, default=Config.REMINDER_POLL_INTERVAL, help='Seconds between polls')
+@click.option('--once', is_flag=True, help='Send the reminders due now and exit')
+def send_reminders(interval, once):
+    """Send appointment reminders as they fall due (runs until interrupted)."""
+    from utils.reminders import reminder_scheduler
+
+    if once:
+        sent = reminder_scheduler.poll(db.session)
+        click.echo(f'Sent {sent} reminders.')
+        return
+    click.echo(f'Sending appointment reminders {reminder_scheduler.lead} ahead, polling every {interval:g}s')
+    reminder_scheduler.run(db.session, interval)
+
+@cli.command()
+@with_appcontext
+@click.option('--once', is_flag=True, help='Deliver the email due now and exit')
+def send_emails(once):
+    """Deliver queued email from the outbox (runs until interrupted)."""
+    from utils.outbox import email_outbox
+
+    if once:
+        tried = email_outbox.drain()
+        stats = email_outbox.stats(db.session)
+        click.echo(f"Tried {tried} emails: {stats['sent']} sent, {stats['retried']} to retry, "
+                   f"{stats['failed']} failed; {stats['queue_depth']} still queued.")
+        return
+    click.echo(f'Delivering queued email with {max(1, email_outbox.workers)} senders')
+    email_outbox.run()
+
 @cli.command()
 @with_appcontext
 def cleanup_expired_tokens():
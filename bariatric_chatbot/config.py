@@ -32,8 +32,82 @@ class Config:
     MEDICAL_ROLES = ['doctor', 'nurse']
     STAFF_ROLES = ['staff', 'receptionist']
     
+    # Chatbot Configuration
+    INTENT_CLASSIFIER_PATH = os.getenv('INTENT_CLASSIFIER_PATH', 'instance/intent_classifier.npz')
+    INTENT_CLASSIFIER_THRESHOLD = float(os.getenv('INTENT_CLASSIFIER_THRESHOLD', 0.6))
+    CHAT_BATCH_MAX_SIZE = int(os.getenv('CHAT_BATCH_MAX_SIZE', 100))
+    
+    # Seconds between checks for content changed by other workers or the CLI
+    GENERATION_POLL_INTERVAL = float(os.getenv('GENERATION_POLL_INTERVAL', 5))
+    
+    # Chat history write-behind buffer; rows that cannot reach the database
+    # go to the spill file (empty to drop them instead) and are replayed later
+    CHAT_HISTORY_WRITE_BEHIND = os.getenv('CHAT_HISTORY_WRITE_BEHIND', 'true').lower() == 'true'
+    CHAT_HISTORY_QUEUE_SIZE = int(os.getenv('CHAT_HISTORY_QUEUE_SIZE', 10000))
+    CHAT_HISTORY_FLUSH_ROWS = int(os.getenv('CHAT_HISTORY_FLUSH_ROWS', 200))
+    CHAT_HISTORY_FLUSH_INTERVAL_MS = int(os.getenv('CHAT_HISTORY_FLUSH_INTERVAL_MS', 250))
+    CHAT_HISTORY_SPILL_PATH = os.getenv('CHAT_HISTORY_SPILL_PATH', 'instance/chat_history_spill.jsonl')
+    
+    # Per-conversation chatbot state for follow-up questions: 'sqlite' (a local
+    # file shared by all workers on the host) or 'memory' (per worker, so only
+    # for a single worker or sticky sessions)
+    CONVERSATION_STATE_BACKEND = os.getenv('CONVERSATION_STATE_BACKEND', 'sqlite')
+    CONVERSATION_STATE_PATH = os.getenv('CONVERSATION_STATE_PATH', 'instance/conversation_state.db')
+    CONVERSATION_STATE_MAX_SIZE = int(os.getenv('CONVERSATION_STATE_MAX_SIZE', 10000))
+    CONVERSATION_STATE_TTL = int(os.getenv('CONVERSATION_STATE_TTL', 1800))  # seconds idle
+    
+    # Audit entries are appended to local segment files and bulk-loaded into AuditLog
+    AUDIT_SEGMENT_DIR = os.getenv('AUDIT_SEGMENT_DIR', 'instance/audit')
+    AUDIT_SEGMENT_MAX_BYTES = int(os.getenv('AUDIT_SEGMENT_MAX_BYTES', 1024 * 1024))
+    AUDIT_FSYNC_INTERVAL_MS = int(os.getenv('AUDIT_FSYNC_INTERVAL_MS', 50))
+    AUDIT_LOAD_INTERVAL = float(os.getenv('AUDIT_LOAD_INTERVAL', 2))
+    
+    # Password hashing runs in a per-worker process pool; requests beyond
+    # workers + queue are turned away instead of tying up request threads
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_POOL_WORKERS = int(os.getenv('PASSWORD_POOL_WORKERS', 1))
+    PASSWORD_POOL_QUEUE = int(os.getenv('PASSWORD_POOL_QUEUE', 0))
+    PASSWORD_POOL_TIMEOUT = float(os.getenv('PASSWORD_POOL_TIMEOUT', 10))
+    
+    # current_user is a cached snapshot; changes made by other workers are
+    # seen after GENERATION_POLL_INTERVAL, anything else after the TTL
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 60))
+    USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', 10000))
+    # Users whose role and permission masks each worker keeps (least recently used dropped)
+    ACCESS_CACHE_MAX_SIZE = int(os.getenv('ACCESS_CACHE_MAX_SIZE', 10000))
+    
+    # Bookable appointment slots: every APPOINTMENT_SLOT_MINUTES from the
+    # start hour up to and including the end hour. APPOINTMENT_MAX_MINUTES
+    # bounds how long an appointment may last, so availability only looks
+    # that far back for ones running into the requested range.
+    APPOINTMENT_DAY_START_HOUR = int(os.getenv('APPOINTMENT_DAY_START_HOUR', 9))
+    APPOINTMENT_DAY_END_HOUR = int(os.getenv('APPOINTMENT_DAY_END_HOUR', 17))
+    APPOINTMENT_SLOT_MINUTES = int(os.getenv('APPOINTMENT_SLOT_MINUTES', 30))
+    APPOINTMENT_MAX_MINUTES = int(os.getenv('APPOINTMENT_MAX_MINUTES', 240))
+    MAX_AVAILABILITY_DAYS = int(os.getenv('MAX_AVAILABILITY_DAYS', 60))
+    
+    # Reminders go out this long before an appointment (flask send-reminders)
+    REMINDER_LEAD_HOURS = float(os.getenv('REMINDER_LEAD_HOURS', 24))
+    REMINDER_POLL_INTERVAL = float(os.getenv('REMINDER_POLL_INTERVAL', 30))
+    REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', 500))
+    
+    # Email outbox: OUTBOX_WORKERS sender threads per process deliver queued
+    # mail in batches of OUTBOX_BATCH_SIZE over one SMTP connection (0 leaves
+    # sending to flask send-emails). Failed messages are retried after
+    # OUTBOX_RETRY_BASE seconds, doubling up to OUTBOX_RETRY_MAX, and given up
+    # after OUTBOX_MAX_ATTEMPTS. Claims older than OUTBOX_LEASE seconds are
+    # assumed abandoned and sent again.
+    OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 2))
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 5))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+    OUTBOX_RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', 30))
+    OUTBOX_RETRY_MAX = float(os.getenv('OUTBOX_RETRY_MAX', 3600))
+    OUTBOX_LEASE = float(os.getenv('OUTBOX_LEASE', 300))
+    
     # Pagination
     ITEMS_PER_PAGE = 10
+    MAX_ITEMS_PER_PAGE = 100  # Largest ?per_page= the admin listing APIs accept
     
     # Upload Configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
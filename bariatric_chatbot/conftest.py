@@ -0,0 +1,2 @@
+# Loaded by pytest from this directory, which puts it on sys.path: tests import the
+# app modules the way server.py does (from utils..., from models ...)
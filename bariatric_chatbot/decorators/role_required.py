@@ -2,6 +2,8 @@ from functools import wraps
 from flask import abort, current_app
 from flask_login import current_user
 
+from utils.permissions import access_cache
+
 def role_required(roles):
     """
     Decorator to check if the current user has any of the required roles.
@@ -9,17 +11,17 @@ def role_required(roles):
     Args:
         roles (list or str): A list of role names or a single role name
     """
+    # Convert single role to a tuple once, not per request
+    required_roles = tuple(roles) if isinstance(roles, list) else (roles,)
+    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if not current_user.is_authenticated:
                 abort(401)  # Unauthorized
             
-            # Convert single role to list
-            required_roles = roles if isinstance(roles, list) else [roles]
-            
             # Check if user has any of the required roles
-            if not any(current_user.has_role(role) for role in required_roles):
+            if not access_cache.has_any_role(current_user, required_roles):
                 abort(403)  # Forbidden
                 
             return f(*args, **kwargs)
@@ -33,21 +35,21 @@ def permission_required(permissions):
     Args:
         permissions (list or str): A list of permission names or a single permission name
     """
+    # Convert single permission to a tuple once, not per request
+    required_permissions = tuple(permissions) if isinstance(permissions, list) else (permissions,)
+    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if not current_user.is_authenticated:
                 abort(401)  # Unauthorized
             
-            # Convert single permission to list
-            required_permissions = permissions if isinstance(permissions, list) else [permissions]
-            
             # Super admin has all permissions
-            if current_user.has_role('super_admin'):
+            if access_cache.has_any_role(current_user, ('super_admin',)):
                 return f(*args, **kwargs)
             
             # Check if user has all required permissions
-            if not all(current_user.has_permission(perm) for perm in required_permissions):
+            if not access_cache.has_all_permissions(current_user, required_permissions):
                 abort(403)  # Forbidden
                 
             return f(*args, **kwargs)
@@ -63,7 +65,7 @@ def admin_required(f):
         if not current_user.is_authenticated:
             abort(401)  # Unauthorized
             
-        if not (current_user.has_role('admin') or current_user.has_role('super_admin')):
+        if not access_cache.has_any_role(current_user, ('admin', 'super_admin')):
             abort(403)  # Forbidden
             
         return f(*args, **kwargs)
@@ -78,7 +80,7 @@ def super_admin_required(f):
         if not current_user.is_authenticated:
             abort(401)  # Unauthorized
             
-        if not current_user.has_role('super_admin'):
+        if not access_cache.has_any_role(current_user, ('super_admin',)):
             abort(403)  # Forbidden
             
         return f(*args, **kwargs)
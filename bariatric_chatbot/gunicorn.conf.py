@@ -0,0 +1,66 @@
+import gc
+import os
+
+# 'gthread' (default) or 'gevent'. With gevent each worker serves up to
+# GUNICORN_WORKER_CONNECTIONS requests cooperatively instead of one per
+# thread, so slow clients and streamed answers don't hold scarce slots.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # Patch before preload_app imports the app: locks, queues and the
+    # background threads it creates at import must already be cooperative
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        # Let PostgreSQL queries yield to other requests instead of blocking the worker
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+threads = int(os.getenv('GUNICORN_THREADS', 2))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+
+# Import the app once in the master process. The chatbot renders its static
+# responses at import time, so every worker inherits them copy-on-write
+# instead of rendering its own copy.
+preload_app = True
+
+def on_starting(server):
+    """Warn about settings that only hold within one worker"""
+    if workers > 1 and os.getenv('CONVERSATION_STATE_BACKEND', 'sqlite') == 'memory':
+        server.log.warning(f"CONVERSATION_STATE_BACKEND=memory with {workers} workers: follow-up "
+                           "questions lose their context when they reach another worker")
+
+def pre_fork(server, worker):
+    """Keep preloaded objects out of the workers' garbage collections"""
+    # Without this the first collection in each worker touches every
+    # inherited object and copies the shared pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master and start per-worker pools"""
+    from server import app
+    from models import db
+    from utils.outbox import email_outbox
+    from utils.passwords import password_hasher
+
+    with app.app_context():
+        db.engine.dispose()
+    # Fork the password hashing processes before the worker starts threads
+    password_hasher.start()
+    # Deliver mail left queued by the previous workers without waiting for new mail
+    email_outbox.start()
+
+def worker_exit(server, worker):
+    """Write out chat history and audit entries still waiting in buffers, finish email batches in flight"""
+    from utils.audit import audit_sink
+    from utils.outbox import email_outbox
+    from utils.write_behind import chat_history_writer
+
+    chat_history_writer.shutdown()
+    audit_sink.shutdown()
+    email_outbox.shutdown()
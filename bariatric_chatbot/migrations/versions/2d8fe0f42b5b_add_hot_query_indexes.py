@@ -0,0 +1,47 @@
+"""add hot query indexes
+
+Tables are created by db.create_all(), which also creates these indexes on
+a new database but never adds them to existing tables; this revision does.
+Indexes that already exist are skipped, so it applies to either.
+
+Revision ID: 2d8fe0f42b5b
+Revises: 
+Create Date: 2026-10-17 12:30:31.333131
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d8fe0f42b5b'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_user_created_at_id', 'user', ['created_at', 'id']),
+    ('ix_chat_history_user_id_created_at', 'chat_history', ['user_id', 'created_at']),
+    ('ix_appointment_doctor_id_scheduled_time', 'appointment', ['doctor_id', 'scheduled_time']),
+    ('ix_appointment_status_scheduled_time', 'appointment', ['status', 'scheduled_time']),
+    ('ix_appointment_scheduled_time_id', 'appointment', ['scheduled_time', 'id']),
+    ('ix_audit_log_created_at_id', 'audit_log', ['created_at', 'id']),
+    ('ix_diet_plan_surgery_type_id_phase', 'diet_plan', ['surgery_type_id', 'phase']),
+]
+
+
+def _existing(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        if name not in _existing(table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        if name in _existing(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,52 @@
+"""add email outbox
+
+Email is queued in this table and delivered by the outbox senders.
+Skipped where db.create_all() already created the table.
+
+Revision ID: 4c1e7a93d2f0
+Revises: b9a6164a6081
+Create Date: 2026-10-17 15:20:11.504127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1e7a93d2f0'
+down_revision = 'b9a6164a6081'
+branch_labels = None
+depends_on = None
+
+
+def _inspect():
+    return sa.inspect(op.get_bind())
+
+
+def upgrade():
+    if _inspect().has_table('email_outbox'):
+        return
+    op.create_table(
+        'email_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.String(length=255), nullable=False),
+        sa.Column('sender', sa.String(length=255), nullable=True),
+        sa.Column('recipients', sa.JSON(), nullable=False),
+        sa.Column('body', sa.Text(), nullable=True),
+        sa.Column('html', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('claimed_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_email_outbox_status_next_attempt_at', 'email_outbox', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    if _inspect().has_table('email_outbox'):
+        op.drop_index('ix_email_outbox_status_next_attempt_at', table_name='email_outbox')
+        op.drop_table('email_outbox')
@@ -0,0 +1,35 @@
+"""add appointment duration
+
+Existing appointments get the default of 30 minutes, one slot. Skipped
+when db.create_all() already created the column.
+
+Revision ID: 8586bb76129e
+Revises: 2d8fe0f42b5b
+Create Date: 2026-10-17 12:52:10.418209
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8586bb76129e'
+down_revision = '2d8fe0f42b5b'
+branch_labels = None
+depends_on = None
+
+
+def _columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('appointment')}
+
+
+def upgrade():
+    if 'duration_minutes' not in _columns():
+        with op.batch_alter_table('appointment') as batch_op:
+            batch_op.add_column(sa.Column('duration_minutes', sa.Integer(), nullable=False, server_default='30'))
+
+
+def downgrade():
+    if 'duration_minutes' in _columns():
+        with op.batch_alter_table('appointment') as batch_op:
+            batch_op.drop_column('duration_minutes')
@@ -0,0 +1,40 @@
+"""add appointment reminder_sent_at
+
+Existing appointments start without a reminder sent; the scheduler only
+considers upcoming ones. Skipped where db.create_all() already created
+the column or index.
+
+Revision ID: b9a6164a6081
+Revises: 8586bb76129e
+Create Date: 2026-10-17 13:05:42.913377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9a6164a6081'
+down_revision = '8586bb76129e'
+branch_labels = None
+depends_on = None
+
+
+def _inspect():
+    return sa.inspect(op.get_bind())
+
+
+def upgrade():
+    if 'reminder_sent_at' not in {column['name'] for column in _inspect().get_columns('appointment')}:
+        with op.batch_alter_table('appointment') as batch_op:
+            batch_op.add_column(sa.Column('reminder_sent_at', sa.DateTime(), nullable=True))
+    if 'ix_appointment_updated_at' not in {index['name'] for index in _inspect().get_indexes('appointment')}:
+        op.create_index('ix_appointment_updated_at', 'appointment', ['updated_at'])
+
+
+def downgrade():
+    if 'ix_appointment_updated_at' in {index['name'] for index in _inspect().get_indexes('appointment')}:
+        op.drop_index('ix_appointment_updated_at', table_name='appointment')
+    if 'reminder_sent_at' in {column['name'] for column in _inspect().get_columns('appointment')}:
+        with op.batch_alter_table('appointment') as batch_op:
+            batch_op.drop_column('reminder_sent_at')
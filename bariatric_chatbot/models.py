@@ -1,10 +1,11 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from time import time
 from config import Config
+from utils.passwords import password_hasher
+from utils.permissions import access_cache
 
 db = SQLAlchemy()
 
@@ -40,22 +41,35 @@ class User(UserMixin, db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     
+    # Admin user listing pages by (created_at, id)
+    __table_args__ = (db.Index('ix_user_created_at_id', 'created_at', 'id'),)
+
     # Relationships
     chat_history = db.relationship('ChatHistory', backref='user', lazy='dynamic')
-    appointments = db.relationship('Appointment', backref='user', lazy='dynamic')
+    appointments = db.relationship('Appointment', backref='user', lazy='dynamic', foreign_keys='Appointment.user_id')
     medical_records = db.relationship('MedicalRecord', backref='user', lazy='dynamic')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    @property
+    def role_ids(self):
+        """Ids of this user's roles, read without loading the relationship"""
+        rows = db.session.query(user_roles.c.role_id).filter(user_roles.c.user_id == self.id)
+        return frozenset(role_id for (role_id,) in rows)
 
     def has_role(self, role_name):
-        return any(role.name == role_name for role in self.roles)
+        if self.id is None:
+            return any(role.name == role_name for role in self.roles)
+        return access_cache.has_any_role(self, (role_name,))
 
     def has_permission(self, permission):
-        return any(permission in role.permissions for role in self.roles if role.permissions)
+        if self.id is None:
+            return any(permission in role.permissions for role in self.roles if role.permissions)
+        return access_cache.has_all_permissions(self, (permission,))
 
     def get_reset_password_token(self, expires_in=600):
         return jwt.encode(
@@ -83,6 +97,9 @@ class ChatHistory(db.Model):
     confidence_score = db.Column(db.Float)
     feedback = db.Column(db.Boolean, default=None)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # A user's history, newest first
+    __table_args__ = (db.Index('ix_chat_history_user_id_created_at', 'user_id', 'created_at'),)
     
     def __repr__(self):
         return f'<ChatHistory {self.id}>'
@@ -94,12 +111,25 @@ class Appointment(db.Model):
     appointment_type = db.Column(db.String(100), nullable=False)
     status = db.Column(db.String(20), default='scheduled')
     scheduled_time = db.Column(db.DateTime, nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=30, server_default='30')
     notes = db.Column(db.Text)
+    reminder_sent_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     doctor = db.relationship('User', foreign_keys=[doctor_id])
 
+    __table_args__ = (
+        # A doctor's schedule for a day (slot generation, booking)
+        db.Index('ix_appointment_doctor_id_scheduled_time', 'doctor_id', 'scheduled_time'),
+        # Appointments by status in a time window (reminders, upcoming)
+        db.Index('ix_appointment_status_scheduled_time', 'status', 'scheduled_time'),
+        # Admin listing pages by (scheduled_time, id)
+        db.Index('ix_appointment_scheduled_time_id', 'scheduled_time', 'id'),
+        # Appointments changed since the reminder scheduler last looked
+        db.Index('ix_appointment_updated_at', 'updated_at'),
+    )
+
     def __repr__(self):
         return f'<Appointment {self.id}>'
 
@@ -130,9 +160,35 @@ class AuditLog(db.Model):
 
     user = db.relationship('User', backref=db.backref('audit_logs', lazy='dynamic'))
 
+    # Audit log pages and recent activity by (created_at, id)
+    __table_args__ = (db.Index('ix_audit_log_created_at_id', 'created_at', 'id'),)
+
     def __repr__(self):
         return f'<AuditLog {self.id}>'
 
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255))
+    recipients = db.Column(db.JSON, nullable=False)
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    # Senders claim the oldest due pending messages
+    __table_args__ = (db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id}>'
+
 class SurgeryType(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -163,5 +219,25 @@ class DietPlan(db.Model):
 
     surgery_type = db.relationship('SurgeryType', backref=db.backref('diet_plans', lazy='dynamic'))
 
+    __table_args__ = (db.Index('ix_diet_plan_surgery_type_id_phase', 'surgery_type_id', 'phase'),)
+
     def __repr__(self):
         return f'<DietPlan {self.phase} for {self.surgery_type.name}>'
+
+class Generation(db.Model):
+    """Named counter bumped whenever the data it guards changes"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Generation {self.name}={self.value}>'
+
+class RowCount(db.Model):
+    """Row count of a table, adjusted in the transactions that insert or delete its rows"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RowCount {self.name}={self.value}>'
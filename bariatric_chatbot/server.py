@@ -1,16 +1,38 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, flash, session, stream_with_context, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from flask_migrate import Migrate
 from werkzeug.urls import url_parse
-from datetime import datetime
+from sqlalchemy.orm import selectinload
+from datetime import datetime, date, timezone
+import json
 import logging
 from logging.handlers import RotatingFileHandler
 import os
+import uuid
 
 from config import config
 from models import db, User, Role, ChatHistory, Appointment, MedicalRecord, AuditLog
 from database import init_db
 from decorators.role_required import admin_required, role_required, permission_required
-from utils.chatbot_logic import process_message
+from utils.chatbot_logic import process_message, process_batch, load_classifier
+from utils.generations import generation_watcher, bump_generation
+from utils.knowledge_base import knowledge_base
+from utils.write_behind import chat_history_writer
+from utils.conversation_state import conversation_store
+from utils.audit import audit_sink
+from utils.passwords import password_hasher, PasswordPoolBusy
+from utils.permissions import access_cache, PERMISSIONS_GENERATION
+from utils.identity import user_cache, USERS_GENERATION
+from utils.row_counts import count_on_change, read_counts
+from utils.pagination import KeysetPaginator, InvalidCursor
+from utils.catalog import current_catalog
+from utils.availability import AvailabilityEngine, doctor_ids
+from utils.booking import booking_service, BookingConflict, BookingError
+from utils.reminders import reminder_scheduler
+from utils.outbox import email_outbox
+from utils.email_templates import email_renderer
+from utils.helpers import mail
+from forms import LoginForm
 
 # Initialize Flask application
 app = Flask(__name__)
@@ -18,6 +40,17 @@ app.config.from_object(config['development'])
 
 # Initialize extensions
 db.init_app(app)
+migrate = Migrate(app, db)
+generation_watcher.init_app(app)
+chat_history_writer.init_app(app)
+conversation_store.init_app(app)
+audit_sink.init_app(app)
+password_hasher.init_app(app)
+booking_service.init_app(app)
+reminder_scheduler.init_app(app)
+mail.init_app(app)
+email_outbox.init_app(app, mail)
+email_renderer.init_app(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access this page.'
@@ -36,7 +69,15 @@ app.logger.info('Bariatric Chatbot startup')
 
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    identity = user_cache.get(int(id))
+    # A deactivated account loses its session
+    if identity is None or not identity.is_active:
+        return None
+    return identity
+
+@app.context_processor
+def inject_now():
+    return {'now': datetime.utcnow()}
 
 # Error handlers
 @app.errorhandler(404)
@@ -56,43 +97,51 @@ def login():
     
     if request.method == 'POST':
         user = User.query.filter_by(username=request.form['username']).first()
-        if user is None or not user.check_password(request.form['password']):
-            flash('Invalid username or password')
-            return redirect(url_for('login'))
+        try:
+            if user is None or not user.check_password(request.form['password']):
+                flash('Invalid username or password')
+                return redirect(url_for('login'))
+            
+            # Upgrade hashes made with older cost parameters while we have the password
+            if password_hasher.needs_rehash(user.password_hash):
+                try:
+                    user.set_password(request.form['password'])
+                except PasswordPoolBusy:
+                    # Optional: the password is verified, so log in and upgrade on a later login
+                    pass
+        except PasswordPoolBusy:
+            flash('We are receiving too many sign-in requests. Please try again in a moment.')
+            return render_template('login.html', form=LoginForm()), 503
         
         login_user(user)
         user.last_login = datetime.utcnow()
         db.session.commit()
         
         # Log the login
-        log = AuditLog(
+        audit_sink.record(
+            'login',
             user_id=user.id,
-            action='login',
             ip_address=request.remote_addr,
             user_agent=request.user_agent.string
         )
-        db.session.add(log)
-        db.session.commit()
         
         next_page = request.args.get('next')
         if not next_page or url_parse(next_page).netloc != '':
             next_page = url_for('index')
         return redirect(next_page)
     
-    return render_template('login.html')
+    return render_template('login.html', form=LoginForm())
 
 @app.route('/logout')
 @login_required
 def logout():
     # Log the logout
-    log = AuditLog(
+    audit_sink.record(
+        'logout',
         user_id=current_user.id,
-        action='logout',
         ip_address=request.remote_addr,
         user_agent=request.user_agent.string
     )
-    db.session.add(log)
-    db.session.commit()
     
     logout_user()
     return redirect(url_for('index'))
@@ -109,43 +158,256 @@ def chat():
         if not data or 'message' not in data:
             return jsonify({'error': 'No message provided'}), 400
         
+        message = data['message']
+        if not isinstance(message, str) or not message.strip():
+            return jsonify({'error': 'Message must be a non-empty string'}), 400
+        
         user_id = current_user.id if current_user.is_authenticated else None
-        response = process_message(data['message'])
+        response = answer_in_conversation(message)
         
         # Save chat history if user is authenticated
         if user_id:
-            chat_history = ChatHistory(
-                user_id=user_id,
-                message=data['message'],
-                response=response['message'],
-                intent=response.get('intent'),
-                confidence_score=response.get('confidence')
-            )
-            db.session.add(chat_history)
-            db.session.commit()
+            save_chat_history(user_id, message, response)
         
         return jsonify(response)
     except Exception as e:
         app.logger.error(f'Error processing chat message: {str(e)}')
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-sent events variant of /chat: intent metadata first, then the answer line by line"""
+    data = request.get_json(silent=True)
+    if not data or 'message' not in data:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    message = data['message']
+    if not isinstance(message, str) or not message.strip():
+        return jsonify({'error': 'Message must be a non-empty string'}), 400
+    
+    user_id = current_user.id if current_user.is_authenticated else None
+    # Answer before the 200 and the event-stream headers go out, so a failure is still a plain error
+    try:
+        response = answer_in_conversation(message, conversation_key())
+    except Exception as e:
+        app.logger.error(f'Error processing streamed chat message: {str(e)}')
+        return jsonify({'error': 'Internal server error'}), 500
+    
+    def generate():
+        try:
+            yield sse_event('meta', {k: v for k, v in response.items() if k != 'message'})
+            for line in response['message'].splitlines(keepends=True):
+                yield sse_event('chunk', {'text': line})
+            yield sse_event('done', {})
+        finally:
+            # Runs once the stream is finished or the client has gone away
+            if user_id:
+                try:
+                    save_chat_history(user_id, message, response)
+                except Exception as e:
+                    app.logger.error(f'Error saving streamed chat history: {str(e)}')
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Don't let nginx buffer the stream
+    })
+
+def conversation_key():
+    """Conversations follow the logged-in user, or the browser session for guests"""
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    if 'conversation_id' not in session:
+        session['conversation_id'] = uuid.uuid4().hex
+    return f'session:{session["conversation_id"]}'
+
+def answer_in_conversation(message, key=None):
+    key = key or conversation_key()
+    state = conversation_store.get(key)
+    response = process_message(message, state)
+    conversation_store.put(key, state)
+    return response
+
+def sse_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+def save_chat_history(user_id, message, response):
+    """Queue a chat exchange; the write-behind buffer inserts it outside the request"""
+    chat_history_writer.add({
+        'user_id': user_id,
+        'message': message,
+        'response': response['message'],
+        'intent': response.get('intent'),
+        'confidence_score': response.get('confidence')
+    })
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('messages'), list):
+            return jsonify({'error': 'No messages provided'}), 400
+        
+        messages = data['messages']
+        max_size = app.config['CHAT_BATCH_MAX_SIZE']
+        if len(messages) > max_size:
+            return jsonify({'error': f'A batch may contain at most {max_size} messages'}), 400
+        
+        # Classify all valid messages together; invalid ones get their own error
+        valid = [i for i, message in enumerate(messages) if isinstance(message, str) and message.strip()]
+        results = [{'error': 'Message must be a non-empty string'} for _ in messages]
+        for i, response in zip(valid, process_batch([messages[i] for i in valid])):
+            results[i] = response
+        
+        # Queue the whole batch's chat history; it is written in bulk off the request
+        if current_user.is_authenticated and valid:
+            rows = [
+                {
+                    'user_id': current_user.id,
+                    'message': messages[i],
+                    'response': results[i]['message'],
+                    'intent': results[i].get('intent'),
+                    'confidence_score': results[i].get('confidence')
+                }
+                for i in valid
+            ]
+            chat_history_writer.add_many(rows)
+        
+        return jsonify({'results': results})
+    except Exception as e:
+        app.logger.error(f'Error processing chat batch: {str(e)}')
+        return jsonify({'error': 'Internal server error'}), 500
+
+# Read-only catalogue API, served from the chatbot's knowledge snapshot
+@app.route('/api/catalog/surgery-types')
+def catalog_surgery_types():
+    return catalog_response(current_catalog().resource('surgery-types'))
+
+@app.route('/api/catalog/surgery-types/<key>')
+def catalog_surgery_type(key):
+    return catalog_response(current_catalog().resource('surgery-types', key))
+
+@app.route('/api/catalog/diet-plans')
+def catalog_diet_plans():
+    return catalog_response(current_catalog().resource('diet-plans'))
+
+@app.route('/api/catalog/diet-plans/<surgery_type>/<phase>')
+def catalog_diet_plan(surgery_type, phase):
+    return catalog_response(current_catalog().resource('diet-plans', surgery_type, phase))
+
+def catalog_response(resource):
+    """Pre-encoded JSON with a strong ETag: 304 on a matching If-None-Match, gzip if accepted"""
+    if resource is None:
+        return jsonify({'error': 'Not found'}), 404
+    
+    if resource.gzipped is not None and request.accept_encodings['gzip']:
+        response = Response(resource.gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(resource.gzip_etag)
+    else:
+        response = Response(resource.body, mimetype='application/json')
+        response.set_etag(resource.etag)
+    response.vary.add('Accept-Encoding')
+    # Clients may keep it but must revalidate, which costs them a 304
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+availability_engine = AvailabilityEngine.from_config(app.config)
+
+@app.route('/api/appointments/availability')
+@login_required
+def appointment_availability():
+    """Free slots of the requested doctors (?doctor_id=, repeatable; all doctors by default)"""
+    try:
+        start = date.fromisoformat(request.args['start']) if 'start' in request.args else datetime.utcnow().date()
+    except ValueError:
+        return jsonify({'error': 'Invalid start date'}), 400
+    days = min(max(request.args.get('days', 30, type=int), 1), app.config['MAX_AVAILABILITY_DAYS'])
+    doctors = request.args.getlist('doctor_id', type=int) or doctor_ids(db.session)
+    
+    grid = availability_engine.load(db.session, doctors, start, days)
+    return jsonify(grid.to_json())
+
+# Admin listings page by cursor over these keys instead of OFFSET
+USER_PAGES = KeysetPaginator((User.created_at, User.id), descending=False)
+AUDIT_LOG_PAGES = KeysetPaginator((AuditLog.created_at, AuditLog.id))
+APPOINTMENT_PAGES = KeysetPaginator((Appointment.scheduled_time, Appointment.id))
+
+def keyset_page(paginator, query, model):
+    """The page of `query` the request's ?cursor= points to, with the table's row count as total"""
+    per_page = min(request.args.get('per_page', app.config['ITEMS_PER_PAGE'], type=int),
+                   app.config['MAX_ITEMS_PER_PAGE'])
+    try:
+        page = paginator.paginate(query, app.config['SECRET_KEY'], request.args.get('cursor'), max(per_page, 1))
+    except InvalidCursor:
+        abort(400)
+    # Maintained counter, so no COUNT(*); may lag concurrent writes slightly
+    page.total = read_counts(db.session, (model,))[model.__tablename__]
+    return page
+
+def page_json(page, serialize):
+    return {
+        'items': [serialize(item) for item in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'total': page.total
+    }
+
+def user_json(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_active': user.is_active,
+        'roles': [role.name for role in user.roles],
+        'created_at': user.created_at.isoformat() if user.created_at else None,
+        'last_login': user.last_login.isoformat() if user.last_login else None
+    }
+
+def audit_log_json(log):
+    return {
+        'id': log.id,
+        'user_id': log.user_id,
+        'action': log.action,
+        'details': log.details,
+        'ip_address': log.ip_address,
+        'created_at': log.created_at.isoformat()
+    }
+
+def appointment_json(appointment):
+    return {
+        'id': appointment.id,
+        'user_id': appointment.user_id,
+        'doctor_id': appointment.doctor_id,
+        'appointment_type': appointment.appointment_type,
+        'status': appointment.status,
+        'scheduled_time': appointment.scheduled_time.isoformat(),
+        'duration_minutes': appointment.duration_minutes,
+        'notes': appointment.notes
+    }
+
 # Admin routes
 @app.route('/admin')
 @admin_required
 def admin_dashboard():
+    # Maintained counters instead of COUNT(*) over growing tables
+    counts = read_counts(db.session, (User, ChatHistory, Appointment))
     stats = {
-        'total_users': User.query.count(),
-        'total_chats': ChatHistory.query.count(),
-        'total_appointments': Appointment.query.count(),
-        'recent_activities': AuditLog.query.order_by(AuditLog.created_at.desc()).limit(10).all()
+        'total_users': counts[User.__tablename__],
+        'total_chats': counts[ChatHistory.__tablename__],
+        'total_appointments': counts[Appointment.__tablename__],
+        'recent_activities': audit_sink.merge_recent(
+            AuditLog.query.order_by(AuditLog.created_at.desc()).limit(10).all(), 10
+        )
     }
     return render_template('admin/dashboard.html', stats=stats)
 
 @app.route('/admin/users')
 @admin_required
 def admin_users():
-    page = request.args.get('page', 1, type=int)
-    users = User.query.paginate(page=page, per_page=app.config['ITEMS_PER_PAGE'])
+    users = keyset_page(USER_PAGES, User.query, User)
     roles = Role.query.all()
     return render_template('admin/users.html', users=users, roles=roles)
 
@@ -158,22 +420,55 @@ def admin_roles():
 @app.route('/admin/audit-logs')
 @permission_required('view_audit_logs')
 def admin_audit_logs():
-    page = request.args.get('page', 1, type=int)
-    logs = AuditLog.query.order_by(AuditLog.created_at.desc()).paginate(
-        page=page, per_page=app.config['ITEMS_PER_PAGE']
-    )
-    return render_template('admin/audit_logs.html', logs=logs)
+    logs = keyset_page(AUDIT_LOG_PAGES, AuditLog.query, AuditLog)
+    # Entries still on their way from the audit segments come first
+    pending = audit_sink.pending() if 'cursor' not in request.args else []
+    return render_template('admin/audit_logs.html', logs=logs, pending=pending)
 
 @app.route('/admin/appointments')
 @permission_required('manage_appointments')
 def admin_appointments():
-    page = request.args.get('page', 1, type=int)
-    appointments = Appointment.query.order_by(Appointment.scheduled_time.desc()).paginate(
-        page=page, per_page=app.config['ITEMS_PER_PAGE']
-    )
+    appointments = keyset_page(APPOINTMENT_PAGES, Appointment.query, Appointment)
     return render_template('admin/appointments.html', appointments=appointments)
 
 # API routes for AJAX calls
+@app.route('/api/admin/users')
+@admin_required
+def api_admin_users():
+    page = keyset_page(USER_PAGES, User.query.options(selectinload(User.roles)), User)
+    return jsonify(page_json(page, user_json))
+
+@app.route('/api/admin/audit-logs')
+@permission_required('view_audit_logs')
+def api_admin_audit_logs():
+    page = keyset_page(AUDIT_LOG_PAGES, AuditLog.query, AuditLog)
+    result = page_json(page, audit_log_json)
+    if 'cursor' not in request.args:
+        result['pending'] = [dict(entry, created_at=entry['created_at'].isoformat())
+                             for entry in audit_sink.pending()]
+    return jsonify(result)
+
+@app.route('/api/admin/appointments')
+@permission_required('manage_appointments')
+def api_admin_appointments():
+    page = keyset_page(APPOINTMENT_PAGES, Appointment.query, Appointment)
+    return jsonify(page_json(page, appointment_json))
+
+@app.route('/api/admin/metrics')
+@admin_required
+def admin_metrics():
+    return jsonify({
+        'chat_history_writer': chat_history_writer.stats(),
+        'audit_sink': audit_sink.stats(),
+        'password_hasher': password_hasher.stats(),
+        'access_cache': access_cache.stats(),
+        'user_cache': user_cache.stats(),
+        'booking': booking_service.stats(),
+        'email_outbox': email_outbox.stats(db.session),
+        'email_renderer': email_renderer.stats(),
+        'knowledge': knowledge_base.stats
+    })
+
 @app.route('/api/user/<int:user_id>', methods=['PUT'])
 @admin_required
 def update_user(user_id):
@@ -189,21 +484,24 @@ def update_user(user_id):
                 role = Role.query.get(role_id)
                 if role:
                     user.roles.append(role)
+            # Compiled permission masks are stale in every worker from this commit on
+            bump_generation(db.session, PERMISSIONS_GENERATION)
         
         if 'is_active' in data:
             user.is_active = data['is_active']
         
+        bump_generation(db.session, USERS_GENERATION)
         db.session.commit()
+        access_cache.invalidate(user.id)
+        user_cache.invalidate(user.id)
         
         # Log the action
-        log = AuditLog(
+        audit_sink.record(
+            'update_user',
             user_id=current_user.id,
-            action='update_user',
             details={'target_user_id': user_id, 'changes': data},
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({'message': 'User updated successfully'})
     except Exception as e:
@@ -211,6 +509,40 @@ def update_user(user_id):
         app.logger.error(f'Error updating user: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/appointments', methods=['POST'])
+@permission_required('manage_appointments')
+def book_appointment():
+    data = request.get_json(silent=True) or {}
+    try:
+        doctor_id = int(data['doctor_id'])
+        user_id = int(data['user_id'])
+        scheduled_time = datetime.fromisoformat(data['scheduled_time'])
+        duration = int(data.get('duration_minutes', app.config['APPOINTMENT_SLOT_MINUTES']))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'doctor_id, user_id and scheduled_time (ISO 8601) are required'}), 400
+    if scheduled_time.tzinfo is not None:
+        # Appointment times are stored as naive UTC
+        scheduled_time = scheduled_time.astimezone(timezone.utc).replace(tzinfo=None)
+    if db.session.get(User, doctor_id) is None or db.session.get(User, user_id) is None:
+        return jsonify({'error': 'Unknown doctor or patient'}), 400
+    
+    try:
+        appointment = booking_service.book(db.session, doctor_id, user_id, scheduled_time, duration,
+                                           data.get('appointment_type', 'consultation'), data.get('notes'))
+    except BookingError as e:
+        return jsonify({'error': str(e)}), 400
+    except BookingConflict as e:
+        return jsonify({'error': 'The doctor is already booked at that time',
+                        'conflicting_appointment_id': e.appointment_id}), 409
+    
+    audit_sink.record(
+        'book_appointment',
+        user_id=current_user.id,
+        details={'appointment_id': appointment.id, 'doctor_id': doctor_id, 'user_id': user_id},
+        ip_address=request.remote_addr
+    )
+    return jsonify(appointment_json(appointment)), 201
+
 @app.route('/api/appointment/<int:appointment_id>', methods=['PUT'])
 @permission_required('manage_appointments')
 def update_appointment(appointment_id):
@@ -219,31 +551,55 @@ def update_appointment(appointment_id):
         data = request.get_json()
         
         if 'status' in data:
-            appointment.status = data['status']
+            # Through the booking service: cancelling frees the slot in every
+            # worker, reinstating checks it is still free
+            booking_service.set_status(db.session, appointment, data['status'])
         if 'notes' in data:
             appointment.notes = data['notes']
         
         db.session.commit()
         
         # Log the action
-        log = AuditLog(
+        audit_sink.record(
+            'update_appointment',
             user_id=current_user.id,
-            action='update_appointment',
             details={'appointment_id': appointment_id, 'changes': data},
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({'message': 'Appointment updated successfully'})
+    except BookingConflict as e:
+        db.session.rollback()
+        return jsonify({'error': 'The doctor is already booked at that time',
+                        'conflicting_appointment_id': e.appointment_id}), 409
     except Exception as e:
         db.session.rollback()
         app.logger.error(f'Error updating appointment: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
+# Keep the dashboard's row counts current from every ORM insert and delete
+count_on_change((User, ChatHistory, Appointment, AuditLog))
+
 # Initialize database
 with app.app_context():
     init_db(app)
 
+# Answer from the SurgeryType/DietPlan tables, reloading when they change
+knowledge_base.init_app(app, generation_watcher)
+
+# Compile roles to permission bitmasks, recompiling when roles or assignments change
+access_cache.init_app(app, generation_watcher)
+
+# Serve current_user from cached snapshots, dropped when a user is changed
+user_cache.init_app(app, generation_watcher)
+
+# Load the optional intent classifier once; with preload_app it is shared by all workers
+load_classifier(app.config['INTENT_CLASSIFIER_PATH'], app.config['INTENT_CLASSIFIER_THRESHOLD'])
+
+# Expose the cli.py commands as `flask <command>`
+from cli import cli as management_commands
+for command in management_commands.commands.values():
+    app.cli.add_command(command)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,22 @@
+from utils.chatbot_logic import IntentMatcher, INTENT_KEYWORDS
+
+matcher = IntentMatcher(INTENT_KEYWORDS)
+
+def test_keyword_inside_a_longer_word_does_not_match():
+    assert matcher.match('what did his surgery cost') == 'cost_info'
+    assert matcher.match('is this safe') == 'risks_info'
+    assert matcher.match('his') is None
+    assert matcher.match('this and that') is None
+    assert matcher.match('chips') is None
+
+def test_whole_keyword_matches():
+    assert matcher.match('hi there') == 'greeting'
+    assert matcher.match('how much does it cost') == 'cost_info'
+
+def test_listed_plurals_match():
+    assert matcher.match('what are the risks') == 'risks_info'
+    assert matcher.match('which foods are allowed') == 'diet_info'
+    assert matcher.match('any side effects') == 'risks_info'
+
+def test_highest_priority_intent_wins():
+    assert matcher.match('hello, what are the surgery costs') == 'greeting'
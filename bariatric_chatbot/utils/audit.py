@@ -0,0 +1,256 @@
+import os
+import glob
+import json
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from utils.row_counts import adjust_count
+
+logger = logging.getLogger(__name__)
+
+class AuditSink:
+    """
+    Append-only audit trail that stays off the request path.
+
+    record() only queues the entry. A background thread per worker appends
+    queued entries to a JSONL segment file in AUDIT_SEGMENT_DIR and fsyncs
+    once per batch (every AUDIT_FSYNC_INTERVAL_MS), then every
+    AUDIT_LOAD_INTERVAL seconds seals the segment and bulk-loads sealed
+    segments into AuditLog, deleting each once committed. Segments that fail
+    to load stay on disk and are retried; segments left open by a worker
+    that died are sealed by the next one to look, and segments claimed for
+    loading longer than LOADING_LEASE ago (the loader died before its
+    commit or before deleting the file) are put back to load again.
+
+    File names carry their state: audit-<pid>-<ns>.open is being written,
+    .jsonl is sealed and waiting, .loading is claimed by a loader (a rename,
+    so each segment is loaded by one worker only). pending() reads all of
+    them, so admin pages show entries that have not reached the table yet.
+    Lines that do not parse (torn by a crash mid-write) are moved to
+    audit.bad in the same directory when their segment is loaded.
+    """
+
+    # Seconds a .loading segment may stay claimed before it is loaded again
+    LOADING_LEASE = 300
+
+    def __init__(self):
+        self.app = None
+        self.directory = None
+        self.segment_max_bytes = 1024 * 1024
+        self.fsync_interval = 0.05
+        self.load_interval = 2.0
+        self._buffer = []
+        self._condition = threading.Condition()
+        self._pid = None
+        self._segment = None
+        self._last_load = 0.0
+        self._io_lock = threading.Lock()
+        self.counters = {'recorded': 0, 'written': 0, 'loaded': 0, 'failed_loads': 0, 'quarantined': 0}
+
+    def init_app(self, app):
+        self.app = app
+        self.directory = app.config['AUDIT_SEGMENT_DIR']
+        self.segment_max_bytes = app.config['AUDIT_SEGMENT_MAX_BYTES']
+        self.fsync_interval = app.config['AUDIT_FSYNC_INTERVAL_MS'] / 1000
+        self.load_interval = app.config['AUDIT_LOAD_INTERVAL']
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(self.shutdown)
+
+    def record(self, action: str, user_id: Optional[int] = None, details: Optional[Dict[str, Any]] = None,
+               ip_address: Optional[str] = None, user_agent: Optional[str] = None) -> None:
+        entry = {
+            'user_id': user_id,
+            'action': action,
+            'details': details,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        self._ensure_running()
+        with self._condition:
+            self._buffer.append(entry)
+            self.counters['recorded'] += 1
+            self._condition.notify()
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Entries not yet loaded into AuditLog, newest first"""
+        with self._condition:
+            # Copies: the buffered entries are still the writer's to serialise
+            entries = [dict(entry, created_at=datetime.fromisoformat(entry['created_at']))
+                       for entry in self._buffer]
+        for state in ('open', 'jsonl', 'loading'):
+            for path in self._segments(state):
+                try:
+                    with open(path, 'r') as f:
+                        # A line without its newline is still being written
+                        entries.extend(self._parse(line for line in f if line.endswith('\n'))[0])
+                except FileNotFoundError:
+                    continue  # Loaded meanwhile
+        entries.sort(key=lambda entry: entry['created_at'], reverse=True)
+        return entries
+
+    def merge_recent(self, logs: list, limit: int) -> list:
+        """Newest `limit` of the given AuditLog rows and the pending entries"""
+        from models import AuditLog
+
+        pending = [AuditLog(**entry) for entry in self.pending()[:limit]]
+        return sorted(pending + list(logs), key=lambda log: log.created_at, reverse=True)[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'buffered': len(self._buffer),
+            'segments_waiting': len(self._segments('jsonl')),
+            **self.counters
+        }
+
+    def shutdown(self) -> None:
+        """Write out buffered entries and try to load everything sealed"""
+        if self.app is None:
+            return
+        try:
+            self._write()
+            self._load(seal=True)
+        except Exception as e:
+            logger.error(f"Error flushing audit entries on shutdown: {str(e)}")
+
+    def _ensure_running(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._segment = None
+            thread = threading.Thread(target=self._run, name='audit-sink', daemon=True)
+            thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._buffer:
+                    self._condition.wait(self.load_interval)
+            # Let entries from concurrent requests join this batch
+            time.sleep(self.fsync_interval)
+            try:
+                self._write()
+                if time.monotonic() - self._last_load >= self.load_interval:
+                    self._load(seal=True)
+            except Exception as e:
+                logger.error(f"Audit sink error: {str(e)}")
+
+    def _segments(self, state: str) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, f'audit-*.{state}')))
+
+    def _parse(self, lines: Iterable[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Entries of segment lines, with created_at parsed, and the lines that do not parse"""
+        entries, bad = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                entries.append(dict(entry, created_at=datetime.fromisoformat(entry['created_at'])))
+            except (ValueError, TypeError, KeyError):
+                bad.append(line if line.endswith('\n') else line + '\n')
+        return entries, bad
+
+    def _write(self) -> None:
+        """Append the buffered entries to the open segment with one fsync"""
+        with self._condition:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+
+        with self._io_lock:
+            if self._segment is None:
+                name = f'audit-{os.getpid()}-{time.time_ns()}.open'
+                self._segment = os.path.join(self.directory, name)
+            with open(self._segment, 'a') as f:
+                f.write(''.join(json.dumps(entry, default=str) + '\n' for entry in batch))
+                f.flush()
+                os.fsync(f.fileno())
+            self.counters['written'] += len(batch)
+            if os.path.getsize(self._segment) >= self.segment_max_bytes:
+                self._seal()
+
+    def _seal(self) -> None:
+        if self._segment and os.path.exists(self._segment):
+            os.rename(self._segment, self._segment[:-len('.open')] + '.jsonl')
+        self._segment = None
+
+    def _seal_abandoned(self) -> None:
+        """Seal open segments of workers that are no longer running, release stale loading claims"""
+        for path in self._segments('open'):
+            pid = int(os.path.basename(path).split('-')[1])
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                try:
+                    os.rename(path, path[:-len('.open')] + '.jsonl')
+                except FileNotFoundError:
+                    pass
+            except PermissionError:
+                pass
+
+        for path in self._segments('loading'):
+            try:
+                if time.time() - os.path.getmtime(path) > self.LOADING_LEASE:
+                    os.rename(path, path[:-len('.loading')] + '.jsonl')
+                    logger.warning(f"Reloading audit segment {path} abandoned by its loader")
+            except FileNotFoundError:
+                pass
+
+    def _load(self, seal: bool = False) -> None:
+        from models import db, AuditLog
+
+        with self._io_lock:
+            if seal:
+                self._seal()
+            self._seal_abandoned()
+        self._last_load = time.monotonic()
+
+        for path in self._segments('jsonl'):
+            claimed = path[:-len('.jsonl')] + '.loading'
+            try:
+                os.rename(path, claimed)
+                # The lease runs from the claim, not from the last write
+                os.utime(claimed)
+            except FileNotFoundError:
+                continue  # Another worker claimed it
+
+            with open(claimed, 'r') as f:
+                rows, bad = self._parse(f)
+
+            with self.app.app_context():
+                try:
+                    if rows:
+                        db.session.execute(insert(AuditLog), rows)
+                        adjust_count(db.session, AuditLog, len(rows))
+                        db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    os.rename(claimed, path)
+                    self.counters['failed_loads'] += 1
+                    logger.error(f"Error loading audit segment {path}: {str(e)}")
+                    return
+                finally:
+                    db.session.remove()
+            if bad:
+                # Kept aside rather than failing the segment on every retry
+                bad_path = os.path.join(self.directory, 'audit.bad')
+                with open(bad_path, 'a') as f:
+                    f.writelines(bad)
+                self.counters['quarantined'] += len(bad)
+                logger.warning(f"Moved {len(bad)} unreadable audit lines of {path} to {bad_path}")
+            os.remove(claimed)
+            self.counters['loaded'] += len(rows)
+
+audit_sink = AuditSink()
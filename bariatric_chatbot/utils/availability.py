@@ -0,0 +1,139 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+class AvailabilityGrid:
+    """
+    Booked slots of a set of doctors over a run of days.
+
+    Each doctor-day is a bitmap with bit i set when slot i is taken, so
+    "is this slot free" is a bit test and a day's free slots are the
+    clear bits of one integer. Doctor-days without appointments are
+    simply absent from `busy`.
+    """
+
+    def __init__(self, engine: 'AvailabilityEngine', doctor_ids: Iterable[int], start: date, days: int,
+                 busy: Dict[Tuple[int, date], int]):
+        self.engine = engine
+        self.doctor_ids = tuple(doctor_ids)
+        self.start = start
+        self.days = days
+        self.busy = busy
+
+    @property
+    def dates(self) -> List[date]:
+        return [self.start + timedelta(days=offset) for offset in range(self.days)]
+
+    def busy_mask(self, doctor_id: int, day: date) -> int:
+        return self.busy.get((doctor_id, day), 0)
+
+    def free_slots(self, doctor_id: int, day: date) -> List[datetime]:
+        """Start times of the doctor's free slots on `day`"""
+        busy = self.busy_mask(doctor_id, day)
+        return [start for index, start in enumerate(self.engine.slot_times(day)) if not busy >> index & 1]
+
+    def slots(self, doctor_id: int, day: date) -> List[dict]:
+        """Every slot of the day as {'time', 'available'}, the shape generate_appointment_slots returns"""
+        busy = self.busy_mask(doctor_id, day)
+        return [{'time': start, 'available': not busy >> index & 1}
+                for index, start in enumerate(self.engine.slot_times(day))]
+
+    def to_json(self) -> dict:
+        """Free slot times ('HH:MM') by doctor id and ISO date"""
+        engine = self.engine
+        labels = [start.strftime('%H:%M') for start in engine.slot_times(self.start)]
+        free = {}
+        for doctor_id in self.doctor_ids:
+            free[str(doctor_id)] = {
+                day.isoformat(): [label for index, label in enumerate(labels)
+                                  if not self.busy_mask(doctor_id, day) >> index & 1]
+                for day in self.dates
+            }
+        return {
+            'start': self.start.isoformat(),
+            'days': self.days,
+            'slot_minutes': engine.slot_minutes,
+            'free_slots': free
+        }
+
+class AvailabilityEngine:
+    """
+    Slot availability for many doctors and days from a single query.
+
+    Appointments occupy every slot their [start, start + duration) overlaps,
+    not only the one they start in. Cancelled appointments free their slots.
+    """
+
+    def __init__(self, day_start_hour: int = 9, day_end_hour: int = 17, slot_minutes: int = 30,
+                 max_minutes: int = 240):
+        self.day_start = time(day_start_hour)
+        self.slot_minutes = slot_minutes
+        self.slot_count = (day_end_hour - day_start_hour) * 60 // slot_minutes + 1
+        self.max_minutes = max_minutes
+
+    @classmethod
+    def from_config(cls, config) -> 'AvailabilityEngine':
+        return cls(config.get('APPOINTMENT_DAY_START_HOUR', 9), config.get('APPOINTMENT_DAY_END_HOUR', 17),
+                   config.get('APPOINTMENT_SLOT_MINUTES', 30), config.get('APPOINTMENT_MAX_MINUTES', 240))
+
+    def day_open(self, day: date) -> datetime:
+        return datetime.combine(day, self.day_start)
+
+    def slot_times(self, day: date) -> List[datetime]:
+        opens = self.day_open(day)
+        return [opens + timedelta(minutes=index * self.slot_minutes) for index in range(self.slot_count)]
+
+    def slot_mask(self, start: datetime, minutes: int, day: date) -> int:
+        """Bitmap of the slots of `day` that [start, start + minutes) overlaps"""
+        offset = (start - self.day_open(day)).total_seconds() / 60
+        first = max(0, int(offset // self.slot_minutes))
+        # Slot i covers [i * slot, (i + 1) * slot); the last one overlapped
+        # is the one the end falls into, unless the end is on its boundary
+        last = min(self.slot_count - 1, int(-(-(offset + minutes) // self.slot_minutes)) - 1)
+        if first > last:
+            return 0
+        return ((1 << (last - first + 1)) - 1) << first
+
+    def grid(self, doctor_ids: Iterable[int], start: date, days: int,
+             appointments: Iterable[Tuple[int, datetime, Optional[int]]]) -> AvailabilityGrid:
+        """Build the grid from (doctor_id, scheduled_time, duration_minutes) rows"""
+        doctor_ids = tuple(doctor_ids)
+        wanted = set(doctor_ids)
+        end = start + timedelta(days=days)
+        busy: Dict[Tuple[int, date], int] = {}
+        for doctor_id, scheduled_time, minutes in appointments:
+            if doctor_id not in wanted:
+                continue
+            minutes = minutes or self.slot_minutes
+            finish = scheduled_time + timedelta(minutes=minutes)
+            day = max(scheduled_time.date(), start)
+            while day < end and self.day_open(day) < finish:
+                mask = self.slot_mask(scheduled_time, minutes, day)
+                if mask:
+                    busy[doctor_id, day] = busy.get((doctor_id, day), 0) | mask
+                day += timedelta(days=1)
+        return AvailabilityGrid(self, doctor_ids, start, days, busy)
+
+    def load(self, session, doctor_ids: Iterable[int], start: date, days: int) -> AvailabilityGrid:
+        """Availability of `doctor_ids` for `days` days from `start`, in one query"""
+        from models import Appointment
+
+        doctor_ids = tuple(doctor_ids)
+        if not doctor_ids or days <= 0:
+            return AvailabilityGrid(self, doctor_ids, start, max(days, 0), {})
+        window_start = self.day_open(start) - timedelta(minutes=self.max_minutes)
+        window_end = self.slot_times(start + timedelta(days=days - 1))[-1] + timedelta(minutes=self.slot_minutes)
+        # Only the three columns the bitmaps need: no ORM objects for a month of appointments
+        rows = session.query(Appointment.doctor_id, Appointment.scheduled_time, Appointment.duration_minutes).filter(
+            Appointment.doctor_id.in_(doctor_ids),
+            Appointment.scheduled_time > window_start,
+            Appointment.scheduled_time < window_end,
+            Appointment.status != 'cancelled'
+        )
+        return self.grid(doctor_ids, start, days, rows)
+
+def doctor_ids(session) -> List[int]:
+    """Ids of the active users with the doctor role"""
+    from models import User, Role
+
+    rows = session.query(User.id).join(User.roles).filter(Role.name == 'doctor', User.is_active.is_(True))
+    return [doctor_id for (doctor_id,) in rows.order_by(User.id)]
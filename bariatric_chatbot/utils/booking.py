@@ -0,0 +1,191 @@
+import bisect
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from utils.generations import bump_generation, read_generation
+
+logger = logging.getLogger(__name__)
+
+def schedule_generation(doctor_id: int) -> str:
+    """Generation of one doctor's schedule, bumped by every booking, cancellation or reschedule"""
+    return f'schedule:{doctor_id}'
+
+class BookingError(ValueError):
+    """The booking request itself is invalid"""
+
+class BookingConflict(Exception):
+    """The requested time overlaps an existing appointment of the doctor"""
+
+    def __init__(self, doctor_id: int, appointment_id: int):
+        super().__init__(f'Doctor {doctor_id} is already booked (appointment {appointment_id})')
+        self.doctor_id = doctor_id
+        self.appointment_id = appointment_id
+
+class DoctorIntervals:
+    """
+    One doctor's appointments as (start, end, id), sorted by start.
+
+    An overlap with [start, end) can only come from an appointment
+    starting in (start - longest duration, end), so a conflict check is
+    two bisections plus the few appointments in that range.
+    """
+    __slots__ = ('version', 'starts', 'intervals')
+
+    def __init__(self, version: int, intervals: List[Tuple[datetime, datetime, int]]):
+        self.version = version
+        self.intervals = sorted(intervals)
+        self.starts = [interval[0] for interval in self.intervals]
+
+    def conflict(self, start: datetime, end: datetime, max_minutes: int) -> Optional[int]:
+        """Id of an appointment overlapping [start, end), if any"""
+        low = bisect.bisect_right(self.starts, start - timedelta(minutes=max_minutes))
+        high = bisect.bisect_left(self.starts, end)
+        for other_start, other_end, appointment_id in self.intervals[low:high]:
+            if other_end > start:
+                return appointment_id
+        return None
+
+    def add(self, start: datetime, end: datetime, appointment_id: int) -> None:
+        index = bisect.bisect_left(self.intervals, (start, end, appointment_id))
+        self.intervals.insert(index, (start, end, appointment_id))
+        self.starts.insert(index, start)
+
+class BookingService:
+    """
+    Books appointments without overlaps, across all gunicorn workers.
+
+    Each booking first bumps the doctor's schedule generation. That UPDATE
+    locks the doctor's generation row (on SQLite it takes the database
+    write lock), so bookings for one doctor are serialized until commit,
+    in this worker and every other. The bumped value also tells whether
+    this worker's interval index for the doctor is current: if it was
+    built at the previous value, nothing changed since and the conflict
+    check runs in memory; otherwise the doctor's upcoming appointments
+    are reloaded in one indexed query under the same lock.
+    """
+
+    def __init__(self):
+        self.max_minutes = 240
+        self._schedules: Dict[int, DoctorIntervals] = {}
+        self._lock = threading.Lock()
+        self._stats = {'booked': 0, 'conflicts': 0, 'index_hits': 0, 'index_loads': 0}
+
+    def init_app(self, app):
+        self.max_minutes = app.config['APPOINTMENT_MAX_MINUTES']
+
+    def book(self, session, doctor_id: int, user_id: int, scheduled_time: datetime, duration_minutes: int,
+             appointment_type: str, notes: Optional[str] = None, now: Optional[datetime] = None):
+        """
+        Create and commit an appointment; raises BookingConflict if the doctor is busy.
+
+        The session's transaction is committed on success and rolled back on
+        any error.
+        """
+        from models import Appointment
+
+        now = now or datetime.utcnow()
+        if not 0 < duration_minutes <= self.max_minutes:
+            raise BookingError(f'Duration must be between 1 and {self.max_minutes} minutes')
+        if scheduled_time < now:
+            raise BookingError('Appointments cannot be booked in the past')
+        end = scheduled_time + timedelta(minutes=duration_minutes)
+
+        name = schedule_generation(doctor_id)
+        try:
+            # Lock first: everything read below is final until commit
+            self._lock_schedule(session, name)
+            version = read_generation(session, name)
+            schedule = self._schedule(session, doctor_id, version, now)
+
+            conflicting = schedule.conflict(scheduled_time, end, self.max_minutes)
+            if conflicting is not None:
+                raise BookingConflict(doctor_id, conflicting)
+
+            appointment = Appointment(user_id=user_id, doctor_id=doctor_id, scheduled_time=scheduled_time,
+                                      duration_minutes=duration_minutes, appointment_type=appointment_type,
+                                      status='scheduled', notes=notes)
+            session.add(appointment)
+            session.flush()
+            appointment_id = appointment.id
+            session.commit()
+        except BookingConflict:
+            session.rollback()
+            with self._lock:
+                self._stats['conflicts'] += 1
+            raise
+        except Exception:
+            session.rollback()
+            raise
+
+        with self._lock:
+            # Unless another booking reloaded the index meanwhile, it is now current at `version`
+            if schedule.version == version - 1:
+                schedule.add(scheduled_time, end, appointment_id)
+                schedule.version = version
+            self._stats['booked'] += 1
+        return appointment
+
+    def _lock_schedule(self, session, name: str) -> None:
+        try:
+            bump_generation(session, name)
+        except IntegrityError:
+            # The doctor's first booking raced another one to create the row; it exists now
+            session.rollback()
+            bump_generation(session, name)
+
+    def _schedule(self, session, doctor_id: int, version: int, now: datetime) -> DoctorIntervals:
+        """The doctor's interval index as of `version`, which this transaction just bumped"""
+        from models import Appointment
+
+        with self._lock:
+            schedule = self._schedules.get(doctor_id)
+            if schedule is not None and schedule.version == version - 1:
+                self._stats['index_hits'] += 1
+                return schedule
+
+        rows = session.query(Appointment.id, Appointment.scheduled_time, Appointment.duration_minutes).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.scheduled_time > now - timedelta(minutes=self.max_minutes),
+            Appointment.status != 'cancelled'
+        )
+        schedule = DoctorIntervals(version - 1, [
+            (start, start + timedelta(minutes=minutes or 30), appointment_id)
+            for appointment_id, start, minutes in rows
+        ])
+        with self._lock:
+            self._schedules[doctor_id] = schedule
+            self._stats['index_loads'] += 1
+        return schedule
+
+    def set_status(self, session, appointment, status: str) -> None:
+        """
+        Change an appointment's status inside the caller's transaction.
+
+        Locks and bumps the doctor's schedule like a booking, so every
+        worker's index for the doctor is reloaded after the commit. A
+        cancelled appointment being reinstated is checked against the
+        schedule again; raises BookingConflict if its time was taken since.
+        """
+        if status == appointment.status:
+            return
+        if appointment.doctor_id is not None:
+            name = schedule_generation(appointment.doctor_id)
+            self._lock_schedule(session, name)
+            if appointment.status == 'cancelled':
+                schedule = self._schedule(session, appointment.doctor_id, read_generation(session, name),
+                                          datetime.utcnow())
+                end = appointment.scheduled_time + timedelta(minutes=appointment.duration_minutes or 30)
+                conflicting = schedule.conflict(appointment.scheduled_time, end, self.max_minutes)
+                if conflicting is not None:
+                    raise BookingConflict(appointment.doctor_id, conflicting)
+        appointment.status = status
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, doctors_indexed=len(self._schedules))
+
+booking_service = BookingService()
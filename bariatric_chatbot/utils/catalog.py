@@ -0,0 +1,85 @@
+import gzip
+import json
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+class CatalogResource:
+    """One JSON document of the catalogue, encoded, compressed and tagged once"""
+    __slots__ = ('body', 'etag', 'gzipped', 'gzip_etag')
+
+    # Below this size gzip saves less than the header costs
+    GZIP_MIN_SIZE = 512
+
+    def __init__(self, document: Any):
+        self.body = json.dumps(document, sort_keys=True, default=str).encode('utf-8')
+        # Strong validator from the representation's content; the gzip variant
+        # is a different representation and needs its own
+        self.etag = hashlib.sha1(self.body).hexdigest()[:16]
+        if len(self.body) >= self.GZIP_MIN_SIZE:
+            self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+            self.gzip_etag = f'{self.etag}-gz'
+        else:
+            self.gzipped = self.gzip_etag = None
+
+class Catalog:
+    """
+    The surgery and diet catalogue of one knowledge snapshot, as JSON resources.
+
+    Every document is serialized when the snapshot is first served rather
+    than per request; ETags are digests of the documents, so an item whose
+    content didn't change keeps its ETag across knowledge reloads.
+    """
+
+    def __init__(self, knowledge):
+        self.knowledge = knowledge
+        self.version = knowledge.version
+        self.resources: Dict[Tuple[str, ...], CatalogResource] = {}
+
+        surgery_types = []
+        diet_plans = []
+        for key, info in knowledge.surgery_types.items():
+            document = {field: value for field, value in info.items() if field != 'diet_plans'}
+            document['key'] = key
+            document['diet_phases'] = sorted(info.get('diet_plans') or {})
+            surgery_types.append(document)
+            self.resources[('surgery-types', key)] = CatalogResource(document)
+
+            for phase, plan in (info.get('diet_plans') or {}).items():
+                plan_document = dict(plan, surgery_type=key, phase=phase)
+                diet_plans.append(plan_document)
+                self.resources[('diet-plans', key, phase)] = CatalogResource(plan_document)
+
+        self.resources[('surgery-types',)] = CatalogResource({'version': self.version, 'surgery_types': surgery_types})
+        self.resources[('diet-plans',)] = CatalogResource({
+            'version': self.version,
+            'diet_plans': diet_plans,
+            'phases': knowledge.diet_phases
+        })
+
+    def resource(self, *path: str) -> Optional[CatalogResource]:
+        return self.resources.get(path)
+
+    def diet_plan(self, surgery_type: str, phase: str) -> Optional[Dict[str, Any]]:
+        """The diet plan of one procedure and phase, by surgery key"""
+        info = self.knowledge.surgery_types.get(surgery_type)
+        if info is None:
+            return None
+        return (info.get('diet_plans') or {}).get(phase)
+
+_current: Optional[Catalog] = None
+_lock = threading.Lock()
+
+def current_catalog() -> Catalog:
+    """Catalog of the chatbot's current knowledge snapshot, built once per snapshot"""
+    global _current
+    from utils.chatbot_logic import chatbot
+
+    knowledge = chatbot.knowledge
+    catalog = _current
+    if catalog is None or catalog.knowledge is not knowledge:
+        with _lock:
+            if _current is None or _current.knowledge is not knowledge:
+                _current = Catalog(knowledge)
+            catalog = _current
+    return catalog
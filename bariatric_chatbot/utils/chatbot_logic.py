@@ -1,13 +1,401 @@
+import os
 import re
+import json
+import hashlib
 from datetime import datetime
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 
+from utils.retrieval import RetrievalIndex, knowledge_sources
+from utils.spelling import WORD_PATTERN, SpellingCorrector
+
 logger = logging.getLogger(__name__)
 
+# Intent keywords in priority order: when a message mentions keywords of
+# several intents, the intent listed first wins. surgery_info comes last
+# because nearly every question mentions surgery or names a procedure;
+# procedure names are picked up as entities to narrow the other answers.
+# Keywords match whole words only, so plurals are listed alongside the singular
+INTENT_KEYWORDS = (
+    ('greeting', ('hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening', 'start')),
+    ('cost_info', ('cost', 'costs', 'price', 'prices', 'expensive', 'payment', 'payments', 'insurance',
+                   'afford')),
+    ('requirements_info', ('requirement', 'requirements', 'qualify', 'qualified', 'eligible', 'eligibility',
+                           'bmi')),
+    ('diet_info', ('diet', 'diets', 'eat', 'eating', 'food', 'foods', 'nutrition', 'meal', 'meals')),
+    ('appointment_info', ('appointment', 'appointments', 'schedule', 'scheduled', 'scheduling', 'book',
+                          'booking', 'visit', 'visits', 'consult', 'consultation', 'consultations', 'meet',
+                          'meeting', 'meetings')),
+    ('risks_info', ('risk', 'risks', 'complication', 'complications', 'danger', 'dangers', 'dangerous', 'safe',
+                    'safety', 'side effect', 'side effects')),
+    ('surgery_info', ('surgery', 'surgeries', 'procedure', 'procedures', 'bypass', 'bypasses', 'sleeve',
+                      'sleeves', 'types', 'options')),
+)
+
+def _trie_pattern(words) -> str:
+    """
+    Build a regex alternation shaped like a prefix trie, so the engine
+    dispatches on one character at a time instead of retrying every keyword.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A word may end here, so the rest of the branch is optional
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+class IntentMatcher:
+    """
+    Finds intent keywords in a single pass over a message.
+
+    All keywords are compiled into one trie-shaped alternation anchored on word
+    boundaries, so "hi" matches "hi there" but neither "this" nor "his";
+    plurals match only where the keyword table lists them. The
+    highest-priority intent among the matches wins.
+    """
+
+    def __init__(self, intent_keywords):
+        self.intents = [intent for intent, _ in intent_keywords]
+        self._rank = {}
+        for rank, (intent, keywords) in enumerate(intent_keywords):
+            for keyword in keywords:
+                self._rank.setdefault(keyword, rank)
+
+        self._pattern = re.compile(r'\b(' + _trie_pattern(self._rank) + r')\b')
+
+    def match(self, message: str) -> Optional[str]:
+        """Return the highest-priority intent mentioned in a lowercased message"""
+        best = None
+        for found in self._pattern.finditer(message):
+            rank = self._rank[found.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if rank == 0:
+                    break
+        return self.intents[best] if best is not None else None
+
+APPOINTMENT_RESPONSE = ("To schedule an appointment, we'll need the following information:\n\n"
+                        "1. Your basic information (name, contact details)\n"
+                        "2. Preferred appointment dates and times\n"
+                        "3. Type of appointment (initial consultation, follow-up, etc.)\n"
+                        "4. Any specific concerns you'd like to discuss\n\n"
+                        "Would you like to proceed with scheduling an appointment?")
+
+def content_version(surgery_types: Dict[str, Any], diet_phases: Dict[str, Any]) -> str:
+    """Stable hash of the knowledge data the static responses are rendered from"""
+    payload = json.dumps([surgery_types, diet_phases], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+# Diet topics a question can narrow an answer down to, with their labels and bullets
+DIET_TOPICS = {
+    'allowed_foods': ('Allowed foods', '✓'),
+    'restricted_foods': ('Restricted foods', '⛔'),
+    'guidelines': ('Guidelines', '•'),
+    'supplements': ('Supplements', '•'),
+}
+
+TOPIC_KEYWORDS = {
+    'allowed_foods': ('allowed', 'can i eat', 'can i have', 'can i drink', 'what to eat', 'ok to eat'),
+    'restricted_foods': ('avoid', 'restricted', 'not allowed', "can't eat", 'cannot eat', "can't have",
+                         'forbidden', 'off limits'),
+    'guidelines': ('guideline', 'guidelines', 'tips', 'rules'),
+    'supplements': ('supplement', 'supplements', 'vitamin', 'vitamins'),
+}
+
+SURGERY_ALIASES = {
+    'gastric_bypass': ('bypass', 'roux-en-y', 'rny'),
+    'sleeve_gastrectomy': ('sleeve', 'gastric sleeve', 'vsg'),
+}
+
+# Words too common in procedure names to identify one on their own
+GENERIC_NAME_WORDS = {'surgery', 'procedure', 'operation', 'gastric', 'bariatric', 'weight', 'loss',
+                      'the', 'and', 'of', 'with'}
+
+# Words that point back at the previous answer: "how much does it cost?", "tell me more"
+FOLLOW_UP_PATTERN = re.compile(r"\b(it|its|it's|that|this|those|these|them|they|one|ones|more|what about|how about)\b")
+
+# Elliptical questions that ask the previous question again about something else: "and the sleeve?"
+CONTINUATION_PATTERN = re.compile(r"^(and|what about|how about|same for)\b")
+
+# Intents whose answers can be narrowed by entities, and so continued by a follow-up
+CONTEXT_INTENTS = ('surgery_info', 'cost_info', 'requirements_info', 'diet_info', 'risks_info')
+
+NUMBER_WORDS = {'1': ('one', 'first'), '2': ('two', 'second'), '3': ('three', 'third'), '4': ('four', 'fourth')}
+
+def _phase_aliases(phase: str) -> set:
+    """Ways patients refer to a diet phase key such as 'pre_op' or 'post_op_phase2'"""
+    aliases = {phase.replace('_', ' '), phase.replace('_', '-')}
+    if phase.startswith('pre'):
+        aliases |= {'pre op', 'pre-op', 'preop', 'pre-operative', 'before surgery', 'before the surgery',
+                    'before the operation'}
+    number = re.search(r'phase_?(\d+)$', phase)
+    if number:
+        n = number.group(1)
+        aliases |= {f'phase {n}', f'phase{n}', f'stage {n}'}
+        for word in NUMBER_WORDS.get(n, ()):
+            aliases |= {f'phase {word}', f'{word} phase', f'stage {word}', f'{word} stage'}
+    return aliases
+
+class EntityExtractor:
+    """
+    Finds surgery type, diet phase and diet topic mentions in one pass.
+
+    Aliases are derived from the knowledge data (procedure names, phase keys)
+    plus a few curated synonyms, so new catalogue entries are recognised
+    without code changes.
+    """
+
+    def __init__(self, surgery_types: Dict[str, Any], diet_phases: Dict[str, Any]):
+        self._slots = {}
+
+        name_words = {}
+        for key, info in surgery_types.items():
+            for word in re.findall(r'[a-z0-9-]+', info['name'].lower()):
+                name_words.setdefault(word, set()).add(key)
+
+        for key, info in surgery_types.items():
+            aliases = {info['name'].lower(), key.replace('_', ' ')}
+            aliases.update(SURGERY_ALIASES.get(key, ()))
+            aliases.update(word for word, keys in name_words.items()
+                           if keys == {key} and len(word) > 3 and not word.isdigit()
+                           and word not in GENERIC_NAME_WORDS)
+            for alias in aliases:
+                self._slots.setdefault(alias, ('surgery_type', key))
+
+        phases = set(diet_phases)
+        for info in surgery_types.values():
+            phases.update(info.get('diet_plans', {}))
+        for phase in sorted(phases):
+            for alias in _phase_aliases(phase):
+                self._slots.setdefault(alias, ('diet_phase', phase))
+
+        for topic, keywords in TOPIC_KEYWORDS.items():
+            for keyword in keywords:
+                self._slots.setdefault(keyword, ('topic', topic))
+
+        self._order = {key: index for index, key in enumerate(list(surgery_types) + sorted(phases))}
+        self._pattern = re.compile(r'\b(' + _trie_pattern(self._slots) + r')\b')
+
+    @property
+    def aliases(self) -> List[str]:
+        return list(self._slots)
+
+    def extract(self, message: str) -> Dict[str, Any]:
+        """
+        Return the entities in a lowercased message, e.g.
+        {'surgery_type': ('sleeve_gastrectomy',), 'diet_phase': ('pre_op',), 'topic': 'restricted_foods'}
+        """
+        found = {}
+        for match in self._pattern.finditer(message):
+            slot, value = self._slots[match.group(1)]
+            if slot == 'topic':
+                found.setdefault('topic', value)
+            else:
+                found.setdefault(slot, set()).add(value)
+
+        for slot in ('surgery_type', 'diet_phase'):
+            if slot in found:
+                # Catalogue order, so the same mentions always give the same cache key
+                found[slot] = tuple(sorted(found[slot], key=self._order.get))
+        return found
+
+def _render_surgery_info(surgery_types: Dict[str, Any]) -> str:
+    lines = ["Here are the main types of bariatric surgery we offer:\n"]
+    for info in surgery_types.values():
+        lines.append(f"📍 {info['name']}:")
+        lines.append(f"   {info['description']}\n")
+    lines.append("Would you like to know more about a specific type of surgery?")
+    return '\n'.join(lines)
+
+def _render_surgery_detail(surgery_types: Dict[str, Any]) -> str:
+    lines = []
+    for info in surgery_types.values():
+        lines.append(f"📍 {info['name']}:")
+        lines.append(f"   {info['description']}")
+        if info.get('recovery_time'):
+            lines.append(f"   Recovery time: {info['recovery_time']}")
+        lines.append("")
+    lines.append("Would you like to know about the cost, requirements or risks?")
+    return '\n'.join(lines)
+
+def _render_cost_info(surgery_types: Dict[str, Any],
+                      header: str = "Here are the typical cost ranges for different bariatric procedures:") -> str:
+    lines = [header + "\n"]
+    for info in surgery_types.values():
+        cost_range = info.get('cost_range') or {}
+        if 'min' not in cost_range or 'max' not in cost_range:
+            continue
+        lines.append(f"📍 {info['name']}:")
+        lines.append(f"   ${cost_range['min']:,} - ${cost_range['max']:,}\n")
+    lines.append("Note: Final costs may vary based on your specific case, location, and insurance coverage. "
+                 "Would you like to discuss financing options or insurance coverage?")
+    return '\n'.join(lines)
+
+def _render_requirements_info(surgery_types: Dict[str, Any]) -> str:
+    lines = ["General requirements for bariatric surgery include:\n"]
+    # Using the first surgery type's requirements as they're generally similar
+    first = next(iter(surgery_types.values()), {})
+    for req in first.get('requirements', []):
+        lines.append(f"✓ {req}")
+    lines.append("\nWould you like to schedule an evaluation to check your eligibility?")
+    return '\n'.join(lines)
+
+def _render_requirements_detail(surgery_types: Dict[str, Any]) -> str:
+    lines = []
+    for info in surgery_types.values():
+        lines.append(f"Requirements for {info['name']} include:\n")
+        lines.extend(f"✓ {req}" for req in info.get('requirements', []))
+        lines.append("")
+    lines.append("Would you like to schedule an evaluation to check your eligibility?")
+    return '\n'.join(lines)
+
+def _topic_items(info: Dict[str, Any], topic: str) -> List[str]:
+    items = info.get(topic) or []
+    if isinstance(items, dict):
+        return [f"{name.replace('_', ' ').title()}: {value}" for name, value in items.items()]
+    return items
+
+def _render_diet_info(diet_phases: Dict[str, Any],
+                      topics: Tuple[str, ...] = ('allowed_foods', 'restricted_foods'),
+                      header: str = "Here's an overview of the diet phases:") -> str:
+    lines = [header + "\n"]
+    for phase, info in diet_phases.items():
+        phase_name = phase.replace('_', ' ').title()
+        lines.append(f"📍 {phase_name} ({info['duration']}):")
+        for topic in topics:
+            label, bullet = DIET_TOPICS[topic]
+            items = _topic_items(info, topic)
+            lines.append(f"   {label}:")
+            lines.extend(f"   {bullet} {item}" for item in items)
+            if not items:
+                lines.append("   None listed for this phase")
+        lines.append("")
+    lines.append("Would you like more specific information about any phase?")
+    return '\n'.join(lines)
+
+def _render_risks_info(surgery_types: Dict[str, Any],
+                       header: str = "Here are the potential risks and complications for different procedures:") -> str:
+    lines = [header + "\n"]
+    for info in surgery_types.values():
+        lines.append(f"📍 {info['name']}:")
+        lines.extend(f"   ⚠ {risk}" for risk in info['risks'])
+        lines.append("")
+    lines.append("Remember that our team takes every precaution to minimize these risks. "
+                 "Would you like to discuss these in detail with a healthcare provider?")
+    return '\n'.join(lines)
+
+def _render_passages(passages: List[Tuple[float, str, str]]) -> str:
+    lines = ["Here's what I found in our guidelines:\n"]
+    for _, label, text in passages:
+        lines.append(f"📍 {label}:")
+        lines.append(f"   • {text}\n")
+    lines.append("If that doesn't answer your question, please rephrase it or ask our care team.")
+    return '\n'.join(lines)
+
+class KnowledgeSnapshot:
+    """
+    Immutable bundle of knowledge data and the responses rendered from it.
+
+    Responses depend only on the data, so they are rendered once per
+    content version instead of on every request. Answers narrowed down to
+    particular entities are rendered from just that slice of the data on
+    first use and cached alongside. Free-form questions are searched in a
+    BM25 index over the same data, which reuses the previous snapshot's
+    index for records that did not change.
+    """
+    __slots__ = ('version', 'surgery_types', 'diet_phases', 'responses', 'entities', 'spelling', 'retrieval',
+                 '_targeted')
+
+    # Upper bound on cached entity-specific answers per snapshot
+    MAX_TARGETED = 1024
+
+    def __init__(self, version: str, surgery_types: Dict[str, Any], diet_phases: Dict[str, Any],
+                 previous: Optional['KnowledgeSnapshot'] = None):
+        self.version = version
+        self.surgery_types = surgery_types
+        self.diet_phases = diet_phases
+        self.responses = {
+            'surgery_info': _render_surgery_info(surgery_types),
+            'cost_info': _render_cost_info(surgery_types),
+            'requirements_info': _render_requirements_info(surgery_types),
+            'diet_info': _render_diet_info(diet_phases),
+            'risks_info': _render_risks_info(surgery_types),
+        }
+        self.entities = EntityExtractor(surgery_types, diet_phases)
+        # Typos are corrected towards the words the intent keywords and entity aliases are made of
+        phrases = [keyword for _, keywords in INTENT_KEYWORDS for keyword in keywords] + self.entities.aliases
+        self.spelling = SpellingCorrector({word for phrase in phrases for word in WORD_PATTERN.findall(phrase)})
+        self.retrieval = RetrievalIndex(knowledge_sources(surgery_types, diet_phases),
+                                        previous.retrieval if previous else None)
+        self._targeted = {}
+
+    def response(self, intent: str, entities: Dict[str, Any]) -> str:
+        """The answer for an intent, narrowed to the entities relevant to it"""
+        surgeries = entities.get('surgery_type', ())
+        if intent == 'diet_info':
+            key = (intent, surgeries[:1], entities.get('diet_phase', ()), entities.get('topic'))
+        else:
+            key = (intent, surgeries)
+        if not any(key[1:]):
+            return self.responses[intent]
+
+        message = self._targeted.get(key)
+        if message is None:
+            message = self._render_targeted(*key)
+            if len(self._targeted) < self.MAX_TARGETED:
+                self._targeted[key] = message
+        return message
+
+    def _render_targeted(self, intent, surgeries, phases=(), topic=None) -> str:
+        selected = {key: self.surgery_types[key] for key in surgeries}
+        if intent == 'surgery_info':
+            return _render_surgery_detail(selected)
+        if intent == 'cost_info':
+            return _render_cost_info(selected, header="Here is the typical cost range:")
+        if intent == 'requirements_info':
+            return _render_requirements_detail(selected)
+        if intent == 'risks_info':
+            return _render_risks_info(selected, header="Here are the potential risks and complications:")
+
+        # diet_info: prefer the procedure's own plan, else the overview across procedures
+        header = "Here's the diet information you asked about:"
+        plans = self.diet_phases
+        if surgeries and self.surgery_types[surgeries[0]].get('diet_plans'):
+            plans = self.surgery_types[surgeries[0]]['diet_plans']
+            header = f"Here's the diet for {self.surgery_types[surgeries[0]]['name']}:"
+        if phases:
+            plans = {phase: plans[phase] for phase in phases if phase in plans} or plans
+        topics = (topic,) if topic else ('allowed_foods', 'restricted_foods')
+        return _render_diet_info(plans, topics=topics, header=header)
+
 class ChatbotLogic:
+    # Passages shown for a question no intent matched
+    SEARCH_RESULTS = 3
+
     def __init__(self):
-        self.surgery_types = {
+        self.intent_matcher = IntentMatcher(INTENT_KEYWORDS)
+        self.classifier = None
+        self.classifier_threshold = 0.6
+        self._handlers = {
+            'surgery_info': self._get_surgery_info,
+            'cost_info': self._get_cost_info,
+            'requirements_info': self._get_requirements_info,
+            'diet_info': self._get_diet_info,
+            'appointment_info': self._get_appointment_info,
+            'risks_info': self._get_risks_info,
+        }
+
+        surgery_types = {
             'gastric_bypass': {
                 'name': 'Gastric Bypass Surgery',
                 'description': 'A surgical procedure that creates a small pouch from the stomach and connects it directly to the small intestine.',
@@ -48,7 +436,7 @@ class ChatbotLogic:
             }
         }
         
-        self.diet_phases = {
+        diet_phases = {
             'pre_op': {
                 'duration': '2 weeks before surgery',
                 'allowed_foods': [
@@ -95,15 +483,86 @@ class ChatbotLogic:
             }
         }
 
-    def process_message(self, message: str) -> Dict[str, Any]:
+        self.load_knowledge(surgery_types, diet_phases)
+
+    def use_classifier(self, classifier, threshold: float = 0.6) -> None:
+        """
+        Answer with a statistical intent classifier, falling back to keyword
+        matching when its best guess is 'unknown' or below `threshold`.
+        """
+        self.classifier = classifier
+        self.classifier_threshold = threshold
+
+    def process_message(self, message: str, context=None) -> Dict[str, Any]:
         """
         Process the user message and return an appropriate response
+
+        `context` is the conversation's ConversationState, if any; follow-ups
+        are answered from it and it is updated with this turn.
+        """
+        return self.process_batch([message], [context])[0]
+
+    def process_batch(self, messages: List[str], contexts=None) -> List[Dict[str, Any]]:
         """
+        Process several messages at once, classifying them in a single batch.
+
+        Responses are returned in the same order as the messages.
+        """
+        spelling = self.knowledge.spelling
+        messages = [spelling.correct(message.lower().strip()) for message in messages]
+        contexts = contexts or [None] * len(messages)
+
+        predictions = [None] * len(messages)
+        if self.classifier is not None:
+            try:
+                predictions = self.classifier.classify_batch(messages)
+            except Exception as e:
+                logger.error(f"Intent classifier failed, using keyword matching: {str(e)}")
+
+        responses = []
+        for message, prediction, context in zip(messages, predictions, contexts):
+            response = self._answer(message, prediction, context)
+            if context is not None:
+                intent = response['intent']
+                context.remember(None if intent in ('unknown', 'error') else intent, response.get('entities', {}))
+            responses.append(response)
+        return responses
+
+    def _answer(self, message: str, prediction: Optional[Tuple[str, float]], context=None) -> Dict[str, Any]:
         try:
-            message = message.lower().strip()
-            
-            # Check for greetings
-            if self._is_greeting(message):
+            intent, confidence = None, None
+            if prediction is not None:
+                predicted_intent, probability = prediction
+                if predicted_intent != 'unknown' and probability >= self.classifier_threshold:
+                    intent, confidence = predicted_intent, probability
+
+            if intent is None:
+                intent = self.intent_matcher.match(message)
+
+            # Hold on to one snapshot so a concurrent reload can't mix versions
+            knowledge = self.knowledge
+            entities = knowledge.entities.extract(message)
+            if context is not None and context.intent in CONTEXT_INTENTS:
+                intent, entities = self._follow_up(knowledge, message, intent, entities, context)
+            if intent in (None, 'surgery_info') and ('diet_phase' in entities or 'topic' in entities):
+                # "what should I avoid before surgery?", "what about phase 2?"
+                intent = 'diet_info'
+            elif intent is None and entities:
+                # "and the sleeve?"
+                intent = 'surgery_info'
+
+            if intent in ('surgery_info', 'diet_info'):
+                # "is coffee ok after bypass?": words the intents don't know
+                # about may be answered by a specific guideline instead
+                known = knowledge.spelling.words
+                unexplained = ' '.join(word for word in WORD_PATTERN.findall(message)
+                                       if word not in known and word[:-1] not in known
+                                       and word not in GENERIC_NAME_WORDS)
+                passages = knowledge.retrieval.search(unexplained, self.SEARCH_RESULTS, boost=message)
+                if passages:
+                    return self._search_response(passages)
+
+            if intent == 'greeting':
                 return {
                     'message': 'Hello! I\'m your bariatric surgery assistant. I can help you with information about:\n'
                               '1. Types of bariatric surgery\n'
@@ -114,32 +573,20 @@ class ChatbotLogic:
                               '6. Appointment scheduling\n'
                               'What would you like to know about?',
                     'intent': 'greeting',
-                    'confidence': 1.0
+                    'confidence': 1.0 if confidence is None else confidence
                 }
 
-            # Check for surgery type inquiries
-            if self._is_surgery_type_query(message):
-                return self._get_surgery_info(message)
-
-            # Check for cost inquiries
-            if self._is_cost_query(message):
-                return self._get_cost_info(message)
-
-            # Check for requirements/eligibility
-            if self._is_requirements_query(message):
-                return self._get_requirements_info(message)
-
-            # Check for diet plan inquiries
-            if self._is_diet_query(message):
-                return self._get_diet_info(message)
+            handler = self._handlers.get(intent)
+            if handler:
+                response = handler(knowledge, entities)
+                if confidence is not None:
+                    response['confidence'] = confidence
+                return response
 
-            # Check for appointment related queries
-            if self._is_appointment_query(message):
-                return self._get_appointment_info(message)
-
-            # Check for risks/complications queries
-            if self._is_risks_query(message):
-                return self._get_risks_info(message)
+            # No intent: look for the answer in the guidelines, foods and instructions
+            passages = knowledge.retrieval.search(message, self.SEARCH_RESULTS)
+            if passages:
+                return self._search_response(passages)
 
             # Default response for unrecognized queries
             return {
@@ -158,141 +605,137 @@ class ChatbotLogic:
                 'confidence': 0.0
             }
 
-    def _is_greeting(self, message: str) -> bool:
-        greetings = ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening', 'start']
-        return any(greeting in message for greeting in greetings)
+    def _follow_up(self, knowledge, message, intent, entities, context) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Fill in what a follow-up question leaves out from the previous answer"""
+        refers = FOLLOW_UP_PATTERN.search(message) is not None
+        if intent == 'surgery_info' and CONTINUATION_PATTERN.match(message):
+            # Only a procedure name matched, which the previous question applies to
+            intent = None
+        if intent is None:
+            if 'diet_phase' in entities or 'topic' in entities:
+                intent = 'diet_info'
+            elif entities or refers:
+                # "and the sleeve?", "tell me more about that one"
+                intent = context.intent
+            else:
+                return intent, entities
+        elif not refers:
+            return intent, entities
 
-    def _is_surgery_type_query(self, message: str) -> bool:
-        keywords = ['surgery', 'surgeries', 'procedure', 'bypass', 'sleeve', 'types', 'options']
-        return any(keyword in message for keyword in keywords)
+        # Knowledge may have been reloaded since; drop keys that are gone
+        carried = {}
+        surgeries = tuple(key for key in context.surgery_types if key in knowledge.surgery_types)
+        if surgeries:
+            carried['surgery_type'] = surgeries
+        if intent == 'diet_info':
+            # Phases and topics only carry over between diet questions
+            phases = tuple(phase for phase in context.diet_phases if phase in knowledge.diet_phases)
+            if phases:
+                carried['diet_phase'] = phases
+            if context.topic:
+                carried['topic'] = context.topic
 
-    def _is_cost_query(self, message: str) -> bool:
-        keywords = ['cost', 'price', 'expensive', 'payment', 'insurance', 'afford']
-        return any(keyword in message for keyword in keywords)
+        entities = {**carried, **entities}
+        if intent == 'surgery_info' and 'surgery_type' not in entities:
+            # "tell me more" after the overview: describe every procedure
+            entities['surgery_type'] = tuple(knowledge.surgery_types)
+        return intent, entities
 
-    def _is_requirements_query(self, message: str) -> bool:
-        keywords = ['requirement', 'qualify', 'eligible', 'eligibility', 'qualify', 'bmi']
-        return any(keyword in message for keyword in keywords)
+    @property
+    def surgery_types(self) -> Dict[str, Any]:
+        return self.knowledge.surgery_types
 
-    def _is_diet_query(self, message: str) -> bool:
-        keywords = ['diet', 'eat', 'food', 'nutrition', 'meal', 'eating']
-        return any(keyword in message for keyword in keywords)
+    @property
+    def diet_phases(self) -> Dict[str, Any]:
+        return self.knowledge.diet_phases
 
-    def _is_appointment_query(self, message: str) -> bool:
-        keywords = ['appointment', 'schedule', 'book', 'visit', 'consult', 'meet']
-        return any(keyword in message for keyword in keywords)
+    def load_knowledge(self, surgery_types: Dict[str, Any], diet_phases: Dict[str, Any]) -> bool:
+        """
+        Render the static responses for new knowledge data and swap them in.
 
-    def _is_risks_query(self, message: str) -> bool:
-        keywords = ['risk', 'complication', 'danger', 'safe', 'side effect']
-        return any(keyword in message for keyword in keywords)
+        Returns False without re-rendering when the content version is unchanged.
+        """
+        version = content_version(surgery_types, diet_phases)
+        current = getattr(self, 'knowledge', None)
+        if current is not None and current.version == version:
+            return False
 
-    def _get_surgery_info(self, message: str) -> Dict[str, Any]:
-        response = "Here are the main types of bariatric surgery we offer:\n\n"
-        
-        for surgery_type, info in self.surgery_types.items():
-            response += f"📍 {info['name']}:\n"
-            response += f"   {info['description']}\n\n"
-        
-        response += "Would you like to know more about a specific type of surgery?"
-        
-        return {
-            'message': response,
-            'intent': 'surgery_info',
-            'confidence': 0.9
-        }
+        # A single attribute assignment, so concurrent requests see either
+        # the old snapshot or the new one, never a mix of both
+        self.knowledge = KnowledgeSnapshot(version, surgery_types, diet_phases, current)
+        logger.info(f"Chatbot knowledge loaded (version {version}, "
+                    f"{self.knowledge.retrieval.rebuilt} search segments rebuilt)")
+        return True
 
-    def _get_cost_info(self, message: str) -> Dict[str, Any]:
-        response = "Here are the typical cost ranges for different bariatric procedures:\n\n"
-        
-        for surgery_type, info in self.surgery_types.items():
-            response += f"📍 {info['name']}:\n"
-            response += f"   ${info['cost_range']['min']:,} - ${info['cost_range']['max']:,}\n\n"
-        
-        response += ("Note: Final costs may vary based on your specific case, location, and insurance coverage. "
-                    "Would you like to discuss financing options or insurance coverage?")
-        
-        return {
-            'message': response,
-            'intent': 'cost_info',
+    def _respond(self, knowledge: KnowledgeSnapshot, intent: str, entities: Dict[str, Any]) -> Dict[str, Any]:
+        response = {
+            'message': knowledge.response(intent, entities),
+            'intent': intent,
             'confidence': 0.9
         }
+        if entities:
+            response['entities'] = entities
+        return response
 
-    def _get_requirements_info(self, message: str) -> Dict[str, Any]:
-        response = "General requirements for bariatric surgery include:\n\n"
-        
-        # Using the first surgery type's requirements as they're generally similar
-        requirements = self.surgery_types['gastric_bypass']['requirements']
-        
-        for req in requirements:
-            response += f"✓ {req}\n"
-        
-        response += "\nWould you like to schedule an evaluation to check your eligibility?"
-        
+    def _search_response(self, passages) -> Dict[str, Any]:
         return {
-            'message': response,
-            'intent': 'requirements_info',
-            'confidence': 0.9
+            'message': _render_passages(passages),
+            'intent': 'knowledge_search',
+            'confidence': 0.5
         }
 
-    def _get_diet_info(self, message: str) -> Dict[str, Any]:
-        response = "Here's an overview of the diet phases:\n\n"
-        
-        for phase, info in self.diet_phases.items():
-            phase_name = phase.replace('_', ' ').title()
-            response += f"📍 {phase_name} ({info['duration']}):\n"
-            response += "   Allowed foods:\n"
-            for food in info['allowed_foods']:
-                response += f"   ✓ {food}\n"
-            response += "   Restricted foods:\n"
-            for food in info['restricted_foods']:
-                response += f"   ⛔ {food}\n"
-            response += "\n"
-        
-        response += "Would you like more specific information about any phase?"
-        
-        return {
-            'message': response,
-            'intent': 'diet_info',
-            'confidence': 0.9
-        }
+    def _get_surgery_info(self, knowledge, entities) -> Dict[str, Any]:
+        return self._respond(knowledge, 'surgery_info', entities)
 
-    def _get_appointment_info(self, message: str) -> Dict[str, Any]:
-        response = ("To schedule an appointment, we'll need the following information:\n\n"
-                   "1. Your basic information (name, contact details)\n"
-                   "2. Preferred appointment dates and times\n"
-                   "3. Type of appointment (initial consultation, follow-up, etc.)\n"
-                   "4. Any specific concerns you'd like to discuss\n\n"
-                   "Would you like to proceed with scheduling an appointment?")
-        
+    def _get_cost_info(self, knowledge, entities) -> Dict[str, Any]:
+        return self._respond(knowledge, 'cost_info', entities)
+
+    def _get_requirements_info(self, knowledge, entities) -> Dict[str, Any]:
+        return self._respond(knowledge, 'requirements_info', entities)
+
+    def _get_diet_info(self, knowledge, entities) -> Dict[str, Any]:
+        return self._respond(knowledge, 'diet_info', entities)
+
+    def _get_appointment_info(self, knowledge, entities) -> Dict[str, Any]:
         return {
-            'message': response,
+            'message': APPOINTMENT_RESPONSE,
             'intent': 'appointment_info',
             'confidence': 0.9
         }
 
-    def _get_risks_info(self, message: str) -> Dict[str, Any]:
-        response = "Here are the potential risks and complications for different procedures:\n\n"
-        
-        for surgery_type, info in self.surgery_types.items():
-            response += f"📍 {info['name']}:\n"
-            for risk in info['risks']:
-                response += f"   ⚠ {risk}\n"
-            response += "\n"
-        
-        response += ("Remember that our team takes every precaution to minimize these risks. "
-                    "Would you like to discuss these in detail with a healthcare provider?")
-        
-        return {
-            'message': response,
-            'intent': 'risks_info',
-            'confidence': 0.9
-        }
+    def _get_risks_info(self, knowledge, entities) -> Dict[str, Any]:
+        return self._respond(knowledge, 'risks_info', entities)
 
 # Initialize the chatbot
 chatbot = ChatbotLogic()
 
-def process_message(message: str) -> Dict[str, Any]:
+def process_message(message: str, context=None) -> Dict[str, Any]:
     """
     Process a message using the chatbot logic
     """
-    return chatbot.process_message(message)
+    return chatbot.process_message(message, context)
+
+def process_batch(messages: List[str]) -> List[Dict[str, Any]]:
+    """
+    Process several messages using the chatbot logic
+    """
+    return chatbot.process_batch(messages)
+
+def load_classifier(path: str, threshold: float = 0.6) -> bool:
+    """
+    Load a trained intent classifier into the shared chatbot, if one exists.
+
+    Returns False (keeping keyword matching) when the artifact is missing or
+    the optional scikit-learn dependency is not installed.
+    """
+    if not path or not os.path.exists(path):
+        return False
+
+    try:
+        from utils.intent_classifier import IntentClassifier
+        chatbot.use_classifier(IntentClassifier.load(path), threshold)
+        logger.info(f"Intent classifier loaded from {path}")
+        return True
+    except Exception as e:
+        logger.error(f"Could not load intent classifier from {path}: {str(e)}")
+        return False
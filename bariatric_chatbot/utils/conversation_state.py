@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class ConversationState:
+    """
+    What the chatbot remembers between turns of one conversation.
+
+    Kept deliberately small: the last answered intent, the entities it was
+    narrowed to (as tuples of knowledge keys shared with the snapshot), and
+    a turn count. No message text is stored.
+    """
+    __slots__ = ('intent', 'surgery_types', 'diet_phases', 'topic', 'turns', 'last_seen')
+
+    def __init__(self, intent=None, surgery_types=(), diet_phases=(), topic=None, turns=0, last_seen=0.0):
+        self.intent = intent
+        self.surgery_types = surgery_types
+        self.diet_phases = diet_phases
+        self.topic = topic
+        self.turns = turns
+        self.last_seen = last_seen
+
+    @property
+    def entities(self) -> Dict[str, Any]:
+        entities = {}
+        if self.surgery_types:
+            entities['surgery_type'] = self.surgery_types
+        if self.diet_phases:
+            entities['diet_phase'] = self.diet_phases
+        if self.topic:
+            entities['topic'] = self.topic
+        return entities
+
+    def copy(self) -> 'ConversationState':
+        return ConversationState(self.intent, self.surgery_types, self.diet_phases, self.topic,
+                                 self.turns, self.last_seen)
+
+    def remember(self, intent: Optional[str], entities: Dict[str, Any]) -> None:
+        """Record one turn; unanswered turns keep the previous context"""
+        self.turns += 1
+        if intent is None:
+            return
+        self.intent = intent
+        self.surgery_types = entities.get('surgery_type', ())
+        self.diet_phases = entities.get('diet_phase', ())
+        self.topic = entities.get('topic')
+
+class MemoryStateBackend:
+    """
+    LRU of conversation states in this process, with an idle TTL.
+
+    States go in and come out as copies, so concurrent requests of one
+    conversation never change the same object.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[ConversationState]:
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return None
+            if state.last_seen < time.time() - self.ttl:
+                del self._states[key]
+                return None
+            self._states.move_to_end(key)
+            return state.copy()
+
+    def put(self, key: str, state: ConversationState) -> None:
+        now = time.time()
+        state.last_seen = now
+        with self._lock:
+            self._states[key] = state.copy()
+            self._states.move_to_end(key)
+            # The least recently used entries sit at the front
+            expired = now - self.ttl
+            while self._states:
+                oldest = next(iter(self._states.values()))
+                if len(self._states) <= self.max_size and oldest.last_seen >= expired:
+                    break
+                self._states.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+class SqliteStateBackend:
+    """
+    Conversation states in a local SQLite file shared by all workers on the host.
+
+    Each worker thread keeps its own connection. Expired and surplus rows
+    are pruned every PRUNE_EVERY writes rather than on each one.
+    """
+
+    PRUNE_EVERY = 500
+
+    def __init__(self, path: str, max_size: int, ttl: float):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS conversation_state ('
+                         'key TEXT PRIMARY KEY, intent TEXT, surgery_types TEXT, diet_phases TEXT, '
+                         'topic TEXT, turns INTEGER, last_seen REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_conversation_state_last_seen '
+                         'ON conversation_state (last_seen)')
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not cross a gunicorn fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[ConversationState]:
+        row = self._connect().execute(
+            'SELECT intent, surgery_types, diet_phases, topic, turns, last_seen FROM conversation_state '
+            'WHERE key = ? AND last_seen >= ?', (key, time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        intent, surgery_types, diet_phases, topic, turns, last_seen = row
+        return ConversationState(intent, tuple(json.loads(surgery_types)), tuple(json.loads(diet_phases)),
+                                 topic, turns, last_seen)
+
+    def put(self, key: str, state: ConversationState) -> None:
+        state.last_seen = time.time()
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO conversation_state VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, state.intent, json.dumps(state.surgery_types), json.dumps(state.diet_phases),
+             state.topic, state.turns, state.last_seen)
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self._prune(conn)
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        conn.execute('DELETE FROM conversation_state WHERE last_seen < ?', (time.time() - self.ttl,))
+        conn.execute(
+            'DELETE FROM conversation_state WHERE key IN (SELECT key FROM conversation_state '
+            'ORDER BY last_seen DESC LIMIT -1 OFFSET ?)', (self.max_size,)
+        )
+
+    def __len__(self) -> int:
+        return self._connect().execute('SELECT COUNT(*) FROM conversation_state').fetchone()[0]
+
+class ConversationStore:
+    """
+    Per-conversation chatbot state, keyed by user or session.
+
+    CONVERSATION_STATE_BACKEND selects 'sqlite' (a file at
+    CONVERSATION_STATE_PATH shared by all gunicorn workers on the host) or
+    'memory' (one worker, or sticky sessions).
+    """
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        max_size = app.config['CONVERSATION_STATE_MAX_SIZE']
+        ttl = app.config['CONVERSATION_STATE_TTL']
+        if app.config['CONVERSATION_STATE_BACKEND'] == 'sqlite':
+            self.backend = SqliteStateBackend(app.config['CONVERSATION_STATE_PATH'], max_size, ttl)
+        else:
+            self.backend = MemoryStateBackend(max_size, ttl)
+
+    def get(self, key: str) -> ConversationState:
+        """The conversation's state, or a fresh one"""
+        try:
+            return self.backend.get(key) or ConversationState()
+        except Exception as e:
+            logger.error(f"Error reading conversation state: {str(e)}")
+            return ConversationState()
+
+    def put(self, key: str, state: ConversationState) -> None:
+        try:
+            self.backend.put(key, state)
+        except Exception as e:
+            logger.error(f"Error saving conversation state: {str(e)}")
+
+conversation_store = ConversationStore()
@@ -0,0 +1,109 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import url_for
+from jinja2 import Template
+from werkzeug.routing import BuildError
+
+logger = logging.getLogger(__name__)
+
+# Subject of each email; its bodies are templates/email/<name>.txt and .html
+SUBJECTS = {
+    'appointment_confirmation': 'Appointment Confirmation',
+    'appointment_reminder': 'Appointment Reminder',
+    'reset_password': 'Reset Your Password',
+}
+
+class EmailRenderer:
+    """
+    Renders the text and HTML bodies of the app's emails from templates
+    compiled once per process.
+
+    render_template() looks each template (and base_email.html, through
+    extends) up again on every call, checking the files for changes when
+    templates auto-reload, and runs the context processors. Here both
+    bodies are compiled on first use in an overlay of the app's Jinja
+    environment that never reloads, and a batch is rendered with the
+    values its messages share (such as `now`) computed once.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._env = None
+        self._templates: Dict[str, Tuple[Template, Template]] = {}
+        self._lock = threading.Lock()
+        self.counters = {'rendered': 0, 'errors': 0}
+
+    def init_app(self, app):
+        self.app = app
+        self._env = None
+        self._templates = {}
+
+    def templates(self, name: str) -> Tuple[Template, Template]:
+        """The compiled text and HTML templates of email `name`"""
+        pair = self._templates.get(name)
+        if pair is None:
+            with self._lock:
+                if self._env is None:
+                    # Same loader, filters and globals as render_template(); its own cache
+                    self._env = self.app.jinja_env.overlay(auto_reload=False, cache_size=50)
+                pair = (self._env.get_template(f'email/{name}.txt'), self._env.get_template(f'email/{name}.html'))
+                self._templates[name] = pair
+        return pair
+
+    def render(self, name: str, contexts: Iterable[Dict[str, Any]]) -> List[Optional[Tuple[str, str]]]:
+        """
+        (text, html) of email `name` for each context, in order.
+
+        A context that fails to render is logged and gives None, so one
+        bad record does not cost the rest of the batch.
+        """
+        text, html = self.templates(name)
+        shared = {'now': datetime.utcnow()}
+        bodies = []
+        errors = 0
+        for context in contexts:
+            try:
+                bodies.append((text.render(shared, **context), html.render(shared, **context)))
+            except Exception as e:
+                bodies.append(None)
+                errors += 1
+                logger.error(f"Error rendering {name} email: {str(e)}")
+        with self._lock:
+            self.counters['rendered'] += len(bodies) - errors
+            self.counters['errors'] += errors
+        return bodies
+
+    def appointment_emails(self, name: str, appointments: List[Any]) -> List[Tuple[Any, str, str]]:
+        """
+        (appointment, text, html) of email `name` for each appointment that rendered.
+
+        Appointments should come with user and doctor loaded (joinedload),
+        or each one lazy-loads them while rendering.
+        """
+        contexts = [{
+            'appointment': appointment,
+            'appointment_url': self.link('view_appointment', id=appointment.id),
+            'confirm_url': self.link('confirm_appointment', id=appointment.id),
+        } for appointment in appointments]
+        return [(appointment, *bodies) for appointment, bodies in zip(appointments, self.render(name, contexts))
+                if bodies is not None]
+
+    def link(self, endpoint: str, **values) -> Optional[str]:
+        """External URL of a page for an email, or None if the app has no such page"""
+        if endpoint not in self.app.view_functions:
+            return None
+        try:
+            return url_for(endpoint, _external=True, **values)
+        except (BuildError, RuntimeError) as e:
+            # Outside a request the URL needs SERVER_NAME
+            logger.warning(f"Cannot link {endpoint} in email: {str(e)}")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.counters, compiled=sorted(self._templates))
+
+email_renderer = EmailRenderer()
@@ -0,0 +1,106 @@
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, Iterable
+
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+def bump_generation(session, name: str) -> None:
+    """
+    Increment a named generation counter inside the caller's transaction.
+
+    The bump becomes visible to other workers only when that transaction
+    commits, together with the change it announces.
+    """
+    from models import Generation
+
+    result = session.execute(
+        update(Generation).where(Generation.name == name).values(value=Generation.value + 1)
+    )
+    if result.rowcount == 0:
+        session.execute(insert(Generation).values(name=name, value=1))
+
+def read_generation(session, name: str) -> int:
+    from models import Generation
+
+    value = session.query(Generation.value).filter(Generation.name == name).scalar()
+    return value or 0
+
+def bump_on_change(models: Iterable[type], name: str) -> None:
+    """Bump generation `name` in any flush that writes one of `models`"""
+    models = tuple(models)
+
+    @event.listens_for(Session, 'after_flush')
+    def _bump(session, flush_context):
+        changed = (session.new | session.dirty | session.deleted)
+        if any(isinstance(obj, models) for obj in changed):
+            bump_generation(session, name)
+
+class GenerationWatcher:
+    """
+    Polls the generation counters in a background thread and notifies
+    subscribers when one changes.
+
+    This is how workers learn about changes made by other workers or by
+    cli.py without querying the database on every request: each process
+    runs one poller, started lazily on its first request so it also works
+    after a gunicorn fork.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.interval = 5.0
+        self._subscribers: Dict[str, list] = {}
+        self._seen: Dict[str, int] = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config['GENERATION_POLL_INTERVAL']
+        app.before_request(self.ensure_running)
+
+    def subscribe(self, name: str, callback: Callable[[int], None]) -> None:
+        """Call `callback(value)` whenever generation `name` changes"""
+        self._subscribers.setdefault(name, []).append(callback)
+
+    def ensure_running(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='generation-watcher', daemon=True)
+            thread.start()
+
+    def poll(self) -> None:
+        """Read all counters once and notify subscribers of changed ones"""
+        from models import db, Generation
+
+        with self.app.app_context():
+            try:
+                values = dict(db.session.query(Generation.name, Generation.value).all())
+                for name, callbacks in self._subscribers.items():
+                    value = values.get(name, 0)
+                    if self._seen.get(name) == value:
+                        continue
+                    self._seen[name] = value
+                    for callback in callbacks:
+                        callback(value)
+            finally:
+                db.session.remove()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error polling generation counters: {str(e)}")
+            time.sleep(self.interval)
+
+generation_watcher = GenerationWatcher()
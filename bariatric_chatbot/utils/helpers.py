@@ -1,98 +1,90 @@
 from flask import current_app
-from flask_mail import Message, Mail
-from threading import Thread
+from flask_mail import Mail
 from datetime import datetime, timedelta
 import jwt
 import json
 import logging
-from functools import wraps
 import pytz
 
+from utils.email_templates import email_renderer, SUBJECTS
+from utils.outbox import email_outbox
+
 mail = Mail()
 logger = logging.getLogger(__name__)
 
-def async_task(f):
-    """Decorator to run a function asynchronously"""
-    @wraps(f)
-    def wrapped(*args, **kwargs):
-        Thread(target=f, args=args, kwargs=kwargs).start()
-    return wrapped
+def send_email(subject, recipients, text_body, html_body=None, sender=None):
+    """Queue an email in the outbox in its own transaction; the outbox senders deliver it"""
+    return send_emails([(subject, recipients, text_body, html_body, sender)]) == 1
 
-@async_task
-def send_async_email(app, msg):
-    """Send email asynchronously"""
-    with app.app_context():
-        try:
-            mail.send(msg)
-            logger.info(f"Email sent successfully to {msg.recipients}")
-        except Exception as e:
-            logger.error(f"Failed to send email: {str(e)}")
+def send_emails(messages):
+    """
+    Queue messages in one transaction of their own, leaving db.session
+    alone; returns how many were queued.
+    """
+    from sqlalchemy.orm import Session
+    from models import db
 
-def send_email(subject, recipients, text_body, html_body=None, sender=None):
-    """Send email wrapper"""
     try:
-        msg = Message(
-            subject=subject,
-            recipients=recipients,
-            body=text_body,
-            html=html_body,
-            sender=sender or current_app.config['MAIL_DEFAULT_SENDER']
-        )
-        send_async_email(current_app._get_current_object(), msg)
-        return True
+        with Session(db.engine) as session, session.begin():
+            queued = queue_emails(session, messages)
     except Exception as e:
-        logger.error(f"Error preparing email: {str(e)}")
-        return False
+        logger.error(f"Error queueing email: {str(e)}")
+        return 0
+    email_outbox.wake()
+    return queued
+
+def queue_emails(session, messages):
+    """
+    Add (subject, recipients, text_body, html_body, sender) tuples to the
+    caller's transaction; returns how many. They are sent once the caller
+    commits and calls email_outbox.wake().
+    """
+    default_sender = current_app.config['MAIL_DEFAULT_SENDER']
+    for subject, recipients, text_body, html_body, sender in messages:
+        email_outbox.enqueue(session, subject, recipients, text_body, html_body, sender or default_sender)
+    return len(messages)
 
 def send_password_reset_email(user):
     """Send password reset email"""
     token = user.get_reset_password_token()
-    send_email(
-        subject='Reset Your Password',
-        recipients=[user.email],
-        text_body=f'''To reset your password, visit the following link:
-{url_for('reset_password', token=token, _external=True)}
+    bodies = email_renderer.render('reset_password', [{
+        'user': user, 'token': token, 'reset_url': email_renderer.link('reset_password', token=token)
+    }])[0]
+    if bodies is None:
+        return False
+    text_body, html_body = bodies
+    return send_email(SUBJECTS['reset_password'], [user.email], text_body, html_body)
 
-If you did not request a password reset, simply ignore this email.
-''',
-        html_body=render_template('email/reset_password.html',
-                                user=user, token=token)
-    )
+def appointment_messages(name, appointments):
+    """
+    (appointment, message) of email `name` for each appointment that
+    rendered and has a patient email; messages as queue_emails() takes them.
 
-def send_appointment_confirmation(appointment):
-    """Send appointment confirmation email"""
-    send_email(
-        subject='Appointment Confirmation',
-        recipients=[appointment.user.email],
-        text_body=f'''Your appointment has been confirmed for {appointment.scheduled_time.strftime('%B %d, %Y at %I:%M %p')}
+    Appointments should come with user and doctor loaded (joinedload).
+    """
+    return [
+        (appointment, (SUBJECTS[name], [appointment.user.email], text_body, html_body, None))
+        for appointment, text_body, html_body in email_renderer.appointment_emails(name, appointments)
+        if appointment.user is not None and appointment.user.email
+    ]
+
+def send_appointment_emails(name, appointments):
+    """Render email `name` for each appointment and queue them in one transaction; returns how many"""
+    return send_emails([message for _, message in appointment_messages(name, appointments)])
 
-Details:
-Doctor: Dr. {appointment.doctor.first_name} {appointment.doctor.last_name}
-Type: {appointment.appointment_type}
-Status: {appointment.status}
+def queue_appointment_reminders(session, appointments):
+    """Add the appointments' reminders to the caller's transaction; returns the appointments queued"""
+    messages = appointment_messages('appointment_reminder', appointments)
+    queue_emails(session, [message for _, message in messages])
+    return [appointment for appointment, _ in messages]
 
-Please arrive 15 minutes before your scheduled time.
-''',
-        html_body=render_template('email/appointment_confirmation.html',
-                                appointment=appointment)
-    )
+def send_appointment_confirmation(appointment):
+    """Send appointment confirmation email"""
+    return send_appointment_emails('appointment_confirmation', [appointment]) == 1
 
 def send_appointment_reminder(appointment):
     """Send appointment reminder email"""
-    send_email(
-        subject='Appointment Reminder',
-        recipients=[appointment.user.email],
-        text_body=f'''Reminder: You have an appointment tomorrow at {appointment.scheduled_time.strftime('%I:%M %p')}
-
-Details:
-Doctor: Dr. {appointment.doctor.first_name} {appointment.doctor.last_name}
-Type: {appointment.appointment_type}
-
-Please arrive 15 minutes before your scheduled time.
-''',
-        html_body=render_template('email/appointment_reminder.html',
-                                appointment=appointment)
-    )
+    return send_appointment_emails('appointment_reminder', [appointment]) == 1
 
 def format_datetime(value, format='medium'):
     """Format datetime based on specified format"""
@@ -112,41 +104,12 @@ def to_local_time(utc_dt, timezone='UTC'):
 
 def generate_appointment_slots(doctor_id, date):
     """Generate available appointment slots for a given doctor and date"""
-    from models import Appointment
-    
-    # Define working hours (9 AM to 5 PM)
-    start_hour = 9
-    end_hour = 17
-    slot_duration = 30  # minutes
-    
-    # Get all appointments for the doctor on the given date
-    existing_appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.scheduled_time >= date.replace(hour=start_hour, minute=0),
-        Appointment.scheduled_time <= date.replace(hour=end_hour, minute=0)
-    ).all()
-    
-    # Generate all possible slots
-    slots = []
-    current_time = date.replace(hour=start_hour, minute=0)
-    end_time = date.replace(hour=end_hour, minute=0)
-    
-    while current_time <= end_time:
-        slot = {
-            'time': current_time,
-            'available': True
-        }
-        
-        # Check if slot is already booked
-        for appointment in existing_appointments:
-            if appointment.scheduled_time == current_time:
-                slot['available'] = False
-                break
-        
-        slots.append(slot)
-        current_time += timedelta(minutes=slot_duration)
+    from models import db
+    from utils.availability import AvailabilityEngine
     
-    return slots
+    engine = AvailabilityEngine.from_config(current_app.config)
+    day = date.date() if isinstance(date, datetime) else date
+    return engine.load(db.session, (doctor_id,), day, 1).slots(doctor_id, day)
 
 def format_phone_number(phone):
     """Format phone number to consistent format"""
@@ -215,41 +178,33 @@ def is_eligible_for_surgery(bmi, age, conditions=None):
 
 def generate_diet_plan(surgery_type, phase):
     """Generate diet plan based on surgery type and recovery phase"""
-    from models import DietPlan
+    from utils.catalog import current_catalog
+    from utils.knowledge_base import surgery_key
     
-    diet_plan = DietPlan.query.filter_by(
-        surgery_type=surgery_type,
-        phase=phase
-    ).first()
+    # Served from the in-memory catalogue; accepts a SurgeryType, its name or its key
+    name = getattr(surgery_type, 'name', surgery_type)
+    diet_plan = current_catalog().diet_plan(surgery_key(name), phase)
     
     if not diet_plan:
         return None
     
     return {
-        'allowed_foods': diet_plan.allowed_foods,
-        'restricted_foods': diet_plan.restricted_foods,
-        'guidelines': diet_plan.guidelines,
-        'supplements': diet_plan.supplements
+        'allowed_foods': diet_plan['allowed_foods'],
+        'restricted_foods': diet_plan['restricted_foods'],
+        'guidelines': diet_plan['guidelines'],
+        'supplements': diet_plan['supplements']
     }
 
 def log_audit(user_id, action, details, ip_address=None):
-    """Log audit entry"""
-    from models import AuditLog, db
+    """Log audit entry; it is written to AuditLog in the background"""
+    from utils.audit import audit_sink
     
     try:
-        log = AuditLog(
-            user_id=user_id,
-            action=action,
-            details=details,
-            ip_address=ip_address
-        )
-        db.session.add(log)
-        db.session.commit()
+        audit_sink.record(action, user_id=user_id, details=details, ip_address=ip_address)
         logger.info(f"Audit log created: {action} by user {user_id}")
         return True
     except Exception as e:
         logger.error(f"Failed to create audit log: {str(e)}")
-        db.session.rollback()
         return False
 
 def sanitize_json(obj):
@@ -0,0 +1,126 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Optional
+
+from utils.permissions import access_cache
+
+logger = logging.getLogger(__name__)
+
+USERS_GENERATION = 'users'
+
+class UserIdentity:
+    """
+    Read-only snapshot of a User, served as current_user.
+
+    Holds what request handling needs (id, names, active flag and role ids)
+    and nothing bound to a database session, so using it never queries.
+    Role and permission checks go through the AccessCache like they do for
+    User.
+    """
+    __slots__ = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'role_ids', 'loaded_at')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user, role_ids: FrozenSet[int]):
+        values = {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'is_active': bool(user.is_active),
+            'role_ids': role_ids,
+            'loaded_at': time.monotonic()
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'UserIdentity is read-only (tried to set {name})')
+
+    def get_id(self) -> str:
+        return str(self.id)
+
+    def has_role(self, role_name: str) -> bool:
+        return access_cache.has_any_role(self, (role_name,))
+
+    def has_permission(self, permission: str) -> bool:
+        return access_cache.has_all_permissions(self, (permission,))
+
+    def __repr__(self):
+        return f'<UserIdentity {self.username}>'
+
+class UserCache:
+    """
+    Per-worker LRU of UserIdentity snapshots for the login manager's user loader.
+
+    Entries live for USER_CACHE_TTL seconds. Changes to a user made through
+    update_user or the activate/deactivate commands bump the 'users'
+    generation: the worker that made the change drops its entry at once,
+    every other worker clears its cache on the next generation poll. A
+    cached request therefore loads its user without touching the database.
+    """
+
+    def __init__(self):
+        self.ttl = 60.0
+        self.max_size = 10000
+        self.generation = None
+        self._users = OrderedDict()
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def init_app(self, app, watcher):
+        self.ttl = app.config['USER_CACHE_TTL']
+        self.max_size = app.config['USER_CACHE_MAX_SIZE']
+        watcher.subscribe(USERS_GENERATION, self._on_generation)
+
+    def _on_generation(self, value: int) -> None:
+        if value != self.generation:
+            self.generation = value
+            with self._lock:
+                self._users.clear()
+                self._epoch += 1
+
+    def get(self, user_id: int) -> Optional[UserIdentity]:
+        with self._lock:
+            identity = self._users.get(user_id)
+            if identity is not None and identity.loaded_at >= time.monotonic() - self.ttl:
+                self._users.move_to_end(user_id)
+                self.counters['hits'] += 1
+                return identity
+            epoch = self._epoch
+
+        self.counters['misses'] += 1
+        identity = self._load(user_id)
+        with self._lock:
+            # Don't cache a snapshot read before an invalidation that raced with it
+            if identity is not None and self._epoch == epoch:
+                self._users[user_id] = identity
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.max_size:
+                    self._users.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget one user in this worker"""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._epoch += 1
+            self.counters['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {'size': len(self._users), 'ttl': self.ttl, **self.counters}
+
+    def _load(self, user_id: int) -> Optional[UserIdentity]:
+        from models import db, User
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        return UserIdentity(user, user.role_ids)
+
+user_cache = UserCache()
@@ -0,0 +1,152 @@
+import json
+import logging
+import re
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    NUMPY_AVAILABLE = True
+except ImportError:  # The classifier is optional; the keyword matcher still works
+    NUMPY_AVAILABLE = False
+
+# Shared by training and inference so both tokenize messages alike
+TOKEN_PATTERN = r'(?u)\b\w+\b'
+NGRAM_RANGE = (1, 2)
+
+def load_corpus(path: str) -> List[Tuple[str, str]]:
+    """
+    Load a labelled corpus of the form {"intent": ["example", ...], ...}
+
+    Returns a list of (message, intent) pairs.
+    """
+    with open(path, 'r') as f:
+        corpus = json.load(f)
+    return [(message, intent) for intent, messages in corpus.items() for message in messages]
+
+class IntentClassifier:
+    """
+    TF-IDF + logistic regression intent classifier.
+
+    Training needs scikit-learn; the saved artifact is a compressed .npz of
+    plain arrays (vocabulary, idf weights, coefficients), so loading it does
+    not unpickle anything and inference needs only numpy and scipy. A whole
+    batch of messages is scored with a single sparse-matrix product.
+    """
+
+    def __init__(self, vocabulary, idf, coef, intercept, classes):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError('numpy and scipy are required for the intent classifier')
+
+        self.classes = [str(label) for label in classes]
+        self.vocabulary = {str(term): index for index, term in enumerate(vocabulary)}
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.coef_t = np.ascontiguousarray(np.asarray(coef, dtype=np.float64).T)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self._token = re.compile(TOKEN_PATTERN)
+
+    @classmethod
+    def train(cls, examples: List[Tuple[str, str]], C: float = 10.0) -> 'IntentClassifier':
+        """Fit a classifier on (message, intent) pairs"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        messages = [message.lower().strip() for message, _ in examples]
+        labels = [intent for _, intent in examples]
+
+        vectorizer = TfidfVectorizer(
+            ngram_range=NGRAM_RANGE,
+            token_pattern=TOKEN_PATTERN,
+            sublinear_tf=True
+        )
+        features = vectorizer.fit_transform(messages)
+        model = LogisticRegression(C=C, max_iter=1000)
+        model.fit(features, labels)
+
+        vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        coef, intercept = model.coef_, model.intercept_
+        if len(model.classes_) == 2:
+            # Binary models keep a single row; expand it so scoring is uniform
+            coef = np.vstack([-coef[0], coef[0]])
+            intercept = np.array([-intercept[0], intercept[0]])
+
+        return cls(vocabulary, vectorizer.idf_, coef, intercept, model.classes_)
+
+    def save(self, path: str) -> None:
+        """Write the classifier as a compressed numpy archive"""
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez_compressed(
+            path,
+            vocabulary=np.array(vocabulary),
+            idf=self.idf.astype(np.float32),
+            coef=self.coef_t.T.astype(np.float32),
+            intercept=self.intercept.astype(np.float32),
+            classes=np.array(self.classes)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'IntentClassifier':
+        """Load a classifier written by save()"""
+        with np.load(path, allow_pickle=False) as artifact:
+            return cls(
+                artifact['vocabulary'],
+                artifact['idf'],
+                artifact['coef'],
+                artifact['intercept'],
+                artifact['classes']
+            )
+
+    def _features(self, messages: List[str]):
+        """TF-IDF matrix for a batch: sublinear tf, idf weighting, l2-normalized rows"""
+        vocabulary = self.vocabulary
+        indptr, indices, counts = [0], [], []
+        for message in messages:
+            tokens = self._token.findall(message.lower())
+            row = {}
+            for gram in tokens + [' '.join(pair) for pair in zip(tokens, tokens[1:])]:
+                index = vocabulary.get(gram)
+                if index is not None:
+                    row[index] = row.get(index, 0) + 1
+            indices.extend(row)
+            counts.extend(row.values())
+            indptr.append(len(indices))
+
+        indices = np.asarray(indices, dtype=np.int32)
+        data = (np.log(np.asarray(counts, dtype=np.float64)) + 1) * self.idf[indices]
+        features = csr_matrix((data, indices, indptr), shape=(len(messages), len(vocabulary)))
+
+        norms = np.sqrt(features.multiply(features).sum(axis=1)).A1
+        norms[norms == 0] = 1
+        features.data /= np.repeat(norms, np.diff(features.indptr))
+        return features
+
+    def predict_proba(self, messages: List[str]):
+        """Return an (n_messages, n_intents) array of intent probabilities"""
+        scores = np.asarray(self._features(messages) @ self.coef_t) + self.intercept
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def classify_batch(self, messages: List[str]) -> List[Tuple[str, float]]:
+        """Return (intent, probability) for each message, in order"""
+        if not messages:
+            return []
+
+        probabilities = self.predict_proba(messages)
+        best = probabilities.argmax(axis=1)
+        return [
+            (self.classes[index], float(probabilities[row, index]))
+            for row, index in enumerate(best)
+        ]
+
+    def classify(self, message: str) -> Tuple[str, float]:
+        return self.classify_batch([message])[0]
+
+    def ranked(self, message: str) -> Dict[str, float]:
+        """All intents for one message, most probable first"""
+        probabilities = self.predict_proba([message])[0]
+        order = probabilities.argsort()[::-1]
+        return {self.classes[index]: float(probabilities[index]) for index in order}
@@ -0,0 +1,134 @@
+import re
+import time
+import logging
+from typing import Any, Dict, Iterable, Tuple
+
+from utils.chatbot_logic import chatbot
+from utils.generations import bump_on_change, read_generation
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_GENERATION = 'knowledge'
+
+def surgery_key(name: str) -> str:
+    """'Gastric Bypass' -> 'gastric_bypass'"""
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+def _merge_unique(target: list, items: Iterable) -> None:
+    for item in items or []:
+        if item not in target:
+            target.append(item)
+
+def build_knowledge(surgery_rows, diet_rows) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Convert SurgeryType and DietPlan rows into the dicts ChatbotLogic answers from.
+
+    Each surgery type carries its own diet plans by phase; `diet_phases` is
+    the overview across all procedures, with food lists merged per phase.
+    """
+    surgery_types = {}
+    keys_by_id = {}
+    for row in surgery_rows:
+        key = surgery_key(row.name)
+        keys_by_id[row.id] = key
+        surgery_types[key] = {
+            'name': row.name,
+            'description': row.description or '',
+            'cost_range': row.cost_range or {},
+            'requirements': row.requirements or [],
+            'risks': row.risks or [],
+            'preop_instructions': row.preop_instructions or {},
+            'postop_instructions': row.postop_instructions or {},
+            'recovery_time': row.recovery_time,
+            'diet_plans': {}
+        }
+
+    diet_phases = {}
+    for row in diet_rows:
+        plan = {
+            'duration': row.duration or '',
+            'allowed_foods': row.allowed_foods or [],
+            'restricted_foods': row.restricted_foods or [],
+            'guidelines': row.guidelines or [],
+            'supplements': row.supplements or {}
+        }
+        key = keys_by_id.get(row.surgery_type_id)
+        if key:
+            surgery_types[key]['diet_plans'][row.phase] = plan
+
+        overview = diet_phases.setdefault(row.phase, {
+            'duration': plan['duration'],
+            'allowed_foods': [],
+            'restricted_foods': [],
+            'guidelines': [],
+            'supplements': {}
+        })
+        _merge_unique(overview['allowed_foods'], plan['allowed_foods'])
+        _merge_unique(overview['restricted_foods'], plan['restricted_foods'])
+        _merge_unique(overview['guidelines'], plan['guidelines'])
+        for name, dose in plan['supplements'].items():
+            overview['supplements'].setdefault(name, dose)
+
+    return surgery_types, diet_phases
+
+class KnowledgeBase:
+    """
+    Keeps the chatbot's knowledge in sync with the SurgeryType and DietPlan tables.
+
+    The tables are read once at startup and again only when the 'knowledge'
+    generation changes, which every flush touching either table bumps. The
+    chatbot answers from an in-memory snapshot that is swapped atomically,
+    so requests never query these tables. While the tables are empty the
+    chatbot keeps its built-in content.
+    """
+
+    def __init__(self, chatbot):
+        self.chatbot = chatbot
+        self.generation = None
+        self.stats = {}
+
+    def init_app(self, app, watcher):
+        from models import SurgeryType, DietPlan
+
+        bump_on_change((SurgeryType, DietPlan), KNOWLEDGE_GENERATION)
+        watcher.subscribe(KNOWLEDGE_GENERATION, self._on_generation)
+        with app.app_context():
+            self.reload()
+
+    def _on_generation(self, value: int) -> None:
+        if value != self.generation:
+            self.reload()
+
+    def reload(self) -> bool:
+        """Load the tables into a new snapshot; returns True if the content changed"""
+        from models import db, SurgeryType, DietPlan
+
+        start = time.perf_counter()
+        # Read the generation first: a change committed while loading bumps
+        # it again, so the next poll reloads instead of missing it
+        generation = read_generation(db.session, KNOWLEDGE_GENERATION)
+        surgery_rows = SurgeryType.query.order_by(SurgeryType.id).all()
+        diet_rows = DietPlan.query.order_by(DietPlan.id).all()
+
+        self.generation = generation
+        if not surgery_rows:
+            logger.info("No surgery types in the database, keeping built-in chatbot knowledge")
+            return False
+
+        surgery_types, diet_phases = build_knowledge(surgery_rows, diet_rows)
+        changed = self.chatbot.load_knowledge(surgery_types, diet_phases)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.stats = {
+            'generation': generation,
+            'version': self.chatbot.knowledge.version,
+            'surgery_types': len(surgery_rows),
+            'diet_plans': len(diet_rows),
+            'reload_ms': round(elapsed_ms, 2),
+            'reloaded_at': time.time()
+        }
+        logger.info(f"Knowledge reloaded from database in {elapsed_ms:.1f} ms "
+                    f"(generation {generation}, changed: {changed})")
+        return changed
+
+knowledge_base = KnowledgeBase(chatbot)
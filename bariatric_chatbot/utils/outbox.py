@@ -0,0 +1,306 @@
+import os
+import time
+import random
+import smtplib
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from flask_mail import Message, BadHeaderError
+from sqlalchemy import func, select, update
+
+logger = logging.getLogger(__name__)
+
+# Errors the server gives for one message; the connection stays usable
+REFUSED = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError, BadHeaderError)
+
+class MailOutbox:
+    """
+    Durable email queue drained by a bounded pool of sender threads.
+
+    Messages are rows in email_outbox, committed like any other write, so
+    nothing queued is lost when a process exits. Each sender claims up to
+    OUTBOX_BATCH_SIZE due messages with one conditional UPDATE (skipping
+    rows another sender has locked, where the database supports it) and
+    delivers the batch over a single mail.connect() connection.
+
+    A message the server refuses is retried with exponential backoff and
+    marked failed after OUTBOX_MAX_ATTEMPTS; if the connection breaks, the
+    rest of the batch is retried the same way. Messages claimed by a sender
+    that died are released after OUTBOX_LEASE seconds, so delivery is at
+    least once.
+
+    Each process starts its senders on its first request (or from
+    gunicorn's post_fork), so mail queued before a restart goes out
+    without waiting for new mail to be queued.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.mail = None
+        self.workers = 2
+        self.batch_size = 50
+        self.poll_interval = 5.0
+        self.max_attempts = 8
+        self.retry_base = 30.0
+        self.retry_max = 3600.0
+        self.lease = timedelta(seconds=300)
+        self._pid = None
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        # (monotonic time, messages sent) per batch over the last minute
+        self._sent_recently = deque()
+        self.counters = {'enqueued': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0,
+                         'connections': 0, 'connection_errors': 0}
+        self.last_queue_age = None
+
+    def init_app(self, app, mail):
+        self.app = app
+        self.mail = mail
+        self.workers = app.config['OUTBOX_WORKERS']
+        self.batch_size = app.config['OUTBOX_BATCH_SIZE']
+        self.poll_interval = app.config['OUTBOX_POLL_INTERVAL']
+        self.max_attempts = app.config['OUTBOX_MAX_ATTEMPTS']
+        self.retry_base = app.config['OUTBOX_RETRY_BASE']
+        self.retry_max = app.config['OUTBOX_RETRY_MAX']
+        self.lease = timedelta(seconds=app.config['OUTBOX_LEASE'])
+        app.before_request(self.start)
+
+    def enqueue(self, session, subject: str, recipients: List[str], body: str, html: Optional[str] = None,
+                sender: Optional[str] = None):
+        """Add a message to the caller's transaction; it is sent once committed (see wake())"""
+        from models import EmailOutbox
+
+        recipients = [recipient for recipient in recipients if recipient]
+        if not recipients:
+            raise ValueError('Email has no recipients')
+        message = EmailOutbox(subject=subject, recipients=recipients, body=body, html=html, sender=sender,
+                              status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+        session.add(message)
+        self._count(enqueued=1)
+        return message
+
+    def start(self) -> None:
+        """Start the senders in this process, unless OUTBOX_WORKERS is 0"""
+        if self.workers > 0:
+            self._ensure_running()
+
+    def wake(self) -> None:
+        """Have the senders look for work now, starting them in this process if needed"""
+        self.start()
+        self._wake.set()
+
+    def claim(self, session, limit: int, now: Optional[datetime] = None) -> List[Any]:
+        """Mark up to `limit` due messages as being sent and return them; commits"""
+        from models import EmailOutbox
+
+        now = now or datetime.utcnow()
+        try:
+            session.execute(update(EmailOutbox).where(
+                EmailOutbox.status == 'sending',
+                EmailOutbox.claimed_at < now - self.lease
+            ).values(status='pending'), execution_options={'synchronize_session': False})
+            due = select(EmailOutbox.id).where(
+                EmailOutbox.status == 'pending',
+                EmailOutbox.next_attempt_at <= now
+            ).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(limit).with_for_update(skip_locked=True)
+            claimed = session.execute(update(EmailOutbox).where(
+                EmailOutbox.id.in_(due.scalar_subquery()),
+                EmailOutbox.status == 'pending'
+            ).values(status='sending', claimed_at=now).returning(EmailOutbox.id),
+                execution_options={'synchronize_session': False}).scalars().all()
+            # Plain rows: they outlive the commit without being reloaded
+            rows = session.query(EmailOutbox.id, EmailOutbox.subject, EmailOutbox.sender, EmailOutbox.recipients,
+                                 EmailOutbox.body, EmailOutbox.html, EmailOutbox.attempts,
+                                 EmailOutbox.created_at).filter(
+                EmailOutbox.id.in_(claimed)
+            ).order_by(EmailOutbox.id).all() if claimed else []
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return rows
+
+    def deliver(self, rows: List[Any]) -> Dict[int, Optional[str]]:
+        """Send `rows` over one SMTP connection; maps each id to None if sent, else the error"""
+        results: Dict[int, Optional[str]] = {}
+        try:
+            with self.mail.connect() as connection:
+                self._count(connections=1)
+                for row in rows:
+                    try:
+                        connection.send(Message(subject=row.subject, recipients=row.recipients, body=row.body,
+                                                html=row.html, sender=row.sender))
+                        results[row.id] = None
+                    except REFUSED as e:
+                        results[row.id] = str(e) or type(e).__name__
+        except Exception as e:
+            # Connecting failed or the connection broke: whatever was not sent is retried
+            self._count(connection_errors=1)
+            logger.error(f"SMTP connection error: {str(e)}")
+            for row in rows:
+                results.setdefault(row.id, str(e) or type(e).__name__)
+        return results
+
+    def record(self, session, rows: List[Any], results: Dict[int, Optional[str]],
+               now: Optional[datetime] = None) -> None:
+        """Mark delivered messages sent and schedule the retries of the rest; commits"""
+        from models import EmailOutbox
+
+        now = now or datetime.utcnow()
+        sent = [row.id for row in rows if results[row.id] is None]
+        retried = failed = 0
+        try:
+            if sent:
+                session.execute(update(EmailOutbox).where(EmailOutbox.id.in_(sent)).values(
+                    status='sent', sent_at=now, last_error=None
+                ), execution_options={'synchronize_session': False})
+            for row in rows:
+                error = results[row.id]
+                if error is None:
+                    continue
+                attempts = row.attempts + 1
+                values = {'attempts': attempts, 'last_error': error[:1000]}
+                if attempts >= self.max_attempts:
+                    values['status'] = 'failed'
+                    failed += 1
+                    logger.error(f"Giving up on email {row.id} to {row.recipients} after {attempts} attempts: {error}")
+                else:
+                    values.update(status='pending', next_attempt_at=now + self.backoff(attempts))
+                    retried += 1
+                session.execute(update(EmailOutbox).where(EmailOutbox.id == row.id).values(**values),
+                                execution_options={'synchronize_session': False})
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        with self._lock:
+            self.counters['sent'] += len(sent)
+            self.counters['retried'] += retried
+            self.counters['failed'] += failed
+            self.counters['batches'] += 1
+            if sent:
+                self._sent_recently.append((time.monotonic(), len(sent)))
+            self.last_queue_age = (now - min(row.created_at for row in rows)).total_seconds()
+
+    def backoff(self, attempts: int) -> timedelta:
+        """Delay before the retry after `attempts` failures: doubling from OUTBOX_RETRY_BASE, capped, jittered"""
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+    def drain_once(self) -> int:
+        """Claim and deliver one batch; returns how many messages it had"""
+        from models import db
+
+        with self.app.app_context():
+            try:
+                rows = self.claim(db.session, self.batch_size)
+                if rows:
+                    self.record(db.session, rows, self.deliver(rows))
+                return len(rows)
+            finally:
+                db.session.remove()
+
+    def drain(self) -> int:
+        """Deliver everything due now from the calling thread; returns how many messages were tried"""
+        total = 0
+        while True:
+            claimed = self.drain_once()
+            total += claimed
+            if claimed < self.batch_size:
+                return total
+
+    def run(self) -> None:
+        """Run the senders in the foreground until interrupted"""
+        self._ensure_running()
+        for thread in list(self._threads):
+            thread.join()
+
+    def stats(self, session=None) -> Dict[str, Any]:
+        with self._lock:
+            cutoff = time.monotonic() - 60
+            while self._sent_recently and self._sent_recently[0][0] < cutoff:
+                self._sent_recently.popleft()
+            result = {
+                'workers': self.workers,
+                'running': self._pid == os.getpid(),
+                'sent_per_second': round(sum(count for _, count in self._sent_recently) / 60, 2),
+                'last_batch_queue_age_seconds': self.last_queue_age,
+                **self.counters
+            }
+        if session is not None:
+            from models import EmailOutbox
+
+            depth, oldest = session.query(func.count(EmailOutbox.id), func.min(EmailOutbox.created_at)).filter(
+                EmailOutbox.status.in_(('pending', 'sending'))
+            ).one()
+            result['queue_depth'] = depth
+            result['oldest_queued_seconds'] = (datetime.utcnow() - oldest).total_seconds() if oldest else None
+        return result
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Let the senders finish the batches they hold; called on worker exit"""
+        self._stopping = True
+        self._wake.set()
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for key, delta in deltas.items():
+                self.counters[key] += delta
+
+    def _ensure_running(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Threads of a parent process do not survive fork
+            self._threads = [threading.Thread(target=self._run, name=f'email-outbox-{index}', daemon=True)
+                             for index in range(max(1, self.workers))]
+            for thread in self._threads:
+                thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            # Cleared before draining: a wake() from here on is seen by this drain or the wait
+            self._wake.clear()
+            try:
+                claimed = self.drain_once()
+            except Exception as e:
+                claimed = 0
+                logger.error(f"Error delivering queued email: {str(e)}")
+            if claimed < self.batch_size and not self._stopping:
+                # Caught up: wait for new mail or for the next retry to come due
+                try:
+                    timeout = self._idle_timeout()
+                except Exception:
+                    timeout = self.poll_interval
+                self._wake.wait(timeout)
+
+    def _idle_timeout(self) -> float:
+        """Seconds until the next queued message is due, at most the poll interval"""
+        from models import db, EmailOutbox
+
+        with self.app.app_context():
+            try:
+                due = db.session.query(func.min(EmailOutbox.next_attempt_at)).filter(
+                    EmailOutbox.status == 'pending'
+                ).scalar()
+            finally:
+                db.session.remove()
+        if due is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(0.0, (due - datetime.utcnow()).total_seconds()))
+
+email_outbox = MailOutbox()
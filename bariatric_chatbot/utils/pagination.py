@@ -0,0 +1,95 @@
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import DateTime, tuple_
+
+class InvalidCursor(ValueError):
+    """The page token was not issued by this application or is malformed"""
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated listing.
+
+    next_cursor / prev_cursor are opaque tokens for the neighbouring pages,
+    None at either end. total is only filled in when the caller supplies it.
+    """
+
+    def __init__(self, items: List[Any], next_cursor: Optional[str], prev_cursor: Optional[str],
+                 total: Optional[int] = None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a unique sort key such as (created_at, id).
+
+    Instead of OFFSET, each page continues from the key of the last (or,
+    going back, the first) row of the previous one: WHERE (created_at, id)
+    < (:created_at, :id) ORDER BY created_at DESC, id DESC LIMIT n + 1. With
+    an index on the key columns every page costs the same, however deep.
+    The extra row only tells whether another page follows. Cursors are
+    signed with the app's SECRET_KEY, so clients can't forge arbitrary
+    filters through them.
+    """
+
+    def __init__(self, columns: Sequence, descending: bool = True):
+        self.columns = tuple(columns)
+        self.descending = descending
+
+    def paginate(self, query, secret_key: str, cursor: Optional[str] = None, per_page: int = 10) -> KeysetPage:
+        serializer = URLSafeSerializer(secret_key, salt='keyset-page')
+        direction, key = 'next', None
+        if cursor:
+            try:
+                direction, values = serializer.loads(cursor)
+            except (BadSignature, ValueError, TypeError):
+                raise InvalidCursor(cursor)
+            if direction not in ('next', 'prev') or len(values) != len(self.columns):
+                raise InvalidCursor(cursor)
+            key = self._decode(values)
+
+        # Walking back means reading the opposite order from the cursor, then reversing
+        forward = (direction == 'next') == self.descending
+        if key is not None:
+            bound = tuple_(*self.columns)
+            query = query.filter(bound < tuple_(*key) if forward else bound > tuple_(*key))
+        order = [column.desc() if forward else column.asc() for column in self.columns]
+        rows = query.order_by(*order).limit(per_page + 1).all()
+
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        if direction == 'prev':
+            rows.reverse()
+
+        def token(row, towards):
+            return serializer.dumps([towards, self._encode(row)])
+
+        if direction == 'next':
+            next_cursor = token(rows[-1], 'next') if rows and more else None
+            prev_cursor = token(rows[0], 'prev') if rows and key is not None else None
+        else:
+            next_cursor = token(rows[-1], 'next') if rows else None
+            prev_cursor = token(rows[0], 'prev') if rows and more else None
+        return KeysetPage(rows, next_cursor, prev_cursor)
+
+    def _encode(self, row) -> list:
+        values = [getattr(row, column.key) for column in self.columns]
+        return [value.isoformat() if isinstance(value, datetime) else value for value in values]
+
+    def _decode(self, values: list) -> list:
+        try:
+            return [datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+                    for column, value in zip(self.columns, values)]
+        except (TypeError, ValueError):
+            raise InvalidCursor(values)
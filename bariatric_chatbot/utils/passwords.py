@@ -0,0 +1,112 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict
+
+from flask import has_request_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+class PasswordPoolBusy(Exception):
+    """Raised instead of queueing when the hashing pool is saturated"""
+
+def _hash(password: str, method: str) -> str:
+    return generate_password_hash(password, method=method)
+
+def _verify(password_hash: str, password: str) -> bool:
+    return check_password_hash(password_hash, password)
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification in a small process pool.
+
+    A PBKDF2 check at current cost takes a good fraction of a second. Left
+    unbounded, a burst of logins occupies every thread of a gunicorn worker
+    and chat requests queue behind them. Here the work runs in
+    PASSWORD_POOL_WORKERS processes per worker, at most PASSWORD_POOL_QUEUE
+    more requests may wait for them, and any further request fails
+    immediately with PasswordPoolBusy. Keeping workers + queue below
+    GUNICORN_THREADS leaves threads free for chat during a login flood.
+    Outside a request (CLI, database setup) hashing runs inline.
+
+    Hashes made with other parameters than PASSWORD_HASH_METHOD are
+    reported by needs_rehash(), so login can upgrade them transparently.
+    """
+
+    def __init__(self):
+        self.method = 'pbkdf2:sha256:600000'
+        self.workers = 1
+        self.queue_size = 0
+        self.timeout = 10.0
+        self._pool = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.counters = {'hashed': 0, 'verified': 0, 'rejected': 0}
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_POOL_WORKERS']
+        self.queue_size = app.config['PASSWORD_POOL_QUEUE']
+        self.timeout = app.config['PASSWORD_POOL_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+
+    def hash(self, password: str) -> str:
+        self.counters['hashed'] += 1
+        return self._run(_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        if not password_hash:
+            return False
+        self.counters['verified'] += 1
+        return self._run(_verify, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True if the hash was made with different parameters than configured"""
+        return bool(password_hash) and password_hash.split('$', 1)[0] != self.method
+
+    def stats(self) -> Dict[str, Any]:
+        return {'workers': self.workers, 'queue_size': self.queue_size, **self.counters}
+
+    def start(self) -> None:
+        """
+        Fork this worker's pool processes now; gunicorn.conf.py calls it in
+        post_fork, while the worker is still single-threaded.
+        """
+        self._executor().submit(_verify, '', '').result()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # A pool can't be shared across a gunicorn fork; each worker starts its own
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _run(self, func, *args):
+        if self._slots is None or not has_request_context():
+            return func(*args)
+
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self.counters['rejected'] += 1
+            raise PasswordPoolBusy()
+        try:
+            future = self._executor().submit(func, *args)
+        except Exception:
+            slots.release()
+            raise
+        # Freed when the work is done, not when this request stops waiting:
+        # a timed-out hash still occupies a pool process until it finishes
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            self.counters['rejected'] += 1
+            raise PasswordPoolBusy()
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,139 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from utils.generations import bump_on_change
+
+logger = logging.getLogger(__name__)
+
+PERMISSIONS_GENERATION = 'permissions'
+
+class RoleTable:
+    """All roles compiled to bitmasks: one bit per role name and one per permission"""
+
+    def __init__(self, generation: int, rows: Iterable[Tuple[int, str, Optional[list]]]):
+        self.generation = generation
+        self.role_bits: Dict[str, int] = {}
+        self.permission_bits: Dict[str, int] = {}
+        self.masks: Dict[int, Tuple[int, int]] = {}
+        for role_id, name, permissions in rows:
+            role_mask = self.role_bits.setdefault(name, 1 << len(self.role_bits))
+            permission_mask = 0
+            for permission in permissions or []:
+                permission_mask |= self.permission_bits.setdefault(permission, 1 << len(self.permission_bits))
+            self.masks[role_id] = (role_mask, permission_mask)
+        self._required: Dict[Tuple[str, Tuple[str, ...]], Optional[int]] = {}
+
+    def role_mask(self, names: Tuple[str, ...]) -> int:
+        """Bits of the named roles; names no role has contribute nothing"""
+        key = ('role', names)
+        if key not in self._required:
+            self._required[key] = sum(self.role_bits.get(name, 0) for name in set(names))
+        return self._required[key]
+
+    def permission_mask(self, names: Tuple[str, ...]) -> Optional[int]:
+        """Bits of the named permissions, or None if no role grants one of them"""
+        key = ('permission', names)
+        if key not in self._required:
+            unknown = any(name not in self.permission_bits for name in names)
+            self._required[key] = None if unknown else sum(self.permission_bits[name] for name in set(names))
+        return self._required[key]
+
+class AccessCache:
+    """
+    Answers role and permission checks with integer tests.
+
+    Roles are compiled into a RoleTable once per 'permissions' generation,
+    and each user's roles into a role mask and a permission mask, cached by
+    user id and valid for that table only. A check is then a dict lookup
+    and an AND; the user's roles relationship is never loaded (a miss reads
+    user.role_ids, which a cached UserIdentity already holds). At most
+    ACCESS_CACHE_MAX_SIZE users are kept, least recently used dropped first.
+
+    Writes to Role bump the generation, and so does update_user when it
+    changes a user's roles. The worker that made the change drops its entry
+    at once; other workers rebuild on their next generation poll.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self.max_size = 10000
+        self._table: Optional[RoleTable] = None
+        self._users: 'OrderedDict[int, Tuple[RoleTable, int, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'table_builds': 0}
+
+    def init_app(self, app, watcher):
+        from models import Role
+
+        self.max_size = app.config['ACCESS_CACHE_MAX_SIZE']
+        bump_on_change((Role,), PERMISSIONS_GENERATION)
+        watcher.subscribe(PERMISSIONS_GENERATION, self._on_generation)
+
+    def _on_generation(self, value: int) -> None:
+        if value != self.generation:
+            self.generation = value
+            with self._lock:
+                self._users.clear()
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget one user's masks in this worker"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def has_any_role(self, user, names: Tuple[str, ...]) -> bool:
+        table, role_mask, _ = self._lookup(user)
+        return bool(role_mask & table.role_mask(names))
+
+    def has_all_permissions(self, user, names: Tuple[str, ...]) -> bool:
+        table, _, permission_mask = self._lookup(user)
+        required = table.permission_mask(names)
+        return required is not None and permission_mask & required == required
+
+    def stats(self) -> Dict[str, Any]:
+        table = self._table
+        return {
+            'generation': self.generation,
+            'roles': len(table.role_bits) if table else 0,
+            'permissions': len(table.permission_bits) if table else 0,
+            'users': len(self._users),
+            **self.counters
+        }
+
+    def _current_table(self) -> RoleTable:
+        table = self._table
+        if table is not None and table.generation == self.generation:
+            return table
+        from models import db, Role
+
+        with self._lock:
+            if self._table is None or self._table.generation != self.generation:
+                rows = db.session.query(Role.id, Role.name, Role.permissions).order_by(Role.id).all()
+                self._table = RoleTable(self.generation, rows)
+                self.counters['table_builds'] += 1
+            return self._table
+
+    def _lookup(self, user) -> Tuple[RoleTable, int, int]:
+        table = self._current_table()
+        with self._lock:
+            entry = self._users.get(user.id)
+            if entry is not None and entry[0] is table:
+                self._users.move_to_end(user.id)
+                self.counters['hits'] += 1
+                return entry
+        self.counters['misses'] += 1
+        role_mask = permission_mask = 0
+        for role_id in user.role_ids:
+            role_bits, permission_bits = table.masks.get(role_id, (0, 0))
+            role_mask |= role_bits
+            permission_mask |= permission_bits
+        entry = (table, role_mask, permission_mask)
+        with self._lock:
+            self._users[user.id] = entry
+            self._users.move_to_end(user.id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+        return entry
+
+access_cache = AccessCache()
@@ -0,0 +1,115 @@
+import re
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import event, select, tuple_
+
+logger = logging.getLogger(__name__)
+
+def hot_queries() -> Dict[str, Callable]:
+    """
+    The queries request handling depends on being indexed, by name.
+
+    Each builds its statement with representative parameters; the plan is
+    what matters, not the rows.
+    """
+    from models import User, ChatHistory, Appointment, AuditLog, DietPlan, EmailOutbox
+
+    now = datetime(2024, 1, 15, 9, 0)
+    return {
+        'chat history of a user': lambda: select(ChatHistory).where(ChatHistory.user_id == 1)
+            .order_by(ChatHistory.created_at.desc()).limit(50),
+        "doctor's appointments for a day": lambda: select(Appointment).where(
+            Appointment.doctor_id == 1,
+            Appointment.scheduled_time >= now,
+            Appointment.scheduled_time <= now + timedelta(hours=8)),
+        'availability of doctors over days': lambda: select(
+            Appointment.doctor_id, Appointment.scheduled_time, Appointment.duration_minutes).where(
+            Appointment.doctor_id.in_([1, 2, 3]),
+            Appointment.scheduled_time > now,
+            Appointment.scheduled_time < now + timedelta(days=30),
+            Appointment.status != 'cancelled'),
+        'scheduled appointments in a window': lambda: select(Appointment).where(
+            Appointment.status == 'scheduled',
+            Appointment.scheduled_time > now,
+            Appointment.scheduled_time <= now + timedelta(days=7)).order_by(Appointment.scheduled_time),
+        'appointments changed since a poll': lambda: select(Appointment.id, Appointment.status)
+            .where(Appointment.updated_at > now).order_by(Appointment.updated_at),
+        'due outbox email': lambda: select(EmailOutbox.id).where(
+            EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(50),
+        'audit log page': lambda: select(AuditLog)
+            .where(tuple_(AuditLog.created_at, AuditLog.id) < tuple_(now, 1000))
+            .order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).limit(11),
+        'appointment page': lambda: select(Appointment)
+            .where(tuple_(Appointment.scheduled_time, Appointment.id) < tuple_(now, 1000))
+            .order_by(Appointment.scheduled_time.desc(), Appointment.id.desc()).limit(11),
+        'user page': lambda: select(User)
+            .where(tuple_(User.created_at, User.id) > tuple_(now, 1000))
+            .order_by(User.created_at, User.id).limit(11),
+        'diet plan of a procedure and phase': lambda: select(DietPlan).where(
+            DietPlan.surgery_type_id == 1, DietPlan.phase == 'pre_op'),
+    }
+
+# SQLite reports a full table scan as "SCAN <table>" ("SCAN TABLE <table>" before 3.36)
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+$')
+
+def explain(session, statement) -> Tuple[List[str], List[str]]:
+    """
+    Plan of `statement` on the session's database: (plan lines, full scans).
+
+    The statement is compiled and bound by SQLAlchemy as usual; a cursor
+    hook runs EXPLAIN on exactly what would be sent. On PostgreSQL
+    sequential scans are disabled for the check, so one still chosen means
+    no index can serve the query (tiny tables are always seq-scanned
+    otherwise).
+    """
+    connection = session.connection()
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        prefix = 'EXPLAIN (FORMAT JSON) '
+    elif dialect == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        raise NotImplementedError(f'No plan check for {dialect}')
+
+    captured = []
+
+    def capture(conn, cursor, sql, parameters, context, executemany):
+        cursor.execute(prefix + sql, parameters)
+        captured.extend(cursor.fetchall())
+
+    event.listen(connection, 'before_cursor_execute', capture)
+    try:
+        session.execute(statement).fetchall()
+    finally:
+        event.remove(connection, 'before_cursor_execute', capture)
+        session.rollback()
+
+    if dialect == 'sqlite':
+        lines = [row[-1] for row in captured]
+        return lines, [line for line in lines if SQLITE_FULL_SCAN.match(line)]
+
+    plan = captured[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    lines, scans = [], []
+
+    def walk(node, depth):
+        line = node['Node Type'] + (f" on {node['Relation Name']}" if 'Relation Name' in node else '') + \
+            (f" using {node['Index Name']}" if 'Index Name' in node else '')
+        lines.append('  ' * depth + line)
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(line)
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    walk(plan[0]['Plan'], 0)
+    return lines, scans
+
+def check_query_plans(session) -> Dict[str, Tuple[List[str], List[str]]]:
+    """Plans of all hot queries: {name: (plan lines, full scans)}"""
+    return {name: explain(session, build()) for name, build in hot_queries().items()}
@@ -0,0 +1,288 @@
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel: schedule, cancel and expire in O(1).
+
+    Level 0 has one slot per tick; each higher level has slots as wide
+    as a whole turn of the level below (by default minutes, hours and
+    days, covering 64 days). An entry sits in the lowest level whose turn
+    reaches its due tick and moves down a level whenever the slot it is
+    in comes round, so advancing only ever touches the slots of the ticks
+    passed. Entries further out than one turn of the top level are
+    refused; the caller keeps them until they come into range.
+    """
+
+    def __init__(self, start: datetime, tick_seconds: int = 60, slots: Sequence[int] = (60, 24, 64)):
+        self.tick_seconds = tick_seconds
+        self.slots = tuple(slots)
+        self.spans = []
+        span = 1
+        for count in self.slots:
+            self.spans.append(span)
+            span *= count
+        self.range = span
+        self.wheels: List[List[Dict[Hashable, int]]] = [[{} for _ in range(count)] for count in self.slots]
+        self.current = self._tick(start)
+        self._where: Dict[Hashable, Optional[Tuple[int, int]]] = {}
+        self._ready: Dict[Hashable, int] = {}
+
+    def _tick(self, moment: datetime) -> int:
+        return int((moment - EPOCH).total_seconds() // self.tick_seconds)
+
+    @property
+    def horizon(self) -> datetime:
+        """Entries due before this can be scheduled"""
+        return EPOCH + timedelta(seconds=(self.current + self.range) * self.tick_seconds)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def schedule(self, key: Hashable, due: datetime) -> bool:
+        """(Re)schedule `key`; False, and not scheduled, if `due` is beyond the horizon"""
+        self.cancel(key)
+        tick = self._tick(due)
+        if tick - self.current >= self.range:
+            return False
+        self._place(key, tick)
+        return True
+
+    def cancel(self, key: Hashable) -> bool:
+        if key not in self._where:
+            return False
+        where = self._where.pop(key)
+        if where is None:
+            del self._ready[key]
+        else:
+            level, index = where
+            del self.wheels[level][index][key]
+        return True
+
+    def _place(self, key: Hashable, tick: int) -> None:
+        delta = tick - self.current
+        if delta <= 0:
+            self._ready[key] = tick
+            self._where[key] = None
+            return
+        for level, (span, count) in enumerate(zip(self.spans, self.slots)):
+            if delta < span * count:
+                index = (tick // span) % count
+                self.wheels[level][index][key] = tick
+                self._where[key] = (level, index)
+                return
+
+    def advance(self, now: datetime) -> List[Hashable]:
+        """Move the wheel to `now` and return the keys that fell due, earliest first"""
+        due = self._drain_ready()
+        target = self._tick(now)
+        while self.current < target:
+            self.current += 1
+            # Higher levels first: what they hand down may belong to a
+            # lower-level slot that comes round on this same tick
+            for level in range(len(self.slots) - 1, 0, -1):
+                span = self.spans[level]
+                if self.current % span == 0:
+                    bucket = self.wheels[level][(self.current // span) % self.slots[level]]
+                    if bucket:
+                        entries = list(bucket.items())
+                        bucket.clear()
+                        for key, tick in entries:
+                            self._place(key, tick)
+            bucket = self.wheels[0][self.current % self.slots[0]]
+            if bucket:
+                for key in bucket:
+                    del self._where[key]
+                due.extend(bucket)
+                bucket.clear()
+            due.extend(self._drain_ready())
+        return due
+
+    def _drain_ready(self) -> List[Hashable]:
+        if not self._ready:
+            return []
+        keys = sorted(self._ready, key=self._ready.get)
+        for key in keys:
+            del self._where[key]
+        self._ready.clear()
+        return keys
+
+class ReminderScheduler:
+    """
+    Sends each appointment's reminder once, `lead` before it starts.
+
+    Upcoming appointments are read once, streamed, into a timing wheel;
+    after that each poll only reads what is new:
+
+    - appointments whose updated_at is past the changes high-water mark
+      (new bookings, reschedules, cancellations), which are rescheduled
+      in or removed from the wheel;
+    - appointments that came within the wheel's horizon since the last
+      poll (the scheduled_time high-water mark).
+
+    Reminders are claimed with a conditional UPDATE of reminder_sent_at
+    committed together with their outbox emails, so a reminder is queued
+    exactly once, even if two schedulers run, and one that could not be
+    queued is not marked sent.
+    """
+
+    def __init__(self):
+        self.lead = timedelta(hours=24)
+        self.batch_size = 500
+        # updated_at is set at flush but visible at commit; rows committed
+        # this much later than their timestamp are still picked up
+        self.lookback = timedelta(seconds=60)
+        self.wheel: Optional[TimingWheel] = None
+        self.loaded_until: Optional[datetime] = None
+        self.changes_since: Optional[datetime] = None
+        self._stats = {'loaded': 0, 'changes': 0, 'sent': 0, 'skipped': 0, 'errors': 0}
+
+    def init_app(self, app):
+        self.lead = timedelta(hours=app.config['REMINDER_LEAD_HOURS'])
+        self.batch_size = app.config['REMINDER_BATCH_SIZE']
+
+    def start(self, session, now: Optional[datetime] = None) -> None:
+        """Fill the wheel with every upcoming appointment still waiting for its reminder"""
+        now = now or datetime.utcnow()
+        self.wheel = TimingWheel(now)
+        self.changes_since = now
+        self.loaded_until = now
+        self._load_window(session, now)
+
+    def poll(self, session, now: Optional[datetime] = None, send=None) -> int:
+        """
+        Apply changes, send the reminders due by `now`; returns how many were sent.
+
+        `send` takes the session and a list of appointments (user and
+        doctor loaded), adds their reminders to the session's transaction
+        without committing, and returns the appointments it queued; by
+        default queue_appointment_reminders().
+        """
+        now = now or datetime.utcnow()
+        if self.wheel is None:
+            self.start(session, now)
+        self._apply_changes(session, now)
+        due = self.wheel.advance(now)
+        self._load_window(session, now)
+        # Loading the new window may add reminders that are already due
+        due.extend(self.wheel.advance(now))
+
+        sent = 0
+        for offset in range(0, len(due), self.batch_size):
+            sent += self._send(session, due[offset:offset + self.batch_size], now, send)
+        return sent
+
+    def _load_window(self, session, now: datetime) -> None:
+        from models import Appointment
+
+        # [loaded_until, until): exactly what the wheel accepts now that it did not before
+        until = self.wheel.horizon + self.lead
+        rows = session.query(Appointment.id, Appointment.scheduled_time).filter(
+            Appointment.scheduled_time >= self.loaded_until,
+            Appointment.scheduled_time > now,
+            Appointment.scheduled_time < until,
+            Appointment.status != 'cancelled',
+            Appointment.reminder_sent_at.is_(None)
+        ).yield_per(self.batch_size)
+        loaded = 0
+        for appointment_id, scheduled_time in rows:
+            self.wheel.schedule(appointment_id, scheduled_time - self.lead)
+            loaded += 1
+        self.loaded_until = until
+        self._stats['loaded'] += loaded
+
+    def _apply_changes(self, session, now: datetime) -> None:
+        from models import Appointment
+
+        rows = session.query(Appointment.id, Appointment.scheduled_time, Appointment.status,
+                             Appointment.reminder_sent_at, Appointment.updated_at).filter(
+            Appointment.updated_at > self.changes_since - self.lookback
+        ).order_by(Appointment.updated_at).yield_per(self.batch_size)
+        changes = 0
+        for appointment_id, scheduled_time, status, reminder_sent_at, updated_at in rows:
+            if status == 'cancelled' or reminder_sent_at is not None or scheduled_time <= now:
+                self.wheel.cancel(appointment_id)
+            else:
+                # Moved beyond the horizon, it drops out and is loaded again with its window
+                self.wheel.schedule(appointment_id, scheduled_time - self.lead)
+            self.changes_since = max(self.changes_since, updated_at)
+            changes += 1
+        self._stats['changes'] += changes
+
+    def _send(self, session, appointment_ids: List[int], now: datetime, send=None) -> int:
+        from models import Appointment
+        from utils.helpers import queue_appointment_reminders
+        from utils.outbox import email_outbox
+
+        # A stand-in for the outbox has nothing to wake
+        wake = send is None
+        send = send or queue_appointment_reminders
+        try:
+            claimed = session.execute(
+                update(Appointment).where(
+                    Appointment.id.in_(appointment_ids),
+                    Appointment.reminder_sent_at.is_(None),
+                    Appointment.status != 'cancelled',
+                    Appointment.scheduled_time > now
+                ).values(reminder_sent_at=now).returning(Appointment.id)
+            ).scalars().all()
+            # Patients and doctors in the same query, not one lazy load per reminder
+            appointments = session.query(Appointment).options(
+                joinedload(Appointment.user), joinedload(Appointment.doctor)
+            ).filter(Appointment.id.in_(claimed)).all() if claimed else []
+            # Rendered and added to the outbox as one batch
+            queued = send(session, appointments) if appointments else []
+            unsent = set(claimed) - {appointment.id for appointment in queued}
+            if unsent:
+                # Not marked sent; the updated_at this bumps brings them back next poll
+                session.execute(update(Appointment).where(
+                    Appointment.id.in_(unsent)
+                ).values(reminder_sent_at=None))
+            # The claims and their emails commit together, or neither does
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self._stats['errors'] += 1
+            logger.error(f"Error sending reminders for appointments {appointment_ids}: {str(e)}")
+            # Nothing was claimed; try them again next poll
+            for appointment_id in appointment_ids:
+                self.wheel.schedule(appointment_id, now)
+            return 0
+
+        if queued and wake:
+            email_outbox.wake()
+        self._stats['skipped'] += len(appointment_ids) - len(claimed)
+        self._stats['errors'] += len(unsent)
+        self._stats['sent'] += len(queued)
+        return len(queued)
+
+    def run(self, session, interval: float) -> None:
+        """Poll every `interval` seconds until interrupted; `session` is a scoped session"""
+        while True:
+            try:
+                self.poll(session)
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error polling appointment reminders: {str(e)}")
+            finally:
+                # Nothing read in one poll should pin a snapshot or identity map until the next
+                session.remove()
+            time.sleep(interval)
+
+    def stats(self) -> dict:
+        return dict(self._stats, scheduled=len(self.wheel) if self.wheel is not None else 0,
+                    loaded_until=self.loaded_until.isoformat() if self.loaded_until else None)
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,234 @@
+import re
+import math
+import json
+import hashlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset((
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'at', 'for', 'with', 'is', 'are', 'be', 'am',
+    'i', 'me', 'my', 'we', 'you', 'your', 'it', 'its', 'this', 'that', 'do', 'does', 'can', 'could',
+    'should', 'will', 'would', 'what', 'which', 'how', 'when', 'there', 'any', 'have', 'has', 'still',
+    'ok', 'okay', 'as', 'if', 'so', 'about', 'get', 'im', 'after', 'before', 'during', 'from', 'up', 'out',
+    'tell', 'know', 'need', 'want', 'take', 'make', 'go', 'much', 'many', 'long', 'work', 'happen', 'happens',
+    'allowed', 'fine', 'good', 'bad', 'please', 'thanks', 'thank', 'like', 'look', 'plan', 'time', 'day',
+    'week', 'people', 'someone', 'normal', 'stay', 'offer', 'kind', 'type', 'weight', 'loss'
+))
+
+# Patients' words for things the guidelines name differently; matched in
+# addition to the word itself
+QUERY_SYNONYMS = {
+    'coffee': ('caffeine',),
+    'tea': ('caffeine',),
+    'espresso': ('caffeine',),
+    'soda': ('carbonated', 'sugary'),
+    'pop': ('carbonated',),
+    'fizzy': ('carbonated',),
+    'sparkling': ('carbonated',),
+    'beer': ('alcoholic',),
+    'wine': ('alcoholic',),
+    'alcohol': ('alcoholic',),
+    'drinking': ('drink', 'beverage'),
+    'juice': ('sugary',),
+    'milk': ('dairy',),
+    'cheese': ('dairy',),
+    'yogurt': ('dairy',),
+    'smoke': ('smoking',),
+    'cigarette': ('smoking',),
+    'vitamin': ('multivitamin', 'supplement'),
+    'walk': ('walking',),
+    'exercise': ('walking',),
+    'blood': ('aspirin',),
+}
+
+def _stem(token: str) -> str:
+    """Crude plural folding, enough for 'foods'/'food' and 'drinks'/'drink'"""
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def _label(text: str) -> str:
+    return text.replace('_', ' ')
+
+def knowledge_sources(surgery_types: Dict[str, Any], diet_phases: Dict[str, Any]) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Split the knowledge data into searchable (label, text) passages, grouped
+    by the record they come from: one source per surgery type and one per
+    diet plan. Phase overviews are only indexed for phases no procedure has
+    its own plan for.
+    """
+    sources = {}
+    planned_phases = set()
+    for key, info in surgery_types.items():
+        name = info['name']
+        passages = [(name, info['description'])] if info.get('description') else []
+        if info.get('recovery_time'):
+            passages.append((f'{name}, recovery time', str(info['recovery_time'])))
+        passages += [(f'{name}, requirements', item) for item in info.get('requirements') or []]
+        passages += [(f'{name}, risks', item) for item in info.get('risks') or []]
+        for field, when in (('preop_instructions', 'before surgery'), ('postop_instructions', 'after surgery')):
+            for period, items in (info.get(field) or {}).items():
+                passages += [(f'{name}, {when} ({_label(period)})', item) for item in items]
+        sources[f'surgery:{key}'] = passages
+
+        for phase, plan in (info.get('diet_plans') or {}).items():
+            planned_phases.add(phase)
+            sources[f'diet:{key}:{phase}'] = _diet_passages(f'{name}, {_label(phase)} diet', plan)
+
+    for phase, plan in diet_phases.items():
+        if phase not in planned_phases:
+            sources[f'phase:{phase}'] = _diet_passages(f'{_label(phase).title()} diet', plan)
+    return sources
+
+def _diet_passages(prefix: str, plan: Dict[str, Any]) -> List[Tuple[str, str]]:
+    if plan.get('duration'):
+        prefix = f"{prefix} ({plan['duration']})"
+    passages = []
+    for field in ('allowed_foods', 'restricted_foods', 'guidelines'):
+        passages += [(f'{prefix}, {_label(field)}', item) for item in plan.get(field) or []]
+    passages += [(f'{prefix}, supplements', f'{_label(name).title()}: {dose}')
+                 for name, dose in (plan.get('supplements') or {}).items()]
+    return passages
+
+class Segment:
+    """Inverted index over one source's passages"""
+    __slots__ = ('digest', 'passages', 'postings', 'lengths', 'labels')
+
+    def __init__(self, digest: str, passages: List[Tuple[str, str]]):
+        self.digest = digest
+        self.passages = passages
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths = []
+        self.labels = []
+        for doc, (label, text) in enumerate(passages):
+            tokens = tokenize(text)
+            self.lengths.append(len(tokens))
+            self.labels.append(frozenset(tokenize(label)))
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((doc, tf))
+
+def _digest(passages: List[Tuple[str, str]]) -> str:
+    return hashlib.sha1(json.dumps(passages).encode('utf-8')).hexdigest()
+
+class RetrievalIndex:
+    """
+    BM25 search over knowledge passages.
+
+    Each source (a surgery type or diet plan) is indexed as its own segment.
+    When the knowledge is reloaded, segments whose passages are unchanged
+    are reused from the previous index and only the changed ones are
+    re-tokenized; document frequencies are adjusted by the difference.
+    Passage text is scored; query words that also appear in a passage's
+    label (procedure, phase, section) boost it, so "coffee after bypass"
+    ranks the bypass diet plans first.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    LABEL_BOOST = 0.5
+    MIN_COVERAGE = 0.6
+
+    def __init__(self, sources: Dict[str, List[Tuple[str, str]]], previous: Optional['RetrievalIndex'] = None):
+        old_segments = previous.segments if previous else {}
+        self.df = Counter(previous.df) if previous else Counter()
+        # term -> {source: segment} for the segments containing it
+        self.postings = {term: dict(segments) for term, segments in previous.postings.items()} if previous else {}
+        self.segments: Dict[str, Segment] = {}
+        self.rebuilt = 0
+
+        for name, passages in sources.items():
+            digest = _digest(passages)
+            segment = old_segments.get(name)
+            if segment is None or segment.digest != digest:
+                segment = Segment(digest, passages)
+                self.rebuilt += 1
+            self.segments[name] = segment
+
+        for name, segment in old_segments.items():
+            if self.segments.get(name) is not segment:
+                self.df.subtract({term: len(postings) for term, postings in segment.postings.items()})
+                for term in segment.postings:
+                    del self.postings[term][name]
+        for name, segment in self.segments.items():
+            if old_segments.get(name) is not segment:
+                self.df.update({term: len(postings) for term, postings in segment.postings.items()})
+                for term in segment.postings:
+                    self.postings.setdefault(term, {})[name] = segment
+        self.df = +self.df  # Drop terms no passage contains any more
+        self.postings = {term: segments for term, segments in self.postings.items() if segments}
+
+        self.count = sum(len(segment.lengths) for segment in self.segments.values())
+        total = sum(sum(segment.lengths) for segment in self.segments.values())
+        self.avg_length = total / self.count if self.count else 0.0
+        # BM25 length normalisation per passage; depends on the average length, so per index
+        self.norms = {
+            name: [self.K1 * (1 - self.B + self.B * length / self.avg_length) for length in segment.lengths]
+            for name, segment in self.segments.items()
+        }
+
+    def _idf(self, term: str) -> float:
+        df = self.df.get(term, 0)
+        return math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 3, boost: Optional[str] = None) -> List[Tuple[float, str, str]]:
+        """
+        The k best (score, label, text) passages, one per distinct text.
+
+        Passages are found by the words of `query`; words of `boost` (the
+        query itself by default) only raise passages whose label has them.
+        A passage must match words (or their synonyms) carrying at least
+        MIN_COVERAGE of the query's idf weight, so one shared word such as
+        "hospital" in "is there parking at the hospital" is not an answer.
+        """
+        query_words = sorted(set(tokenize(query)))
+        words = set(tokenize(boost)) if boost is not None else set(query_words)
+        # Each query word is one bit; a term sets the bits of the words it stands for
+        masks = {}
+        for bit, word in enumerate(query_words):
+            for term in (word,) + QUERY_SYNONYMS.get(word, ()):
+                masks[term] = masks.get(term, 0) | 1 << bit
+        weights = [max(self._idf(term) for term in (word,) + QUERY_SYNONYMS.get(word, ()))
+                   for word in query_words]
+        required = self.MIN_COVERAGE * sum(weights)
+
+        scores, matched = {}, {}
+        for term, mask in masks.items():
+            segments = self.postings.get(term)
+            if not segments:
+                continue
+            weight = self._idf(term) * (self.K1 + 1)
+            for name, segment in segments.items():
+                norms = self.norms[name]
+                for doc, tf in segment.postings[term]:
+                    key = (name, doc)
+                    scores[key] = scores.get(key, 0.0) + weight * tf / (tf + norms[doc])
+                    matched[key] = matched.get(key, 0) | mask
+
+        covered = {}
+        results = []
+        for key, score in scores.items():
+            mask = matched[key]
+            if mask not in covered:
+                covered[mask] = sum(w for bit, w in enumerate(weights) if mask >> bit & 1) >= required
+            if not covered[mask]:
+                continue
+            name, doc = key
+            segment = self.segments[name]
+            score *= 1 + self.LABEL_BOOST * len(words & segment.labels[doc])
+            label, text = segment.passages[doc]
+            results.append((score, label, text))
+        results.sort(key=lambda result: result[0], reverse=True)
+
+        best, seen = [], set()
+        for result in results:
+            if result[2] not in seen:
+                seen.add(result[2])
+                best.append(result)
+                if len(best) == k:
+                    break
+        return best
@@ -0,0 +1,83 @@
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+def adjust_count(session, model: type, delta: int) -> None:
+    """
+    Add `delta` to the row count of `model` inside the caller's transaction.
+
+    Counts that have not been seeded yet are left alone; read_counts()
+    seeds them with an exact COUNT(*).
+    """
+    from models import RowCount
+
+    if delta:
+        session.execute(
+            update(RowCount).where(RowCount.name == model.__tablename__).values(value=RowCount.value + delta)
+        )
+
+def count_on_change(models: Iterable[type]) -> None:
+    """Keep the row counts of `models` current in every flush that adds or deletes one"""
+    models = tuple(models)
+
+    @event.listens_for(Session, 'after_flush')
+    def _count(session, flush_context):
+        for model in models:
+            delta = sum(isinstance(obj, model) for obj in session.new) - \
+                sum(isinstance(obj, model) for obj in session.deleted)
+            adjust_count(session, model, delta)
+
+def read_counts(session, models: Iterable[type]) -> Dict[str, int]:
+    """
+    Row counts by table name, in one query over the counter rows.
+
+    A table without a counter row yet is counted once and seeded; rows
+    committed while it is being seeded may be missed, which
+    reconcile_counts() corrects.
+    """
+    from models import RowCount
+
+    models = tuple(models)
+    names = [model.__tablename__ for model in models]
+    counts = dict(session.query(RowCount.name, RowCount.value).filter(RowCount.name.in_(names)).all())
+    missing = [model for model in models if model.__tablename__ not in counts]
+    if missing:
+        try:
+            for model in missing:
+                counts[model.__tablename__] = session.query(func.count()).select_from(model).scalar()
+                session.execute(insert(RowCount).values(name=model.__tablename__, value=counts[model.__tablename__]))
+            session.commit()
+        except IntegrityError:
+            # Another worker seeded it first
+            session.rollback()
+            return read_counts(session, models)
+    return counts
+
+def reconcile_counts(session, models: Iterable[type]) -> Dict[str, Tuple[Optional[int], int]]:
+    """
+    Recount `models` exactly and store the result; returns {table: (stored, actual)}.
+
+    The counter row is locked before counting, so inserts whose transactions
+    adjust it either committed before the count or wait and apply their
+    delta on top of it (on SQLite, writers are serialized anyway).
+    """
+    from models import RowCount
+
+    result = {}
+    for model in models:
+        name = model.__tablename__
+        row = session.query(RowCount).filter(RowCount.name == name).with_for_update().first()
+        actual = session.query(func.count()).select_from(model).scalar()
+        if row is None:
+            session.add(RowCount(name=name, value=actual))
+            result[name] = (None, actual)
+        else:
+            result[name] = (row.value, actual)
+            row.value = actual
+        session.commit()
+    return result
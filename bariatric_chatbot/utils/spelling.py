@@ -0,0 +1,100 @@
+import re
+from itertools import combinations
+from typing import Dict, Iterable, Optional, Set
+
+WORD_PATTERN = re.compile(r'[a-z]+')
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    """Every string obtained by deleting up to `distance` characters from `word`"""
+    variants = set()
+    for n in range(1, min(distance, len(word) - 1) + 1):
+        for positions in combinations(range(len(word)), n):
+            variants.add(''.join(c for i, c in enumerate(word) if i not in positions))
+    return variants
+
+def edit_distance(a: str, b: str) -> int:
+    """Optimal string alignment distance: insertions, deletions, substitutions, transpositions"""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+class SpellingCorrector:
+    """
+    Corrects misspelled words towards a fixed vocabulary (SymSpell-style).
+
+    Every vocabulary word is indexed under the strings left after deleting
+    up to two of its characters. A typo shares one of those deletion
+    variants with the words it is close to, so a lookup generates the typo's
+    own deletions and checks the index, instead of comparing it with every
+    word. Short words are left alone, since they are too easily one edit
+    away from an unrelated keyword ("most" / "cost"); words of
+    LONG_WORD_LENGTH letters or more may be two edits away. A correction is
+    only made when a single closest word exists. Results are cached per
+    token, so repeated words cost one dict lookup.
+    """
+
+    MIN_LENGTH = 5
+    LONG_WORD_LENGTH = 8
+    CACHE_SIZE = 4096
+
+    def __init__(self, words: Iterable[str]):
+        self.words = frozenset(word for word in words if WORD_PATTERN.fullmatch(word))
+        self._index: Dict[str, Set[str]] = {}
+        for word in self.words:
+            if len(word) < self.MIN_LENGTH - 1:
+                continue
+            for variant in _deletes(word, 2) | {word}:
+                self._index.setdefault(variant, set()).add(word)
+        self._cache: Dict[str, Optional[str]] = {}
+
+    def correct_word(self, token: str) -> Optional[str]:
+        """The vocabulary word a token is a typo of, or None"""
+        if token in self.words or len(token) < self.MIN_LENGTH:
+            return None
+        if token in self._cache:
+            return self._cache[token]
+
+        correction = None if self._is_inflection(token) else self._lookup(token)
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        self._cache[token] = correction
+        return correction
+
+    def _lookup(self, token: str) -> Optional[str]:
+        max_distance = 2 if len(token) >= self.LONG_WORD_LENGTH else 1
+        candidates = set()
+        for variant in _deletes(token, max_distance) | {token}:
+            candidates.update(self._index.get(variant, ()))
+
+        best, best_distance, tied = None, max_distance + 1, False
+        for word in candidates:
+            distance = edit_distance(token, word)
+            if distance < best_distance:
+                best, best_distance, tied = word, distance, False
+            elif distance == best_distance:
+                tied = True
+        return None if tied else best
+
+    def _is_inflection(self, token: str) -> bool:
+        """Plurals and singulars of vocabulary words are spelled fine ('risks', 'limit')"""
+        words = self.words
+        return ((token + 's' in words and not token.endswith('s')) or
+                (token.endswith('s') and (token[:-1] in words or
+                                          (token.endswith('es') and token[:-2] in words))))
+
+    def correct(self, message: str) -> str:
+        """Return a lowercased message with misspelled words replaced"""
+        corrections = {}
+        for token in WORD_PATTERN.findall(message):
+            correction = self.correct_word(token)
+            if correction:
+                corrections[token] = correction
+        if not corrections:
+            return message
+        return WORD_PATTERN.sub(lambda match: corrections.get(match.group(0), match.group(0)), message)
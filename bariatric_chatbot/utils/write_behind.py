@@ -0,0 +1,268 @@
+import os
+import glob
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import insert
+
+from utils.row_counts import adjust_count
+
+logger = logging.getLogger(__name__)
+
+class ChatHistoryWriter:
+    """
+    Bounded write-behind buffer for ChatHistory rows.
+
+    Requests enqueue rows and return immediately; a background thread
+    groups them and writes each group with one bulk insert once
+    CHAT_HISTORY_FLUSH_ROWS rows are waiting or CHAT_HISTORY_FLUSH_INTERVAL_MS
+    has passed. When the queue is full, new rows are dropped and counted
+    rather than blocking the request.
+
+    If a flush fails and CHAT_HISTORY_SPILL_PATH is set, the rows are
+    appended to that local file and replayed into the database after the
+    next successful flush; without a spill path they are dropped. The
+    buffer is drained on interpreter exit and by gunicorn's worker_exit hook.
+    """
+
+    # A worker's claimed spill file is left alone this long (seconds) unless the worker is gone
+    SPILL_CLAIM_LEASE = 300
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.flush_rows = 200
+        self.flush_interval = 0.25
+        self.spill_path = None
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self.counters = {'enqueued': 0, 'flushed': 0, 'dropped': 0, 'spilled': 0, 'replayed': 0,
+                         'quarantined': 0, 'failed_flushes': 0}
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['CHAT_HISTORY_WRITE_BEHIND']
+        self.flush_rows = app.config['CHAT_HISTORY_FLUSH_ROWS']
+        self.flush_interval = app.config['CHAT_HISTORY_FLUSH_INTERVAL_MS'] / 1000
+        self.spill_path = app.config['CHAT_HISTORY_SPILL_PATH'] or None
+        self._queue = queue.Queue(maxsize=app.config['CHAT_HISTORY_QUEUE_SIZE'])
+        atexit.register(self.shutdown)
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self.add_many([row])
+
+    def add_many(self, rows: List[Dict[str, Any]]) -> None:
+        """Queue ChatHistory rows (dicts of column values) for writing"""
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault('created_at', now)
+
+        if not self.enabled:
+            self._insert(rows)
+            return
+
+        self._ensure_running()
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+                self.counters['enqueued'] += 1
+            except queue.Full:
+                self.counters['dropped'] += 1
+                logger.warning("Chat history queue full, dropping row")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'queue_capacity': self._queue.maxsize if self._queue else 0,
+            'spill_pending': bool(self.spill_path and self._spill_files()),
+            **self.counters
+        }
+
+    def shutdown(self) -> None:
+        """Write everything still queued; called on worker exit"""
+        self._stopping = True
+        if self._queue is None:
+            return
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                break
+            self.flush(batch)
+
+    def _ensure_running(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='chat-history-writer', daemon=True)
+            thread.start()
+
+    def _take(self, block: bool = True) -> List[Dict[str, Any]]:
+        """Wait for a first row, then collect until the batch is full or the interval is up"""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval) if block else self._queue.get_nowait())
+        except queue.Empty:
+            return batch
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if block and remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stopping:
+            try:
+                batch = self._take()
+                if batch:
+                    self.flush(batch)
+            except Exception as e:
+                # The thread is never restarted in this process; it must outlive any one failure
+                logger.error(f"Error in chat history writer: {str(e)}")
+
+    def flush(self, rows: List[Dict[str, Any]]) -> None:
+        with self._flush_lock:
+            try:
+                self._insert(rows)
+                self.counters['flushed'] += len(rows)
+            except Exception as e:
+                self.counters['failed_flushes'] += 1
+                logger.error(f"Error flushing {len(rows)} chat history rows: {str(e)}")
+                self._spill(rows)
+                return
+
+            if self.spill_path:
+                self._replay_spill()
+
+    def _insert(self, rows: List[Dict[str, Any]]) -> None:
+        from models import db, ChatHistory
+
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(ChatHistory), rows)
+                # Bulk inserts bypass the ORM flush that keeps row counts
+                adjust_count(db.session, ChatHistory, len(rows))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    def _spill(self, rows: List[Dict[str, Any]]) -> None:
+        if not self.spill_path:
+            self.counters['dropped'] += len(rows)
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+            with open(self.spill_path, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps({**row, 'created_at': row['created_at'].isoformat()}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.counters['spilled'] += len(rows)
+        except OSError as e:
+            self.counters['dropped'] += len(rows)
+            logger.error(f"Error spilling chat history rows to {self.spill_path}: {str(e)}")
+
+    def _spill_files(self) -> List[str]:
+        return [path for path in [self.spill_path] + glob.glob(f'{self.spill_path}.*.replay')
+                if os.path.exists(path)]
+
+    def _claimable(self, path: str) -> bool:
+        """
+        Whether this worker may replay `path`: the spill file itself, its own
+        earlier claims, and claims of a worker that died or held them longer
+        than SPILL_CLAIM_LEASE. A live worker's claim is still being inserted.
+        """
+        if path == self.spill_path:
+            return True
+        try:
+            pid = int(path[len(self.spill_path) + 1:].split('.', 1)[0])
+        except ValueError:
+            return True
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        try:
+            return time.time() - os.path.getmtime(path) > self.SPILL_CLAIM_LEASE
+        except OSError:
+            return False
+
+    def _read_spill(self, path: str) -> List[Dict[str, Any]]:
+        """Rows of a spill file; lines that do not parse go to the .bad file instead"""
+        rows, bad = [], []
+        with open(path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    row['created_at'] = datetime.fromisoformat(row['created_at'])
+                    rows.append(row)
+                except (ValueError, TypeError, KeyError):
+                    # A line torn by a crash mid-write, most likely
+                    bad.append(line if line.endswith('\n') else line + '\n')
+        if bad:
+            with open(f'{self.spill_path}.bad', 'a') as f:
+                f.writelines(bad)
+            self.counters['quarantined'] += len(bad)
+            logger.warning(f"Moved {len(bad)} unreadable chat history spill lines to {self.spill_path}.bad")
+        return rows
+
+    def _replay_spill(self) -> None:
+        """Move spilled rows into the database now that it is reachable again"""
+        for path in self._spill_files():
+            if not self._claimable(path):
+                continue
+            # Renaming claims the file, so only one worker replays it
+            claimed = f'{self.spill_path}.{os.getpid()}.{time.time_ns()}.replay'
+            try:
+                os.rename(path, claimed)
+                # The lease runs from the claim, not from the last spill
+                os.utime(claimed)
+                rows = self._read_spill(claimed)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.error(f"Error reading chat history spill {claimed}: {str(e)}")
+                continue
+
+            try:
+                if rows:
+                    self._insert(rows)
+            except Exception as e:
+                # Leave the claimed file for the next successful flush to retry
+                logger.error(f"Error replaying chat history spill {claimed}: {str(e)}")
+                return
+            try:
+                os.remove(claimed)
+            except FileNotFoundError:
+                pass
+            self.counters['replayed'] += len(rows)
+            logger.info(f"Replayed {len(rows)} spilled chat history rows")
+
+chat_history_writer = ChatHistoryWriter()